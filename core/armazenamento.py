@@ -0,0 +1,41 @@
+from django.core.files.storage import default_storage
+
+TAMANHO_BLOCO_LEITURA = 64 * 1024
+
+
+def _objeto_s3(nome):
+    # No S3 (django-storages), o objeto do boto3; None nos outros storages
+    bucket = getattr(default_storage, 'bucket', None)
+    if bucket is None:
+        return None
+    return bucket.Object(default_storage._normalize_name(nome))
+
+
+def ler_em_blocos(nome, tamanho_bloco=TAMANHO_BLOCO_LEITURA):
+    """
+    Gera o conteúdo de um arquivo do storage em blocos de `tamanho_bloco`.
+
+    No S3 o corpo do GET é consumido direto da conexão: o `open()` do
+    django-storages baixaria o objeto inteiro para um arquivo temporário
+    (em memória, com a configuração padrão) antes do primeiro byte.
+    """
+    objeto = _objeto_s3(nome)
+    if objeto is not None:
+        corpo = objeto.get()['Body']
+        try:
+            yield from corpo.iter_chunks(tamanho_bloco)
+        finally:
+            corpo.close()
+        return
+    with default_storage.open(nome, 'rb') as arquivo:
+        yield from arquivo.chunks(tamanho_bloco)
+
+
+def ler_trecho(nome, inicio, tamanho):
+    """Lê `tamanho` bytes a partir de `inicio` (GET com Range no S3)."""
+    objeto = _objeto_s3(nome)
+    if objeto is not None:
+        return objeto.get(Range=f'bytes={inicio}-{inicio + tamanho - 1}')['Body'].read()
+    with default_storage.open(nome, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        return arquivo.read(tamanho)
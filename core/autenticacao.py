@@ -0,0 +1,52 @@
+"""
+Usuário logado em cache. Sem isso, toda requisição autenticada busca o
+auth_user no banco antes de chegar à view, além da sessão.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+def _chave(user_id):
+    return f'cadastro:autenticacao:{user_id}'
+
+
+def esquecer_usuarios(*user_ids):
+    """Tira usuários do cache de autenticação (ver core.signals)."""
+    cache.delete_many([_chave(user_id) for user_id in user_ids])
+
+
+class BackendComCache(ModelBackend):
+    """
+    ModelBackend cujo `get_user()` guarda o usuário em cache por
+    AUTH_USUARIO_CACHE_TIMEOUT segundos (0 desliga).
+
+    O cache é apagado sempre que o usuário é salvo ou excluído, então troca
+    de senha, desativação e mudança de is_superuser valem na hora nesta
+    instância. Com cache local (LocMemCache), as outras instâncias só veem a
+    mudança quando a entrada expira, por isso o tempo é curto. Permissões de
+    grupo não ficam no objeto e continuam vindo do banco.
+    """
+
+    def get_user(self, user_id):
+        if not settings.AUTH_USUARIO_CACHE_TIMEOUT:
+            return super().get_user(user_id)
+        usuario = cache.get(_chave(user_id))
+        if usuario is None:
+            usuario = User.objects.filter(pk=user_id).first()
+            if usuario is None:
+                return None
+            cache.set(_chave(user_id), usuario, settings.AUTH_USUARIO_CACHE_TIMEOUT)
+        return usuario if self.user_can_authenticate(usuario) else None
+
+    async def aget_user(self, user_id):
+        if not settings.AUTH_USUARIO_CACHE_TIMEOUT:
+            return await super().aget_user(user_id)
+        usuario = await cache.aget(_chave(user_id))
+        if usuario is None:
+            usuario = await User.objects.filter(pk=user_id).afirst()
+            if usuario is None:
+                return None
+            await cache.aset(_chave(user_id), usuario, settings.AUTH_USUARIO_CACHE_TIMEOUT)
+        return usuario if self.user_can_authenticate(usuario) else None
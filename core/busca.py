@@ -0,0 +1,80 @@
+import unicodedata
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import F, Func, Q, TextField
+from django.db.models.functions import Greatest, Lower
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais
+from .consultas import servidores, com_chaves_hierarquia
+
+# Termos mais curtos que isso não aproveitam os índices de trigramas
+TAMANHO_MINIMO_TERMO = 2
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+
+CAMPOS_PESSOAIS = ['nome_completo', 'cpf', 'email']
+CAMPOS_FUNCIONAIS = ['nome_guerra', 'matricula']
+
+
+class SemAcento(Func):
+    """
+    f_unaccent(): versão IMMUTABLE de unaccent(), criada na migração
+    core.0002_busca para poder ser usada nos índices GIN de trigramas.
+    """
+    function = 'f_unaccent'
+    output_field = TextField()
+
+
+def normalizada(campo):
+    """Expressão indexada: o campo em minúsculas e sem acentos."""
+    return SemAcento(Lower(campo))
+
+
+def normalizar_termo(termo):
+    termo = unicodedata.normalize('NFKD', termo.strip().lower())
+    return ''.join(c for c in termo if not unicodedata.combining(c))
+
+
+def _usuarios_com_termo(modelo, campos, termo):
+    # Um OR entre colunas da mesma tabela, cada uma com seu índice GIN:
+    # o PostgreSQL combina os índices com um BitmapOr.
+    anotacoes = {f'busca_{campo}': normalizada(campo) for campo in campos}
+    condicao = Q()
+    for nome in anotacoes:
+        condicao |= Q(**{f'{nome}__contains': termo})
+    return modelo.objects.annotate(**anotacoes).filter(condicao).values('usuario_id')
+
+
+def buscar_servidores(termo, limite=LIMITE_PADRAO):
+    """
+    Busca servidores por nome completo, nome de guerra, matrícula, CPF ou
+    e-mail, ignorando acentos e maiúsculas. Devolve no máximo `limite`
+    usuários, dos mais parecidos com o termo para os menos parecidos.
+    """
+    termo = normalizar_termo(termo)
+    if len(termo) < TAMANHO_MINIMO_TERMO:
+        return servidores().none()
+
+    # Cada tabela é filtrada separadamente para que os índices sejam usados;
+    # o join com os dados de exibição acontece só sobre os ids encontrados.
+    encontrados = (
+        Q(id__in=_usuarios_com_termo(InformacoesPessoais, CAMPOS_PESSOAIS, termo))
+        | Q(id__in=_usuarios_com_termo(InformacoesFuncionais, CAMPOS_FUNCIONAIS, termo))
+    )
+    similaridades = [
+        TrigramSimilarity(normalizada(f'info_pessoais__{campo}'), termo) for campo in CAMPOS_PESSOAIS
+    ] + [
+        TrigramSimilarity(normalizada(f'info_funcionais__{campo}'), termo) for campo in CAMPOS_FUNCIONAIS
+    ]
+
+    return com_chaves_hierarquia(
+        servidores().filter(encontrados).select_related('info_pessoais', 'info_funcionais')
+    ).annotate(
+        relevancia=Greatest(*similaridades)
+    ).order_by(
+        F('relevancia').desc(nulls_last=True),
+        F('posto_ordem').asc(nulls_last=True),
+        F('matricula_ordem').asc(nulls_last=True),
+        'id',
+    )[:limite]
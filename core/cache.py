@@ -0,0 +1,56 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .versoes import versao_atual, versao_usuario, versao_atual_async, versao_usuario_async
+
+
+def _chave(nome, versao, partes):
+    # As partes vêm da requisição (termo de busca, cursores): com espaços,
+    # acentos ou muito longas, o Memcached recusaria a chave. O hash tem
+    # tamanho fixo e só caracteres seguros.
+    if partes:
+        return f'cadastro:{nome}:{versao}:' + hashlib.sha256(repr(partes).encode()).hexdigest()
+    return f'cadastro:{nome}:{versao}'
+
+
+def em_cache(nome, calcular, *partes, usuario_id=None, timeout=None):
+    """
+    Devolve o resultado de `calcular()` guardado em cache.
+
+    A chave inclui a versão dos dados: a global, ou o usuário e a versão dele
+    quando `usuario_id` é informado. Os sinais de core.signals incrementam essas
+    versões a cada alteração, então um resultado antigo nunca é lido de novo.
+    Ele apenas expira. Ler a versão custa uma consulta por chave primária,
+    bem mais barata que as consultas que o cache evita.
+    """
+    if usuario_id is None:
+        versao = versao_atual()
+    else:
+        versao = f'u{usuario_id}.{versao_usuario(usuario_id)}'
+    chave = _chave(nome, versao, partes)
+
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = calcular()
+        cache.set(chave, resultado, timeout if timeout is not None else settings.CACHE_DADOS_TIMEOUT)
+    return resultado
+
+
+async def em_cache_async(nome, calcular, *partes, usuario_id=None, timeout=None):
+    """
+    Versão assíncrona de `em_cache`, com as mesmas chaves: `calcular` é uma
+    função assíncrona, e a versão e o cache são lidos sem bloquear o loop.
+    """
+    if usuario_id is None:
+        versao = await versao_atual_async()
+    else:
+        versao = f'u{usuario_id}.{await versao_usuario_async(usuario_id)}'
+    chave = _chave(nome, versao, partes)
+
+    resultado = await cache.aget(chave)
+    if resultado is None:
+        resultado = await calcular()
+        await cache.aset(chave, resultado, timeout if timeout is not None else settings.CACHE_DADOS_TIMEOUT)
+    return resultado
@@ -0,0 +1,217 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import CharField, DateField, F, IntegerField, Value
+
+from funcional.models import InformacoesFuncionais, Documento, matricula_ordem
+from familiar.models import Filho
+from .estatisticas import ajustar_estatisticas, valores_estatisticas
+from .paginacao import paginar_keyset
+from .versoes import registrar_alteracoes
+
+# Chaves da ordenação hierárquica (posto, matrícula, id), na ordem de prioridade.
+# Usadas também como cursor da paginação por keyset.
+CHAVES_HIERARQUIA = ['posto_ordem', 'matricula_ordem', 'id']
+
+
+# Chaves da listagem do painel, lida de InformacoesFuncionais: todas não
+# nulas e na ordem do índice funcional_listagem_idx, então cada página é um
+# único intervalo desse índice. Quem não tem matrícula vem primeiro no posto.
+CHAVES_LISTAGEM = ['posto_ordem', 'matricula_ordem', 'usuario_id']
+
+
+def servidores():
+    """Usuários comuns (não administradores) do sistema."""
+    return User.objects.filter(is_superuser=False)
+
+
+def com_chaves_hierarquia(queryset):
+    """
+    Anota as chaves da ordenação hierárquica em uma consulta de usuários.
+    Ambas vêm de colunas de InformacoesFuncionais cobertas pelo índice
+    (posto_ordem, matricula).
+    """
+    return queryset.annotate(
+        posto_ordem=F('info_funcionais__posto_ordem'),
+        matricula_ordem=F('info_funcionais__matricula'),
+    )
+
+
+def listagem_servidores():
+    """
+    Seções funcionais dos servidores, com o usuário e os dados pessoais, para
+    paginar por CHAVES_LISTAGEM. Todo servidor tem a seção: core.signals a
+    cria a cada save de um usuário comum, e usuários gravados sem sinais
+    (bulk_create, SQL, fixtures) ganham a sua com `completar_secoes_funcionais`.
+    """
+    return InformacoesFuncionais.objects.filter(usuario__is_superuser=False).annotate(
+        matricula_ordem=matricula_ordem(),
+    ).select_related('usuario', 'usuario__info_pessoais')
+
+
+def paginar_servidores(depois=None, antes=None):
+    """
+    Uma página do painel: os usuários, cada um já com `info_funcionais` e
+    `info_pessoais` carregados, na ordem hierárquica.
+    """
+    pagina = paginar_keyset(listagem_servidores(), CHAVES_LISTAGEM, depois=depois, antes=antes, nulas=False)
+    pagina.itens = [funcional.usuario for funcional in pagina.itens]
+    return pagina
+
+
+def ordenar_por_hierarquia(queryset):
+    """
+    Ordena usuários por posto/graduação e matrícula. É a ordenação comum
+    ao painel, às exportações e às APIs. Quem não tem informações
+    funcionais fica no final.
+    """
+    return com_chaves_hierarquia(queryset).order_by(
+        *[F(chave).asc(nulls_last=True) for chave in CHAVES_HIERARQUIA]
+    )
+
+
+def _guardar_prefetch(instancia, nome, objetos):
+    # Mesmo efeito de um prefetch_related: `instancia.<nome>.all()` passa a
+    # devolver `objetos` sem ir ao banco.
+    queryset = getattr(instancia, nome).all()
+    queryset._result_cache = objetos
+    queryset._prefetch_done = True
+    if not hasattr(instancia, '_prefetched_objects_cache'):
+        instancia._prefetched_objects_cache = {}
+    instancia._prefetched_objects_cache[nome] = queryset
+
+
+def _secao(usuario, nome):
+    try:
+        return getattr(usuario, nome)
+    except ObjectDoesNotExist:
+        return None
+
+
+def carregar_servidores(ids):
+    """
+    Carrega usuários com as três seções do cadastro e os documentos e filhos
+    em exatamente duas consultas, seja qual for a quantidade de ids:
+
+    1. usuário + informações pessoais, funcionais e familiares (joins);
+    2. documentos e filhos de todos eles juntos (UNION ALL).
+
+    Devolve os usuários na ordem de `ids`, ignorando os que não existem.
+    Depois disso, `usuario.info_funcionais.documentos.all()` e
+    `usuario.info_familiares.filhos.all()` não fazem novas consultas.
+    """
+    ids = list(ids)
+    usuarios = User.objects.select_related(
+        'info_pessoais', 'info_funcionais', 'info_familiares'
+    ).in_bulk(ids)
+
+    funcionais = {}
+    familiares = {}
+    for usuario in usuarios.values():
+        info_funcionais = _secao(usuario, 'info_funcionais')
+        if info_funcionais is not None:
+            funcionais[info_funcionais.pk] = (info_funcionais, [])
+        info_familiares = _secao(usuario, 'info_familiares')
+        if info_familiares is not None:
+            familiares[info_familiares.pk] = (info_familiares, [])
+
+    if funcionais or familiares:
+        # As duas tabelas de filhos vêm em uma só ida ao banco, com colunas alinhadas:
+        # (tipo, id, id do pai, nome, arquivo, data de nascimento, idade)
+        documentos = Documento.objects.filter(info_funcional_id__in=list(funcionais)).annotate(
+            tipo=Value('documento'),
+            data_nascimento=Value(None, output_field=DateField()),
+            idade=Value(None, output_field=IntegerField()),
+        ).values_list('tipo', 'id', 'info_funcional_id', 'nome_documento', 'arquivo', 'data_nascimento', 'idade')
+        filhos = Filho.objects.filter(info_familiar_id__in=list(familiares)).annotate(
+            tipo=Value('filho'),
+            arquivo=Value('', output_field=CharField()),
+        ).values_list('tipo', 'id', 'info_familiar_id', 'nome', 'arquivo', 'data_nascimento', 'idade')
+
+        for tipo, pk, pai, nome, arquivo, data_nascimento, idade in sorted(
+            documentos.union(filhos, all=True), key=lambda linha: linha[1]
+        ):
+            if tipo == 'documento':
+                info_funcionais, lista = funcionais[pai]
+                documento = Documento.from_db(
+                    'default', ['id', 'info_funcional_id', 'nome_documento', 'arquivo'],
+                    [pk, pai, nome, arquivo],
+                )
+                Documento.info_funcional.field.set_cached_value(documento, info_funcionais)
+                lista.append(documento)
+            else:
+                info_familiares, lista = familiares[pai]
+                filho = Filho.from_db(
+                    'default', ['id', 'info_familiar_id', 'nome', 'data_nascimento', 'idade'],
+                    [pk, pai, nome, data_nascimento, idade],
+                )
+                Filho.info_familiar.field.set_cached_value(filho, info_familiares)
+                lista.append(filho)
+
+    for info_funcionais, lista in funcionais.values():
+        _guardar_prefetch(info_funcionais, 'documentos', lista)
+    for info_familiares, lista in familiares.values():
+        _guardar_prefetch(info_familiares, 'filhos', lista)
+
+    return [usuarios[pk] for pk in ids if pk in usuarios]
+
+
+def montar_servidor(usuario, documentos, filhos):
+    """
+    Liga a um usuário (já com as três seções via select_related) os
+    documentos e filhos buscados à parte, com o mesmo resultado de
+    `carregar_servidores`. Usado quando as consultas correm em paralelo.
+    """
+    info_funcionais = _secao(usuario, 'info_funcionais')
+    if info_funcionais is not None:
+        for documento in documentos:
+            Documento.info_funcional.field.set_cached_value(documento, info_funcionais)
+        _guardar_prefetch(info_funcionais, 'documentos', list(documentos))
+    info_familiares = _secao(usuario, 'info_familiares')
+    if info_familiares is not None:
+        for filho in filhos:
+            Filho.info_familiar.field.set_cached_value(filho, info_familiares)
+        _guardar_prefetch(info_familiares, 'filhos', list(filhos))
+    return usuario
+
+
+def carregar_servidor(usuario_id):
+    """
+    Carrega um único usuário com todo o cadastro (ver `carregar_servidores`).
+    Levanta User.DoesNotExist se ele não existir.
+    """
+    carregados = carregar_servidores([usuario_id])
+    if not carregados:
+        raise User.DoesNotExist(f'Usuário {usuario_id} não encontrado.')
+    return carregados[0]
+
+
+def secoes_servidor(usuario):
+    """
+    Devolve (info_pessoais, info_funcionais, info_familiares) de um usuário
+    carregado, com None nas seções que ainda não foram preenchidas.
+    """
+    return (
+        _secao(usuario, 'info_pessoais'),
+        _secao(usuario, 'info_funcionais'),
+        _secao(usuario, 'info_familiares'),
+    )
+
+
+def completar_secoes_funcionais():
+    """
+    Cria a seção funcional vazia dos servidores que não a têm, sem os quais
+    eles não aparecem no painel. Devolve quantas foram criadas.
+    """
+    sem_secao = servidores().filter(info_funcionais__isnull=True).values_list('pk', flat=True)
+    criadas = InformacoesFuncionais.objects.bulk_create(
+        [InformacoesFuncionais(usuario_id=pk) for pk in sem_secao.iterator()], batch_size=1000,
+    )
+    if criadas:
+        # bulk_create não dispara os sinais de estatísticas e de versão
+        ajustar_estatisticas(Counter(
+            chave for secao in criadas for chave in valores_estatisticas(InformacoesFuncionais, secao)
+        ))
+        registrar_alteracoes(secao.usuario_id for secao in criadas)
+    return len(criadas)
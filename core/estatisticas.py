@@ -0,0 +1,169 @@
+"""
+Estatísticas do efetivo: servidores por posto/graduação, faixa etária,
+estado civil e escolaridade, e o total de dependentes. Ficam na tabela
+Estatistica, então a página lê algumas dezenas de linhas seja qual for o
+número de servidores.
+
+Os sinais de core.signals ajustam as contagens a cada save/delete (+1 no
+valor novo, -1 no antigo). O que grava em lote sem disparar sinais
+(importação, dados sintéticos, recálculo das idades) chama
+`recalcular_estatisticas`, que refaz a tabela com um GROUP BY por modelo.
+"""
+from collections import Counter
+
+from django.apps import apps as apps_instalados
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Value, When
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais
+from .models import Estatistica
+
+# Modelo -> {dimensão: campo contado}. A faixa etária vem da idade gravada
+# (atualizada todo dia por recalcular_idades); dependentes só contam linhas.
+DIMENSOES = {
+    'funcional.InformacoesFuncionais': {'posto_graduacao': 'posto_graduacao'},
+    'pessoal.InformacoesPessoais': {'faixa_etaria': 'idade', 'estado_civil': 'estado_civil',
+                                    'escolaridade': 'escolaridade'},
+    'familiar.Filho': {'dependentes': None},
+}
+
+# (valor, rótulo, idade máxima)
+FAIXAS_ETARIAS = [
+    ('ate_24', 'Até 24 anos', 24),
+    ('25_34', '25 a 34 anos', 34),
+    ('35_44', '35 a 44 anos', 44),
+    ('45_54', '45 a 54 anos', 54),
+    ('55_mais', '55 anos ou mais', None),
+]
+
+
+def faixa_etaria(idade):
+    if idade is None:
+        return ''
+    for valor, _, maxima in FAIXAS_ETARIAS:
+        if maxima is None or idade <= maxima:
+            return valor
+
+
+def _faixa_etaria_sql(campo):
+    # Mesmo resultado de `faixa_etaria`, calculado no banco
+    return Case(
+        *[When(**{f'{campo}__lte': maxima}, then=Value(valor)) for valor, _, maxima in FAIXAS_ETARIAS if maxima],
+        When(**{f'{campo}__isnull': False}, then=Value(FAIXAS_ETARIAS[-1][0])),
+        default=Value(''),
+        output_field=CharField(),
+    )
+
+
+def _valor(dimensao, valor_campo):
+    if dimensao == 'faixa_etaria':
+        return faixa_etaria(valor_campo)
+    return valor_campo or ''
+
+
+def _expressao(dimensao, campo):
+    if campo is None:
+        return Value('', output_field=CharField())
+    if dimensao == 'faixa_etaria':
+        return _faixa_etaria_sql(campo)
+    return F(campo)
+
+
+def campos_estatisticas(modelo):
+    """Campos de `modelo` que alguma dimensão conta (vazio se nenhum)."""
+    return [campo for campo in DIMENSOES.get(modelo._meta.label, {}).values() if campo]
+
+
+def valores_estatisticas(modelo, dados):
+    """
+    Chaves (dimensão, valor) em que um registro entra. `dados` é a instância
+    ou um dicionário com os campos de `campos_estatisticas`.
+    """
+    ler = dados.get if isinstance(dados, dict) else lambda campo: getattr(dados, campo)
+    return [
+        (dimensao, _valor(dimensao, ler(campo)) if campo else '')
+        for dimensao, campo in DIMENSOES.get(modelo._meta.label, {}).items()
+    ]
+
+
+def ajustar_estatisticas(variacoes):
+    """Soma `variacoes` ({(dimensão, valor): delta}) às contagens gravadas."""
+    # Sempre na mesma ordem: duas transações que ajustam as mesmas linhas
+    # travam uma de cada vez, sem deadlock
+    for (dimensao, valor), delta in sorted(variacoes.items()):
+        if not delta:
+            continue
+        linhas = Estatistica.objects.filter(dimensao=dimensao, valor=valor)
+        if linhas.update(quantidade=F('quantidade') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                Estatistica.objects.create(dimensao=dimensao, valor=valor, quantidade=delta)
+        except IntegrityError:
+            # Outra requisição criou a linha ao mesmo tempo
+            linhas.update(quantidade=F('quantidade') + delta)
+
+
+def contar_estatisticas(apps=apps_instalados):
+    """
+    Contagens calculadas das tabelas de origem, sem gravar nada: um
+    GROUP BY por modelo. `apps` permite o uso dentro de migrações.
+    """
+    contagens = Counter()
+    for rotulo, dimensoes in DIMENSOES.items():
+        modelo = apps.get_model(rotulo)
+        apelidos = {f'd_{dimensao}': _expressao(dimensao, campo) for dimensao, campo in dimensoes.items()}
+        for linha in modelo._default_manager.values(**apelidos).annotate(quantidade=Count('pk')).order_by():
+            for dimensao in dimensoes:
+                contagens[dimensao, linha[f'd_{dimensao}'] or ''] += linha['quantidade']
+    return contagens
+
+
+def recalcular_estatisticas(apps=apps_instalados):
+    """Refaz a tabela Estatistica a partir das contagens. Devolve as contagens."""
+    modelo = apps.get_model('core', 'Estatistica')
+    contagens = contar_estatisticas(apps)
+    with transaction.atomic():
+        modelo._default_manager.all().delete()
+        modelo._default_manager.bulk_create([
+            modelo(dimensao=dimensao, valor=valor, quantidade=quantidade)
+            for (dimensao, valor), quantidade in contagens.items()
+        ])
+    return contagens
+
+
+def _distribuicao(contagens, dimensao, opcoes, sem_valor):
+    linhas = [(rotulo, contagens.get((dimensao, valor), 0)) for valor, rotulo in opcoes]
+    linhas.append((sem_valor, contagens.get((dimensao, ''), 0)))
+    total = sum(quantidade for _, quantidade in linhas)
+    return [
+        {'rotulo': rotulo, 'quantidade': quantidade, 'percentual': 100 * quantidade / total if total else 0}
+        for rotulo, quantidade in linhas
+    ]
+
+
+def resumo_estatisticas():
+    """Dados da página de estatísticas, lidos só da tabela Estatistica."""
+    contagens = {
+        (dimensao, valor): quantidade
+        for dimensao, valor, quantidade in Estatistica.objects.values_list('dimensao', 'valor', 'quantidade')
+    }
+    postos = _distribuicao(contagens, 'posto_graduacao', InformacoesFuncionais.POSTO_CHOICES, 'Sem posto informado')
+    total_servidores = sum(linha['quantidade'] for linha in postos)
+    dependentes = contagens.get(('dependentes', ''), 0)
+    return {
+        'total_servidores': total_servidores,
+        'total_dependentes': dependentes,
+        'media_dependentes': dependentes / total_servidores if total_servidores else 0,
+        'postos': postos,
+        'faixas_etarias': _distribuicao(
+            contagens, 'faixa_etaria', [(valor, rotulo) for valor, rotulo, _ in FAIXAS_ETARIAS], 'Não informada',
+        ),
+        'estado_civil': _distribuicao(
+            contagens, 'estado_civil', InformacoesPessoais.ESTADO_CIVIL_CHOICES, 'Não informado',
+        ),
+        'escolaridade': _distribuicao(
+            contagens, 'escolaridade', InformacoesPessoais.ESCOLARIDADE_CHOICES, 'Não informada',
+        ),
+    }
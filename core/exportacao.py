@@ -0,0 +1,435 @@
+import csv
+import json
+import posixpath
+import tempfile
+import zipfile
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais, Documento
+from familiar.models import InformacoesFamiliares, Filho
+from .consultas import servidores, ordenar_por_hierarquia, carregar_servidores, CHAVES_HIERARQUIA
+from .paginacao import cursor_no_servidor, percorrer_keyset
+from .armazenamento import ler_em_blocos
+
+# Quantidade de usuários buscados por vez no banco durante a exportação.
+# Mantém o uso de memória constante, independente do número de cadastros.
+TAMANHO_LOTE_EXPORTACAO = 200
+
+# Tamanho dos blocos enviados ao cliente ao transmitir o arquivo gerado.
+TAMANHO_BLOCO_RESPOSTA = 64 * 1024
+
+
+def usuarios_para_exportacao():
+    """
+    Retorna a consulta com os usuários exportados, na ordem da exportação.
+    """
+    return ordenar_por_hierarquia(servidores())
+
+
+def usuarios_em_lotes(usuarios, tamanho=TAMANHO_LOTE_EXPORTACAO):
+    """
+    Percorre `usuarios` em lotes, carregando cada lote completo (seções,
+    documentos e filhos) em duas consultas com `carregar_servidores`.
+    """
+    lote = []
+    for usuario_id in usuarios.values_list('id', flat=True).iterator(chunk_size=tamanho):
+        lote.append(usuario_id)
+        if len(lote) >= tamanho:
+            yield from carregar_servidores(lote)
+            lote = []
+    if lote:
+        yield from carregar_servidores(lote)
+
+
+def _formatar_valor(valor):
+    # Formata datas para um formato legível, se for um objeto date/datetime
+    if hasattr(valor, 'strftime'):
+        valor = valor.strftime('%d/%m/%Y')
+    return str(valor) if valor is not None else ""
+
+
+def linhas_ficha_usuario(usuario):
+    """
+    Gera as linhas (Seção, Campo, Valor) da ficha de um usuário.
+    """
+    # --- Informações Pessoais ---
+    try:
+        p = usuario.info_pessoais
+        yield "Pessoal", "Nome Completo", p.nome_completo
+        yield "Pessoal", "CPF", p.cpf
+        yield "Pessoal", "RG", p.rg
+        yield "Pessoal", "Email", p.email
+        yield "Pessoal", "Data de Nascimento", p.data_nascimento
+        yield "Pessoal", "Idade", p.idade
+        yield "Pessoal", "Telefone", p.telefone
+        yield "Pessoal", "Grupo Sanguíneo", p.grupo_sanguineo
+        yield "Pessoal", "Estado Civil", p.get_estado_civil_display()
+        yield "Pessoal", "Escolaridade", p.get_escolaridade_display()
+        yield "Pessoal", "Nº CNH", p.cnh_numero
+        yield "Pessoal", "Categoria CNH", p.cnh_categoria
+        yield "Pessoal", "Validade CNH", p.cnh_validade
+        yield "Pessoal", "Título de Eleitor", p.titulo_eleitor
+        yield "Pessoal", "Zona Eleitoral", p.zona
+        yield "Pessoal", "Seção Eleitoral", p.secao
+        yield "Pessoal", "Município de Votação", p.municipio_votacao
+    except InformacoesPessoais.DoesNotExist:
+        yield "Pessoal", "Status", "Não cadastrado"
+
+    # --- Informações Funcionais ---
+    try:
+        f = usuario.info_funcionais
+        yield "Funcional", "Nome de Guerra", f.nome_guerra
+        yield "Funcional", "Posto/Graduação", f.get_posto_graduacao_display()
+        yield "Funcional", "Matrícula", f.matricula
+        yield "Funcional", "Data de Admissão", f.data_admissao
+        yield "Funcional", "Banco", f.banco
+        yield "Funcional", "Agência", f.agencia
+        yield "Funcional", "Conta Corrente", f.conta_corrente
+    except InformacoesFuncionais.DoesNotExist:
+        yield "Funcional", "Status", "Não cadastrado"
+
+    # --- Informações Familiares ---
+    try:
+        fam = usuario.info_familiares
+        yield "Familiar", "Endereço", f"{fam.endereco}, {fam.numero_casa} - {fam.bairro}"
+        yield "Familiar", "Complemento", fam.complemento
+        yield "Familiar", "Cidade", fam.cidade
+        yield "Familiar", "CEP", fam.cep
+        yield "Familiar", "Nome do Cônjuge", fam.conjuge_nome
+        yield "Familiar", "Data Nasc. Cônjuge", fam.conjuge_data_nascimento
+
+        # --- Filhos ---
+        # Usa a lista já carregada com o lote, sem consultas extras.
+        filhos = list(fam.filhos.all())
+        if filhos:
+            for i, filho in enumerate(filhos):
+                yield "Filhos", f"Filho(a) {i+1} - Nome", filho.nome
+                yield "Filhos", f"Filho(a) {i+1} - Data Nasc.", filho.data_nascimento
+        else:
+            yield "Filhos", "Status", "Nenhum filho cadastrado"
+
+    except InformacoesFamiliares.DoesNotExist:
+        yield "Familiar", "Status", "Não cadastrado"
+
+
+def gerar_planilha_excel(destino, usuarios=None, ao_progredir=None):
+    """
+    Escreve a planilha de cadastros (uma aba por usuário) em `destino`.
+
+    Usa o modo write-only do openpyxl: cada aba é gravada em disco assim que
+    termina de ser preenchida, e os usuários são lidos do banco em lotes.
+    Dessa forma o pico de memória não cresce com o número de cadastros.
+
+    Se `ao_progredir` for informado, é chamado com (processados, total) a
+    cada lote concluído.
+    """
+    # O openpyxl leva uns 100 ms para carregar: fica fora da partida do
+    # processo e entra só na primeira exportação
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    if usuarios is None:
+        usuarios = usuarios_para_exportacao()
+    total = usuarios.count() if ao_progredir else 0
+
+    workbook = openpyxl.Workbook(write_only=True)
+    header_font = Font(bold=True)
+
+    for processados, usuario in enumerate(usuarios_em_lotes(usuarios), 1):
+        # Garante que o nome da planilha seja válido
+        sheet_title = ''.join(filter(str.isalnum, usuario.username))[:31]
+        sheet = workbook.create_sheet(title=sheet_title)
+
+        # Ajustar largura das colunas (precisa ser feito antes das linhas)
+        sheet.column_dimensions['A'].width = 15
+        sheet.column_dimensions['B'].width = 30
+        sheet.column_dimensions['C'].width = 40
+
+        cabecalho = []
+        for titulo in ("Seção", "Campo", "Valor"):
+            cell = WriteOnlyCell(sheet, value=titulo)
+            cell.font = header_font
+            cabecalho.append(cell)
+        sheet.append(cabecalho)
+
+        for secao, campo, valor in linhas_ficha_usuario(usuario):
+            sheet.append([secao, campo, _formatar_valor(valor)])
+
+        # Fecha a aba para liberar o arquivo temporário antes da próxima
+        sheet.close()
+
+        if ao_progredir and processados % TAMANHO_LOTE_EXPORTACAO == 0:
+            ao_progredir(processados, total)
+
+    workbook.save(destino)
+
+
+def planilha_excel_temporaria(usuarios=None, ao_progredir=None):
+    """
+    Gera a planilha em um arquivo temporário e o devolve posicionado no
+    início, pronto para ser transmitido. O arquivo é apagado ao ser fechado.
+    """
+    arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        gerar_planilha_excel(arquivo, usuarios, ao_progredir)
+        arquivo.seek(0)
+    except Exception:
+        arquivo.close()
+        raise
+    return arquivo
+
+
+# --- Exportação plana (uma linha por servidor) ---
+
+# Linhas lidas por vez do cursor no servidor do banco de dados.
+TAMANHO_LOTE_PLANO = 2000
+
+
+def _colunas_planas():
+    """
+    Monta a lista de colunas (cabeçalho, campo da consulta, choices) com todos
+    os campos das três seções do cadastro, seguidos das contagens agregadas.
+    """
+    colunas = [('ID', 'id', None), ('Usuário', 'username', None)]
+    secoes = [
+        ('info_pessoais', InformacoesPessoais),
+        ('info_funcionais', InformacoesFuncionais),
+        ('info_familiares', InformacoesFamiliares),
+    ]
+    for relacao, modelo in secoes:
+        for field in modelo._meta.concrete_fields:
+            if field.primary_key or field.name in ('usuario', 'posto_ordem', 'foto_derivados'):
+                continue
+            choices = dict(field.choices) if field.choices else None
+            colunas.append((str(field.verbose_name), f'{relacao}__{field.name}', choices))
+    colunas.append(('Qtd. Filhos', 'qtd_filhos', None))
+    colunas.append(('Qtd. Documentos', 'qtd_documentos', None))
+    return colunas
+
+
+COLUNAS_PLANAS = _colunas_planas()
+
+
+def _contagem(modelo, relacao_usuario):
+    # Subconsulta correlacionada: evita o GROUP BY sobre os joins de filhos e documentos
+    subquery = modelo.objects.filter(**{relacao_usuario: OuterRef('pk')}).order_by().values(
+        relacao_usuario
+    ).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+def linhas_planas():
+    """
+    Gera uma tupla de valores por servidor, na ordem de COLUNAS_PLANAS.
+
+    No PostgreSQL, `.iterator(chunk_size=...)` usa um cursor no servidor e
+    busca as linhas em lotes de tamanho fixo, então a memória fica constante
+    e a primeira linha sai assim que o banco começa a responder. Atrás do
+    PgBouncer em modo transação não há cursor no servidor: os lotes são
+    buscados por keyset, um SELECT por lote, com o mesmo efeito na memória.
+    """
+    campos = [campo for _, campo, _ in COLUNAS_PLANAS]
+    consulta = ordenar_por_hierarquia(servidores()).annotate(
+        qtd_filhos=_contagem(Filho, 'info_familiar__usuario'),
+        qtd_documentos=_contagem(Documento, 'info_funcional__usuario'),
+    )
+    if cursor_no_servidor(consulta):
+        linhas = consulta.values_list(*campos).iterator(chunk_size=TAMANHO_LOTE_PLANO)
+    else:
+        # As chaves da ordenação vão no fim de cada linha, para achar o próximo lote
+        linhas = percorrer_keyset(
+            consulta.values_list(*campos, *CHAVES_HIERARQUIA), CHAVES_HIERARQUIA, TAMANHO_LOTE_PLANO,
+            valores_de=lambda linha: linha[len(campos):],
+        )
+
+    for linha in linhas:
+        yield tuple(
+            choices.get(valor, valor) if choices else valor
+            for valor, (_, _, choices) in zip(linha, COLUNAS_PLANAS)
+        )
+
+
+def _valor_plano(valor):
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+
+class _Eco:
+    """Pseudo-buffer: o csv.writer escreve e recebemos a linha de volta."""
+
+    def write(self, valor):
+        return valor
+
+
+def csv_em_blocos(cabecalho, linhas, tamanho=TAMANHO_LOTE_PLANO):
+    """
+    Gera um CSV em blocos de texto, um por lote de `tamanho` linhas.
+    """
+    writer = csv.writer(_Eco())
+    # BOM para que o Excel reconheça o arquivo como UTF-8
+    yield '\ufeff' + writer.writerow(cabecalho)
+
+    bloco = []
+    for linha in linhas:
+        bloco.append(writer.writerow(['' if v is None else _valor_plano(v) for v in linha]))
+        if len(bloco) >= tamanho:
+            yield ''.join(bloco)
+            bloco = []
+    if bloco:
+        yield ''.join(bloco)
+
+
+def gerar_csv():
+    return csv_em_blocos([titulo for titulo, _, _ in COLUNAS_PLANAS], linhas_planas())
+
+
+def gerar_jsonl():
+    """
+    Gera um objeto JSON por linha, usando os nomes dos campos como chaves.
+    """
+    chaves = [campo.split('__')[-1] for _, campo, _ in COLUNAS_PLANAS]
+
+    bloco = []
+    for linha in linhas_planas():
+        registro = dict(zip(chaves, (_valor_plano(v) for v in linha)))
+        bloco.append(json.dumps(registro, ensure_ascii=False) + '\n')
+        if len(bloco) >= TAMANHO_LOTE_PLANO:
+            yield ''.join(bloco)
+            bloco = []
+    if bloco:
+        yield ''.join(bloco)
+
+
+FORMATOS_PLANOS = {
+    'csv': (gerar_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (gerar_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+# --- ZIP dos documentos ---
+
+class _BufferZip:
+    """
+    Destino não posicionável para o zipfile: acumula o que é escrito até o
+    gerador recolher. Sem seek(), o zipfile grava o tamanho e o CRC de cada
+    arquivo depois dos dados, então nada precisa ser lido duas vezes.
+    """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def recolher(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def _nome_seguro(texto):
+    """
+    Um componente de caminho dentro do ZIP: sem barras e sem pontos no
+    começo, para que nenhum nome ('..', '.oculto') saia da pasta ou suma.
+    """
+    nome = ' '.join(str(texto).replace('/', '-').replace('\\', '-').split()).lstrip('.').strip()
+    return nome or 'sem nome'
+
+
+# Ordem dos documentos no ZIP: por servidor, na ordem hierárquica
+CHAVES_DOCUMENTOS = ['posto_ordem', 'matricula_ordem', 'usuario_ordem', 'id']
+CAMPOS_DOCUMENTOS = [
+    'info_funcional__usuario__username', 'info_funcional__matricula',
+    'info_funcional__nome_guerra', 'nome_documento', 'arquivo',
+]
+
+
+def documentos_para_zip(usuarios=None):
+    """
+    Documentos dos `usuarios` (todos os servidores, se None), com as chaves
+    de CHAVES_DOCUMENTOS anotadas, ainda sem ordem.
+    """
+    usuarios = ordenar_por_hierarquia(usuarios if usuarios is not None else servidores())
+    return Documento.objects.filter(
+        info_funcional__usuario__in=usuarios.values('id')
+    ).annotate(
+        posto_ordem=F('info_funcional__posto_ordem'),
+        matricula_ordem=F('info_funcional__matricula'),
+        usuario_ordem=F('info_funcional__usuario_id'),
+    )
+
+
+def _linhas_documentos(usuarios):
+    # Como em linhas_planas: cursor no servidor quando há, senão keyset
+    consulta = documentos_para_zip(usuarios)
+    if cursor_no_servidor(consulta):
+        ordem = [F(chave).asc(nulls_last=True) for chave in CHAVES_DOCUMENTOS]
+        return consulta.order_by(*ordem).values_list(*CAMPOS_DOCUMENTOS).iterator(
+            chunk_size=TAMANHO_LOTE_EXPORTACAO
+        )
+    linhas = percorrer_keyset(
+        consulta.values_list(*CAMPOS_DOCUMENTOS, *CHAVES_DOCUMENTOS), CHAVES_DOCUMENTOS, TAMANHO_LOTE_EXPORTACAO,
+        valores_de=lambda linha: linha[len(CAMPOS_DOCUMENTOS):],
+    )
+    return (linha[:len(CAMPOS_DOCUMENTOS)] for linha in linhas)
+
+
+def gerar_zip_documentos(usuarios=None):
+    """
+    Gera um ZIP com os documentos dos usuários, em blocos de bytes, à medida
+    que cada arquivo é lido do storage. Uma pasta por servidor.
+
+    A memória usada não depende do tamanho do ZIP: os documentos são lidos
+    do banco em lotes (cursor no servidor ou keyset) e cada arquivo passa em blocos do storage para a
+    resposta. Os arquivos vão sem compressão (PDFs e imagens já são
+    comprimidos), o que também poupa CPU. Arquivos ausentes no storage são
+    listados em LEIA-ME-ERROS.txt no final.
+    """
+    buffer = _BufferZip()
+    ausentes = []
+    nomes_usados = set()
+    agora = timezone.localtime().timetuple()[:6]
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as arquivo_zip:
+        for username, matricula, nome_guerra, nome_documento, arquivo in _linhas_documentos(usuarios):
+            pasta = _nome_seguro(' - '.join(filter(None, [matricula, nome_guerra])) or username)
+            extensao = posixpath.splitext(arquivo)[1]
+            base = posixpath.join(pasta, _nome_seguro(nome_documento))
+            nome, contador = f'{base}{extensao}', 1
+            while nome in nomes_usados:
+                contador += 1
+                nome = f'{base} ({contador}){extensao}'
+
+            info = zipfile.ZipInfo(nome, date_time=agora)
+            try:
+                blocos = ler_em_blocos(arquivo, TAMANHO_BLOCO_RESPOSTA)
+                primeiro = next(blocos, b'')
+            except Exception:
+                ausentes.append(f'{nome}: {arquivo}')
+                continue
+            nomes_usados.add(nome)
+
+            # force_zip64: o tamanho só é conhecido no fim e pode passar de 4 GB
+            with arquivo_zip.open(info, 'w', force_zip64=True) as destino:
+                destino.write(primeiro)
+                for bloco in blocos:
+                    destino.write(bloco)
+                    yield buffer.recolher()
+            yield buffer.recolher()
+
+        if ausentes:
+            arquivo_zip.writestr(
+                zipfile.ZipInfo('LEIA-ME-ERROS.txt', date_time=agora),
+                'Arquivos não encontrados no armazenamento:\n' + '\n'.join(ausentes) + '\n',
+            )
+    yield buffer.recolher()
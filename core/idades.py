@@ -0,0 +1,76 @@
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractDay, ExtractMonth, ExtractYear
+from django.utils import timezone
+
+
+def calcular_idade(data_nascimento, hoje=None):
+    """Idade completa em anos na data `hoje` (padrão: hoje no fuso do sistema)."""
+    if not data_nascimento:
+        return None
+    hoje = hoje or timezone.localdate()
+    return hoje.year - data_nascimento.year - ((hoje.month, hoje.day) < (data_nascimento.month, data_nascimento.day))
+
+
+def idade_em(campo, hoje=None):
+    """
+    Expressão SQL equivalente a `calcular_idade`, para ser usada em
+    anotações, filtros, ordenações e UPDATEs. Nulo se o campo for nulo.
+    """
+    hoje = hoje or timezone.localdate()
+    ainda_nao_fez_aniversario = (
+        Q(**{f'{campo}__month__gt': hoje.month})
+        | Q(**{f'{campo}__month': hoje.month, f'{campo}__day__gt': hoje.day})
+    )
+    return ExpressionWrapper(
+        Value(hoje.year) - ExtractYear(campo) - Case(
+            When(ainda_nao_fez_aniversario, then=Value(1)),
+            default=Value(0),
+        ),
+        output_field=IntegerField(),
+    )
+
+
+def mes_dia(campo):
+    """
+    Mês e dia de `campo` num inteiro MMDD (15 de março = 315). Ordena as
+    datas pelo calendário, sem o ano, e é a expressão dos índices de
+    aniversário: uma janela de aniversários vira um intervalo desse valor.
+    """
+    return ExpressionWrapper(ExtractMonth(campo) * 100 + ExtractDay(campo), output_field=IntegerField())
+
+
+class IdadeQuerySet(models.QuerySet):
+    """
+    QuerySet para modelos com `data_nascimento` e o campo derivado `idade`.
+    """
+
+    def com_idade_atual(self, hoje=None):
+        """Anota `idade_atual`, calculada no banco na hora da consulta."""
+        return self.annotate(idade_atual=idade_em('data_nascimento', hoje))
+
+    def desatualizados(self, hoje=None):
+        """Linhas cuja `idade` gravada difere da idade atual."""
+        return self.filter(
+            Q(data_nascimento__isnull=False) & ~Q(idade=idade_em('data_nascimento', hoje))
+            | Q(data_nascimento__isnull=True, idade__isnull=False)
+        )
+
+    def recalcular_idades(self, hoje=None):
+        """
+        Atualiza `idade` das linhas desatualizadas com um único UPDATE,
+        sem carregar nada em Python. Devolve quantas linhas mudaram.
+        """
+        hoje = hoje or timezone.localdate()
+        return self.desatualizados(hoje).update(idade=idade_em('data_nascimento', hoje))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create não chama save(): calcula a idade de todos aqui
+        objs = list(objs)
+        hoje = timezone.localdate()
+        for obj in objs:
+            obj.idade = calcular_idade(obj.data_nascimento, hoje)
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'data_nascimento' in update_fields and 'idade' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'idade']
+        return super().bulk_create(objs, *args, **kwargs)
@@ -0,0 +1,451 @@
+import codecs
+import csv
+import datetime
+import io
+import posixpath
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.forms import modelform_factory
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais
+from familiar.models import InformacoesFamiliares
+from pessoal.forms import InformacoesPessoaisForm
+from funcional.forms import InformacoesFuncionaisForm
+from familiar.forms import InformacoesFamiliaresForm
+from .busca import normalizar_termo
+from .estatisticas import recalcular_estatisticas
+from .versoes import registrar_alteracoes
+
+# Linhas validadas e gravadas por vez: cada lote custa um número fixo de
+# consultas (buscas pelas chaves, INSERT de usuários e um upsert por seção)
+TAMANHO_LOTE_IMPORTACAO = 500
+
+# Máximo de erros guardados no resultado; os demais só são contados
+MAXIMO_ERROS = 5000
+
+EXTENSOES = ('.csv', '.xlsx')
+
+
+class _SemValidacaoUnica:
+    """
+    As regras dos formulários, menos a verificação de unicidade: ela faria
+    uma consulta por linha e acusaria o próprio registro que vai ser
+    atualizado. A importação confere CPF, matrícula e e-mail por lote.
+    """
+
+    def validate_unique(self):
+        pass
+
+
+class ImportacaoPessoaisForm(_SemValidacaoUnica, InformacoesPessoaisForm):
+    class Meta(InformacoesPessoaisForm.Meta):
+        exclude = ['usuario', 'idade', 'foto']
+
+
+class ImportacaoFuncionaisForm(_SemValidacaoUnica, InformacoesFuncionaisForm):
+    pass
+
+
+class ImportacaoFamiliaresForm(_SemValidacaoUnica, InformacoesFamiliaresForm):
+    pass
+
+
+# (relação no usuário, modelo, formulário, campos únicos além de `usuario`)
+SECOES = [
+    ('info_pessoais', InformacoesPessoais, ImportacaoPessoaisForm, ['cpf', 'email']),
+    ('info_funcionais', InformacoesFuncionais, ImportacaoFuncionaisForm, ['matricula']),
+    ('info_familiares', InformacoesFamiliares, ImportacaoFamiliaresForm, []),
+]
+CHAVES_USUARIO = ('username', 'usuario')
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.linhas = 0
+        self.criados = 0
+        self.atualizados = 0
+        self.total_erros = 0
+        self.erros = []  # (número da linha, mensagem)
+        self.colunas_ignoradas = []
+
+    def erro(self, linha, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAXIMO_ERROS:
+            self.erros.append((linha, mensagem))
+
+    def como_dict(self):
+        return {
+            'linhas': self.linhas,
+            'criados': self.criados,
+            'atualizados': self.atualizados,
+            'erros': self.total_erros,
+            'colunas_ignoradas': self.colunas_ignoradas,
+        }
+
+
+# --- Leitura ---
+
+def _texto(valor):
+    # Células do XLSX chegam tipadas; os formulários esperam texto
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _linhas_csv(arquivo):
+    texto = codecs.getreader('utf-8-sig')(arquivo, errors='replace')
+    amostra = texto.read(4096)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    return csv.reader(_encadear(amostra, texto), dialeto)
+
+
+def _encadear(inicio, resto):
+    # Devolve ao leitor CSV a amostra já consumida pelo Sniffer
+    yield from io.StringIO(inicio + resto.readline())
+    yield from resto
+
+
+def _linhas_xlsx(arquivo):
+    import openpyxl  # só aqui, para não pesar na partida do processo
+
+    # read_only: as linhas são lidas do XML sob demanda, sem montar a planilha
+    planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        for linha in planilha.worksheets[0].iter_rows(values_only=True):
+            yield linha
+    finally:
+        planilha.close()
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """
+    Gera as linhas de um CSV ou XLSX como listas de texto, uma de cada vez.
+    A primeira é o cabeçalho.
+    """
+    extensao = posixpath.splitext(nome_arquivo.lower())[1]
+    if extensao not in EXTENSOES:
+        raise ValueError(f'Formato não suportado: use {" ou ".join(EXTENSOES)}.')
+    linhas = _linhas_xlsx(arquivo) if extensao == '.xlsx' else _linhas_csv(arquivo)
+    for linha in linhas:
+        yield [_texto(valor) for valor in linha]
+
+
+# --- Cabeçalho ---
+
+def _mapa_colunas():
+    """
+    Nome normalizado da coluna -> (relação, campo). Aceita o nome do campo
+    (`cpf`), o rótulo (`CPF`) e a forma qualificada (`info_pessoais__cpf`),
+    que é o que a exportação CSV/JSONL produz.
+    """
+    mapa = {}
+    for relacao, modelo, formulario, _ in SECOES:
+        for campo in formulario.base_fields:
+            rotulo = modelo._meta.get_field(campo).verbose_name
+            for nome in (f'{relacao}__{campo}', campo, str(rotulo)):
+                mapa.setdefault(normalizar_termo(nome), (relacao, campo))
+    for nome in (*CHAVES_USUARIO, 'Usuário'):
+        mapa[normalizar_termo(nome)] = (None, 'username')
+    return mapa
+
+
+def colunas_importaveis():
+    """Rótulos das colunas aceitas, na ordem das seções (para a tela de importação)."""
+    return [
+        str(modelo._meta.get_field(campo).verbose_name)
+        for _, modelo, formulario, _ in SECOES for campo in formulario.base_fields
+    ]
+
+
+def _rotulos_para_valores(modelo, campo):
+    # A exportação escreve o rótulo das escolhas ("Major"), não o valor ("major")
+    escolhas = modelo._meta.get_field(campo).choices or []
+    return {normalizar_termo(str(rotulo)): valor for valor, rotulo in escolhas}
+
+
+class _Colunas:
+    def __init__(self, cabecalho):
+        mapa = _mapa_colunas()
+        self.indices = {}  # (relação, campo) -> índice da coluna
+        self.ignoradas = []
+        for indice, titulo in enumerate(cabecalho):
+            alvo = mapa.get(normalizar_termo(titulo)) if titulo else None
+            if alvo is None or alvo in self.indices:
+                if titulo:
+                    self.ignoradas.append(titulo)
+                continue
+            self.indices[alvo] = indice
+
+        campos = lambda relacao: [c for r, c in self.indices if r == relacao]
+        if not ({('info_pessoais', 'cpf'), ('info_funcionais', 'matricula')} & set(self.indices)):
+            raise ValueError('O arquivo precisa de uma coluna de CPF ou de Matrícula.')
+
+        # Uma classe de formulário por seção, só com as colunas presentes: o
+        # que não veio no arquivo não é validado nem sobrescrito
+        self.formularios = {}
+        self.campos = {}
+        self.escolhas = {}
+        for relacao, modelo, formulario, _ in SECOES:
+            if campos(relacao):
+                self.campos[relacao] = campos(relacao)
+                classe = modelform_factory(modelo, form=formulario, fields=campos(relacao))
+                self.formularios[relacao] = classe
+                for campo in campos(relacao):
+                    self.escolhas[(relacao, campo)] = _rotulos_para_valores(modelo, campo)
+
+    def dados(self, linha):
+        """Separa uma linha em {relação: {campo: texto}} e o username."""
+        secoes = {relacao: {} for relacao in self.formularios}
+        username = ''
+        for (relacao, campo), indice in self.indices.items():
+            valor = linha[indice] if indice < len(linha) else ''
+            if relacao is None:
+                username = valor
+                continue
+            escolhas = self.escolhas[(relacao, campo)]
+            if escolhas and valor:
+                valor = escolhas.get(normalizar_termo(valor), valor)
+            secoes[relacao][campo] = valor
+        return secoes, username
+
+
+# --- Gravação ---
+
+class _Linha:
+    def __init__(self, numero, limpos, username):
+        self.numero = numero
+        self.limpos = limpos  # {relação: cleaned_data}
+        self.username = username
+        self.usuario_id = None
+
+    def valor(self, relacao, campo):
+        return self.limpos.get(relacao, {}).get(campo)
+
+
+def _validar(numero, linha, colunas, resultado):
+    secoes, username = colunas.dados(linha)
+    limpos = {}
+    erros = []
+    for relacao, dados in secoes.items():
+        # Um formulário novo por linha: reaproveitar a instância exigiria
+        # mexer no estado interno dela (data, instance, _errors)
+        formulario = colunas.formularios[relacao](data=dados)
+        if formulario.is_valid():
+            # Campos declarados no formulário entram mesmo fora de `fields`
+            limpos[relacao] = {campo: formulario.cleaned_data[campo] for campo in colunas.campos[relacao]}
+        else:
+            erros += [f'{campo}: {" ".join(mensagens)}' for campo, mensagens in formulario.errors.items()]
+    if erros:
+        resultado.erro(numero, '; '.join(erros))
+        return None
+    registro = _Linha(numero, limpos, username)
+    if not registro.valor('info_pessoais', 'cpf') and not registro.valor('info_funcionais', 'matricula'):
+        resultado.erro(numero, 'Informe o CPF ou a matrícula.')
+        return None
+    return registro
+
+
+def _resolver_usuarios(lote, vistos, resultado):
+    """
+    Associa cada linha ao usuário existente (por CPF ou matrícula) e confere
+    os campos únicos contra o banco e contra as linhas anteriores do arquivo:
+    as dos lotes já gravados (`vistos`, que não é alterado aqui) e as
+    anteriores deste lote. Devolve as linhas sem conflito.
+    """
+    donos = {}  # (relação, campo) -> {valor: usuario_id}
+    for relacao, modelo, _, unicos in SECOES:
+        for campo in unicos:
+            valores = {linha.valor(relacao, campo) for linha in lote} - {None, ''}
+            if valores:
+                donos[(relacao, campo)] = dict(
+                    modelo.objects.filter(**{f'{campo}__in': valores}).values_list(campo, 'usuario_id')
+                )
+
+    validas = []
+    no_lote = {}  # (campo, valor) -> número da linha, só deste lote
+    for linha in lote:
+        encontrados = {
+            donos.get(chave, {}).get(linha.valor(*chave))
+            for chave in [('info_pessoais', 'cpf'), ('info_funcionais', 'matricula')]
+        } - {None}
+        if len(encontrados) > 1:
+            resultado.erro(linha.numero, 'CPF e matrícula pertencem a servidores diferentes.')
+            continue
+        linha.usuario_id = encontrados.pop() if encontrados else None
+
+        conflitos = []
+        for (relacao, campo), por_valor in donos.items():
+            valor = linha.valor(relacao, campo)
+            if valor and por_valor.get(valor, linha.usuario_id) != linha.usuario_id:
+                conflitos.append(f'{campo} {valor} já pertence a outro servidor.')
+        for relacao, _, _, unicos in SECOES:
+            for campo in unicos:
+                valor = linha.valor(relacao, campo)
+                anterior = (vistos.get((campo, valor)) or no_lote.get((campo, valor))) if valor else None
+                if anterior is not None:
+                    conflitos.append(f'{campo} {valor} repetido (linha {anterior}).')
+        if conflitos:
+            resultado.erro(linha.numero, ' '.join(conflitos))
+            continue
+
+        for relacao, _, _, unicos in SECOES:
+            for campo in unicos:
+                valor = linha.valor(relacao, campo)
+                if valor:
+                    no_lote[(campo, valor)] = linha.numero
+        validas.append(linha)
+    return validas
+
+
+def _marcar_vistos(linhas, vistos):
+    """Registra os campos únicos das linhas gravadas, para os lotes seguintes."""
+    for linha in linhas:
+        for relacao, _, _, unicos in SECOES:
+            for campo in unicos:
+                valor = linha.valor(relacao, campo)
+                if valor:
+                    vistos[(campo, valor)] = linha.numero
+
+
+def _username(linha):
+    if linha.username:
+        return linha.username
+    cpf = ''.join(c for c in linha.valor('info_pessoais', 'cpf') or '' if c.isdigit())
+    return cpf or f'mat-{linha.valor("info_funcionais", "matricula")}'
+
+
+def _criar_usuarios(novas, resultado):
+    """Cria, com um único INSERT, os usuários das linhas sem cadastro."""
+    nomes = {}
+    for linha in novas:
+        nomes.setdefault(_username(linha), []).append(linha)
+    existentes = set(User.objects.filter(username__in=list(nomes)).values_list('username', flat=True))
+
+    criar = []
+    for username, linhas in nomes.items():
+        if username in existentes or len(linhas) > 1:
+            for linha in linhas:
+                resultado.erro(linha.numero, f'O nome de usuário "{username}" já está em uso.')
+            continue
+        criar.append((linhas[0], User(username=username, password=make_password(None))))
+
+    # Sem senha utilizável: o acesso é liberado depois, pelo administrador
+    User.objects.bulk_create([usuario for _, usuario in criar])
+    # Todo servidor tem a seção funcional, mesmo que o arquivo não traga essas
+    # colunas: é dela que o painel lista (core.consultas)
+    InformacoesFuncionais.objects.bulk_create([InformacoesFuncionais(usuario=usuario) for _, usuario in criar])
+    for linha, usuario in criar:
+        linha.usuario_id = usuario.pk
+    return [linha for linha, _ in criar]
+
+
+def _gravar_lote(lote, vistos, resultado):
+    validas = _resolver_usuarios(lote, vistos, resultado)
+    existentes = [linha for linha in validas if linha.usuario_id is not None]
+    novas = _criar_usuarios([linha for linha in validas if linha.usuario_id is None], resultado)
+
+    for relacao, modelo, _, _ in SECOES:
+        registros = [linha for linha in existentes + novas if relacao in linha.limpos]
+        if not registros:
+            continue
+        campos = list(registros[0].limpos[relacao])
+        # Upsert por usuário: um INSERT ... ON CONFLICT (usuario_id) DO UPDATE
+        # por seção e por lote, só com as colunas presentes no arquivo
+        modelo.objects.bulk_create(
+            [modelo(usuario_id=linha.usuario_id, **linha.limpos[relacao]) for linha in registros],
+            update_conflicts=True, unique_fields=['usuario'], update_fields=campos,
+        )
+
+    resultado.atualizados += len(existentes)
+    resultado.criados += len(novas)
+    return existentes + novas
+
+
+def importar_servidores(arquivo, nome_arquivo, simular=False, ao_progredir=None, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+    """
+    Importa servidores de um CSV ou XLSX, criando ou atualizando o usuário e
+    as três seções do cadastro. As linhas são identificadas pelo CPF ou pela
+    matrícula; só as colunas presentes no arquivo são gravadas.
+
+    O arquivo é lido como fluxo e processado em lotes de `tamanho_lote`
+    linhas, cada um na sua transação: um lote com erro de banco não desfaz
+    os anteriores. Erros de validação são reportados por linha e não
+    impedem a gravação das demais. Com `simular`, tudo é validado e nada é
+    gravado.
+
+    Levanta ValueError se o arquivo não puder ser lido ou não tiver colunas
+    de identificação.
+    """
+    resultado = ResultadoImportacao()
+    linhas = ler_linhas(arquivo, nome_arquivo)
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        raise ValueError('O arquivo está vazio.')
+    colunas = _Colunas(cabecalho)
+    resultado.colunas_ignoradas = colunas.ignoradas
+
+    vistos = {}
+    gravou = False
+
+    def processar(lote):
+        nonlocal gravou
+        try:
+            with transaction.atomic():
+                gravadas = _gravar_lote(lote, vistos, resultado)
+                if simular:
+                    transaction.set_rollback(True)
+                elif gravadas:
+                    registrar_alteracoes([linha.usuario_id for linha in gravadas])
+                    gravou = True
+        except DatabaseError as e:
+            for linha in lote:
+                resultado.erro(linha.numero, f'Erro ao gravar o lote: {e}')
+        else:
+            # Só depois do commit: as linhas de um lote desfeito não contam
+            # como repetidas para os seguintes
+            _marcar_vistos(gravadas, vistos)
+        if ao_progredir:
+            ao_progredir(resultado.linhas)
+
+    lote = []
+    # A linha 1 é o cabeçalho
+    for numero, linha in enumerate(linhas, start=2):
+        if not any(linha):
+            continue
+        resultado.linhas += 1
+        registro = _validar(numero, linha, colunas, resultado)
+        if registro is not None:
+            lote.append(registro)
+        if len(lote) >= tamanho_lote:
+            processar(lote)
+            lote = []
+    if lote:
+        processar(lote)
+    if gravou:
+        # O upsert em lote (bulk_create) não dispara os sinais que mantêm a tabela
+        recalcular_estatisticas()
+    return resultado
+
+
+def relatorio_csv(resultado, destino):
+    """Escreve em `destino` (texto) o resumo e os erros por linha."""
+    writer = csv.writer(destino)
+    writer.writerow(['Linhas', 'Criados', 'Atualizados', 'Erros'])
+    writer.writerow([resultado.linhas, resultado.criados, resultado.atualizados, resultado.total_erros])
+    writer.writerow([])
+    writer.writerow(['Linha', 'Erro'])
+    writer.writerows(sorted(resultado.erros))
+    if resultado.total_erros > len(resultado.erros):
+        writer.writerow(['', f'... e mais {resultado.total_erros - len(resultado.erros)} erro(s).'])
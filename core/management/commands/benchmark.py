@@ -0,0 +1,205 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from pessoal.forms import InformacoesPessoaisForm
+from funcional.forms import InformacoesFuncionaisForm
+from familiar.forms import InformacoesFamiliaresForm
+from core.consultas import carregar_servidor, secoes_servidor
+from core.metricas import Medicao
+from core.sinteticos import gerar_servidores
+from core.versoes import registrar_alteracao
+
+PREFIXO_BENCHMARK = 'benchmark'
+CENARIOS = ['painel', 'detalhe', 'perfil_get', 'perfil_post', 'exportar_excel']
+ESTATICOS_SEM_MANIFEST = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+
+def _dados_perfil(usuario):
+    # O POST do perfil reenviando os dados atuais, como o navegador faria
+    dados = {}
+    for classe, instancia in zip(
+        (InformacoesPessoaisForm, InformacoesFuncionaisForm, InformacoesFamiliaresForm),
+        secoes_servidor(carregar_servidor(usuario.id)),
+    ):
+        formulario = classe(instance=instancia)
+        for nome, campo in formulario.fields.items():
+            valor = formulario[nome].value()
+            if valor is None or nome == 'foto':
+                continue
+            dados[nome] = campo.widget.format_value(valor) if hasattr(valor, 'strftime') else valor
+    return dados
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+class Command(BaseCommand):
+    help = ('Mede latência, consultas e memória das principais telas (painel, ficha, perfil e '
+            'exportação) com 1 mil, 10 mil e 100 mil servidores sintéticos, e grava o resultado em JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', default='1000,10000,100000',
+                            help='Quantidades de servidores sintéticos, separadas por vírgula.')
+        parser.add_argument('--cenarios', default=','.join(CENARIOS), help='Cenários medidos.')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções medidas por cenário.')
+        parser.add_argument('--saida', help='Arquivo JSON com os resultados (padrão: só na tela).')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior, para mostrar a variação.')
+        parser.add_argument('--prefixo', default=PREFIXO_BENCHMARK, help='Prefixo dos servidores sintéticos.')
+
+    def handle(self, *args, **options):
+        # As requisições do Client chegam com o host 'testserver'. Os
+        # estáticos saem sem hash: o benchmark roda sem collectstatic, e sem
+        # o manifest o {% static %} falharia com DEBUG=False
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': ESTATICOS_SEM_MANIFEST}},
+        ):
+            self._executar(options)
+
+    def _executar(self, options):
+        try:
+            tamanhos = sorted(int(t) for t in options['tamanhos'].split(','))
+        except ValueError:
+            raise CommandError('--tamanhos deve ser uma lista de números.')
+        cenarios = [c for c in options['cenarios'].split(',') if c]
+        desconhecidos = set(cenarios) - set(CENARIOS)
+        if desconhecidos:
+            raise CommandError(f'Cenários desconhecidos: {", ".join(sorted(desconhecidos))}.')
+
+        admin, _ = User.objects.get_or_create(
+            username=f'{options["prefixo"]}-admin', defaults={'is_superuser': True, 'password': '!'},
+        )
+        painel = Client()
+        painel.force_login(admin)
+
+        resultados = []
+        for tamanho in tamanhos:
+            existentes = User.objects.filter(username__startswith=f'{options["prefixo"]}_', password='!',
+                                             info_pessoais__isnull=False).count()
+            if existentes < tamanho:
+                self.stdout.write(f'Criando {tamanho - existentes} servidor(es) sintético(s)...')
+                gerar_servidores(tamanho - existentes, prefixo=options['prefixo'], semente=tamanho)
+            alvo = User.objects.filter(username=f'{options["prefixo"]}_000001').get()
+            perfil = Client()
+            perfil.force_login(alvo)
+
+            requisicoes = {
+                'painel': lambda: painel.get(reverse('admin_visualizacao')),
+                'detalhe': lambda: painel.get(reverse('detalhe_usuario', args=[alvo.id])),
+                'perfil_get': lambda: perfil.get(reverse('perfil_usuario')),
+                'perfil_post': lambda: perfil.post(reverse('perfil_usuario'), _dados_perfil(alvo)),
+                'exportar_excel': lambda: painel.get(reverse('exportar_excel')),
+            }
+            for cenario in cenarios:
+                # Nova versão dos dados antes de cada execução: o cache de
+                # painel e ficha (core.cache) erra e a consulta é medida
+                resultado = self._medir(
+                    requisicoes[cenario], options['repeticoes'], invalidar=lambda: registrar_alteracao(alvo.id),
+                )
+                resultado.update({'usuarios': tamanho, 'usuarios_total': User.objects.count(), 'cenario': cenario})
+                resultados.append(resultado)
+                self.stdout.write(
+                    f'{tamanho:>7} {cenario:<15} mediana {resultado["latencia_ms"]["mediana"]:>9.1f} ms  '
+                    f'p95 {resultado["latencia_ms"]["p95"]:>9.1f} ms  {resultado["consultas"]:>4} consultas  '
+                    f'pico {resultado["memoria_pico_kb"]:>8} KB  status {resultado["status"]}'
+                )
+
+        relatorio = {
+            'gerado_em': timezone.now().isoformat(),
+            'ambiente': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'banco': connection.vendor,
+                'plataforma': platform.platform(),
+            },
+            'repeticoes': options['repeticoes'],
+            'resultados': resultados,
+        }
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as destino:
+                json.dump(relatorio, destino, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados gravados em {options["saida"]}.'))
+        else:
+            json.dump(relatorio, sys.stdout, ensure_ascii=False, indent=2)
+            self.stdout.write('')
+
+        if options['comparar']:
+            self._comparar(options['comparar'], resultados)
+
+    def _medir(self, requisitar, repeticoes, invalidar):
+        def executar():
+            resposta = requisitar()
+            # Respostas em streaming só terminam quando o corpo é consumido
+            corpo = b''.join(resposta.streaming_content) if resposta.streaming else resposta.content
+            return resposta.status_code, len(corpo)
+
+        executar()  # aquecimento: templates, conexão e sessão
+
+        tempos = []
+        for _ in range(repeticoes):
+            # Fora da medição: os UPDATEs da versão não entram na conta
+            invalidar()
+            with Medicao().medir() as medicao:
+                inicio = time.perf_counter()
+                status, tamanho = executar()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+
+        # Memória numa execução à parte: o tracemalloc deixa tudo mais lento
+        invalidar()
+        tracemalloc.start()
+        try:
+            executar()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': status,
+            'bytes': tamanho,
+            'consultas': medicao.consultas,
+            'latencia_ms': {
+                'minima': round(min(tempos), 2),
+                'mediana': round(statistics.median(tempos), 2),
+                'p95': round(_percentil(tempos, 95), 2),
+                'maxima': round(max(tempos), 2),
+            },
+            'memoria_pico_kb': pico // 1024,
+        }
+
+    def _comparar(self, caminho, resultados):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                anteriores = {
+                    (r['usuarios'], r['cenario']): r for r in json.load(arquivo)['resultados']
+                }
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Não foi possível ler {caminho}: {e}')
+
+        self.stdout.write(f'\nVariação em relação a {caminho} (mediana, consultas, memória):')
+        for atual in resultados:
+            anterior = anteriores.get((atual['usuarios'], atual['cenario']))
+            if anterior is None:
+                continue
+            variacao = (atual['latencia_ms']['mediana'] / anterior['latencia_ms']['mediana'] - 1) * 100
+            linha = (
+                f'{atual["usuarios"]:>7} {atual["cenario"]:<15} {variacao:>+7.1f}%  '
+                f'{anterior["consultas"]:>4} -> {atual["consultas"]:<4}  '
+                f'{anterior["memoria_pico_kb"]:>8} -> {atual["memoria_pico_kb"]} KB'
+            )
+            pior = variacao > 10 or atual['consultas'] > anterior['consultas']
+            self.stdout.write(self.style.WARNING(linha) if pior else linha)
@@ -0,0 +1,110 @@
+import json
+import statistics
+import sys
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from sistema_cadastro.banco import MODOS_CONEXAO, configurar_banco
+
+
+class Command(BaseCommand):
+    help = ('Compara o custo de conexão por requisição em cada modo de DB_CONEXAO, simulando '
+            'requisições (sinais de início e fim) que fazem uma consulta simples.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modos', default=','.join(MODOS_CONEXAO), help='Modos comparados.')
+        parser.add_argument('--requisicoes', type=int, default=50, help='Requisições simuladas por modo.')
+        parser.add_argument('--intervalo', type=float, default=0,
+                            help='Pausa entre requisições, em segundos (simula tráfego esparso).')
+        parser.add_argument('--url', default=settings.DATABASE_URL, help='URL do banco (padrão: a do settings).')
+        parser.add_argument('--url-pgbouncer',
+                            help='URL do PgBouncer para o modo pgbouncer (padrão: a mesma de --url).')
+        parser.add_argument('--sem-ssl', action='store_true', help='Conecta sem exigir SSL.')
+        parser.add_argument('--saida', help='Arquivo JSON com os resultados (padrão: só na tela).')
+
+    def handle(self, *args, **options):
+        modos = [m for m in options['modos'].split(',') if m]
+        desconhecidos = set(modos) - set(MODOS_CONEXAO)
+        if desconhecidos:
+            raise CommandError(f'Modos desconhecidos: {", ".join(sorted(desconhecidos))}.')
+
+        resultados = []
+        for modo in modos:
+            url = options['url_pgbouncer'] if modo == 'pgbouncer' and options['url_pgbouncer'] else options['url']
+            try:
+                banco = configurar_banco(url, modo=modo, ssl=not options['sem_ssl'])
+            except ImproperlyConfigured as e:
+                self.stderr.write(f'{modo}: {e}')
+                resultados.append({'modo': modo, 'erro': str(e)})
+                continue
+            resultado = self._medir(modo, banco, options['requisicoes'], options['intervalo'])
+            resultados.append(resultado)
+            self.stdout.write(
+                f'{modo:<17} primeira {resultado["primeira_ms"]:>8.1f} ms  mediana {resultado["mediana_ms"]:>7.2f} ms  '
+                f'p95 {resultado["p95_ms"]:>7.2f} ms  {resultado["conexoes_abertas"]:>3} conexão(ões) abertas'
+            )
+
+        relatorio = {'requisicoes': options['requisicoes'], 'intervalo': options['intervalo'], 'resultados': resultados}
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as destino:
+                json.dump(relatorio, destino, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados gravados em {options["saida"]}.'))
+        else:
+            json.dump(relatorio, sys.stdout, ensure_ascii=False, indent=2)
+            self.stdout.write('')
+
+    def _medir(self, modo, banco, requisicoes, intervalo):
+        # Um alias próprio por modo, montado como o settings montaria o default
+        alias = f'benchmark_{modo}'
+        connections.settings[alias] = connections.configure_settings({'default': banco})['default']
+        conexao = connections[alias]
+
+        abertas = []
+
+        def contar(sender, connection, **kwargs):
+            if connection.alias == alias:
+                abertas.append(connection)
+
+        connection_created.connect(contar, weak=False)
+        tempos = []
+        try:
+            for _ in range(requisicoes):
+                # Os mesmos sinais de uma requisição real: é neles que o Django
+                # fecha (ou devolve ao pool) as conexões vencidas
+                request_started.send(sender=self.__class__)
+                inicio = time.perf_counter()
+                with conexao.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+                request_finished.send(sender=self.__class__)
+                if intervalo:
+                    time.sleep(intervalo)
+            pool = getattr(conexao, 'pool', None)
+            estatisticas_pool = pool.get_stats() if pool is not None else None
+        finally:
+            connection_created.disconnect(contar)
+            conexao.close()
+            if hasattr(conexao, 'close_pool'):
+                conexao.close_pool()
+            del connections[alias]
+            del connections.settings[alias]
+
+        ordenados = sorted(tempos)
+        return {
+            'modo': modo,
+            'primeira_ms': round(tempos[0], 2),
+            'mediana_ms': round(statistics.median(tempos), 2),
+            'p95_ms': round(ordenados[min(len(ordenados) - 1, round(0.95 * (len(ordenados) - 1)))], 2),
+            'maxima_ms': round(ordenados[-1], 2),
+            # No modo pool, conta as retiradas do pool; as conexões de fato
+            # abertas estão em `pool` (connections_num)
+            'conexoes_abertas': len(abertas),
+            'pool': estatisticas_pool,
+        }
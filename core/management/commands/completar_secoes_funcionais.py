@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.consultas import completar_secoes_funcionais
+
+
+class Command(BaseCommand):
+    help = ('Cria a seção funcional dos servidores que não a têm (usuários gravados por bulk_create, '
+            'SQL ou fixtures, sem os sinais). Sem ela o servidor não aparece no painel.')
+
+    def handle(self, *args, **options):
+        criadas = completar_secoes_funcionais()
+        self.stdout.write(self.style.SUCCESS(f'{criadas} seção(ões) funcional(is) criada(s).'))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core.sinteticos import gerar_servidores, remover_servidores, PREFIXO_PADRAO, TAMANHO_LOTE_SINTETICOS
+
+
+class Command(BaseCommand):
+    help = ('Cria servidores sintéticos (com filhos, documentos e foto) para desenvolvimento '
+            'e benchmarks. Não use em produção.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('quantidade', type=int, nargs='?', default=1000, help='Quantos servidores criar.')
+        parser.add_argument('--prefixo', default=PREFIXO_PADRAO, help='Prefixo dos usernames criados.')
+        parser.add_argument('--filhos-max', type=int, default=3, help='Máximo de filhos por servidor.')
+        parser.add_argument('--documentos-max', type=int, default=3, help='Máximo de documentos por servidor.')
+        parser.add_argument('--sem-foto', action='store_true', help='Não atribui foto aos servidores.')
+        parser.add_argument('--semente', type=int, help='Semente do gerador, para repetir os mesmos dados.')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_SINTETICOS, help='Servidores por transação.')
+        parser.add_argument('--remover', action='store_true',
+                            help='Apaga os servidores sintéticos com o prefixo em vez de criar.')
+
+    def handle(self, *args, **options):
+        if options['remover']:
+            removidos = remover_servidores(options['prefixo'])
+            self.stdout.write(self.style.SUCCESS(f'{removidos} servidor(es) sintético(s) removido(s).'))
+            return
+
+        def progresso(criados):
+            self.stdout.write(f'\r{criados}/{options["quantidade"]} servidor(es)...', ending='')
+            self.stdout.flush()
+
+        criados = gerar_servidores(
+            options['quantidade'], prefixo=options['prefixo'], filhos_max=options['filhos_max'],
+            documentos_max=options['documentos_max'], com_foto=not options['sem_foto'],
+            semente=options['semente'], tamanho_lote=options['lote'],
+            ao_progredir=progresso if sys.stdout.isatty() else None,
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'{criados} servidor(es) sintético(s) criado(s).'))
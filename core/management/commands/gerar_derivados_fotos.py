@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from pessoal.models import InformacoesPessoais
+from pessoal.imagens import garantir_derivados
+from core.versoes import registrar_alteracoes
+
+
+class Command(BaseCommand):
+    help = ('Gera as miniaturas (WebP e JPEG) das fotos que ainda não as têm. '
+            'Sem isso elas são geradas na primeira vez em que a foto é exibida.')
+
+    def handle(self, *args, **options):
+        pendentes = InformacoesPessoais.objects.exclude(foto='').exclude(foto__isnull=True).exclude(
+            foto_derivados=F('foto')
+        ).only('id', 'usuario_id', 'foto', 'foto_derivados')
+
+        geradas = []
+        for info_pessoais in pendentes.iterator(chunk_size=100):
+            # Fora de uma requisição vale a pena a compressão mais lenta
+            if garantir_derivados(info_pessoais, otimizar=True):
+                geradas.append(info_pessoais.usuario_id)
+            else:
+                self.stderr.write(self.style.ERROR(
+                    f'{info_pessoais.foto.name}: não foi possível ler a imagem (a original continua sendo exibida).'
+                ))
+
+        if geradas:
+            registrar_alteracoes(geradas)
+        self.stdout.write(self.style.SUCCESS(f'Miniaturas geradas para {len(geradas)} foto(s).'))
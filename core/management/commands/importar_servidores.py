@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import importar_servidores, relatorio_csv, TAMANHO_LOTE_IMPORTACAO
+
+
+class Command(BaseCommand):
+    help = ('Importa servidores de uma planilha XLSX ou de um CSV, criando ou atualizando '
+            'os cadastros pelo CPF ou pela matrícula.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .xlsx ou .csv.')
+        parser.add_argument('--simular', action='store_true', help='Valida tudo sem gravar nada.')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_IMPORTACAO, help='Linhas gravadas por transação.')
+        parser.add_argument('--relatorio', help='Grava o resumo e os erros por linha neste CSV.')
+
+    def handle(self, *args, **options):
+        def progresso(linhas):
+            self.stdout.write(f'\r{linhas} linha(s) processada(s)...', ending='')
+            self.stdout.flush()
+
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar_servidores(
+                    arquivo, options['arquivo'], simular=options['simular'],
+                    ao_progredir=progresso if sys.stdout.isatty() else None, tamanho_lote=options['lote'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write('')
+
+        for linha, mensagem in sorted(resultado.erros)[:20]:
+            self.stderr.write(f'Linha {linha}: {mensagem}')
+        if resultado.total_erros > 20:
+            self.stderr.write(f'... e mais {resultado.total_erros - 20} erro(s).')
+        if resultado.colunas_ignoradas:
+            self.stdout.write(f'Colunas ignoradas: {", ".join(resultado.colunas_ignoradas)}')
+
+        if options['relatorio']:
+            with open(options['relatorio'], 'w', encoding='utf-8-sig', newline='') as destino:
+                relatorio_csv(resultado, destino)
+
+        prefixo = 'Simulação: ' if options['simular'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefixo}{resultado.linhas} linha(s), {resultado.criados} criado(s), '
+            f'{resultado.atualizados} atualizado(s), {resultado.total_erros} com erro.'
+        ))
@@ -0,0 +1,85 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from funcional.models import ArquivoConteudo, Documento, UploadParcial
+from funcional.conteudo import VALIDADE_TOKEN, descartar_upload
+
+
+class Command(BaseCommand):
+    help = ('Apaga uploads em partes abandonados, arquivos deduplicados que '
+            'não são usados por nenhum documento e arquivos de documentos sem registro.')
+
+    # Pasta varrida em busca de arquivos sem linha no banco
+    PASTA_DOCUMENTOS = 'documentos/'
+    TAMANHO_LOTE = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=VALIDADE_TOKEN // 3600,
+                            help='Idade mínima, em horas, do que pode ser apagado.')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(hours=options['horas'])
+
+        uploads = 0
+        for upload in UploadParcial.objects.filter(criado_em__lt=limite).iterator():
+            descartar_upload(upload)
+            uploads += 1
+
+        # Enviados mas nunca anexados (ex.: o formulário tinha erros). Os mais
+        # novos que o limite ainda podem ter um token válido em algum navegador.
+        conteudos = 0
+        for conteudo in ArquivoConteudo.objects.filter(referencias=0, criado_em__lt=limite).iterator():
+            if ArquivoConteudo.objects.filter(pk=conteudo.pk, referencias=0).delete()[0]:
+                default_storage.delete(conteudo.arquivo.name)
+                conteudos += 1
+
+        orfaos = self._apagar_orfaos(limite)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{uploads} upload(s) em partes, {conteudos} arquivo(s) sem uso e '
+            f'{orfaos} arquivo(s) sem registro apagados.'
+        ))
+
+    def _arquivos(self, pasta):
+        # Percorre o storage a partir de `pasta` (no S3, listagens por prefixo)
+        try:
+            pastas, arquivos = default_storage.listdir(pasta)
+        except FileNotFoundError:
+            return
+        for arquivo in arquivos:
+            yield posixpath.join(pasta, arquivo)
+        for subpasta in pastas:
+            yield from self._arquivos(posixpath.join(pasta, subpasta))
+
+    def _apagar_orfaos(self, limite):
+        """
+        Arquivos gravados no storage cuja linha nunca chegou ao banco: o
+        arquivo é gravado antes do commit (armazenar_arquivo, adotar_objeto)
+        e, se a transação for desfeita (ex.: o formulário tinha erros), só o
+        arquivo fica. Os mais novos que o limite podem estar no meio de uma
+        transação e são mantidos.
+        """
+        apagados = 0
+        lote = []
+
+        def apagar_lote():
+            nonlocal apagados
+            usados = set(ArquivoConteudo.objects.filter(arquivo__in=lote).values_list('arquivo', flat=True))
+            usados.update(Documento.objects.filter(arquivo__in=lote).values_list('arquivo', flat=True))
+            for nome in lote:
+                if nome not in usados and default_storage.get_modified_time(nome) < limite:
+                    default_storage.delete(nome)
+                    apagados += 1
+            lote.clear()
+
+        for nome in self._arquivos(self.PASTA_DOCUMENTOS.rstrip('/')):
+            lote.append(nome)
+            if len(lote) >= self.TAMANHO_LOTE:
+                apagar_lote()
+        if lote:
+            apagar_lote()
+        return apagados
@@ -0,0 +1,150 @@
+import json
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Roda num interpretador novo, como o de uma instância da Vercel: importa o
+# módulo WSGI (que faz o django.setup()) e carrega o que a primeira requisição
+# carregaria (URLconf, com todas as views, e os templates). Com o argumento
+# 'memoria', mede com o tracemalloc as alocações de cada arquivo.
+SONDA = r'''
+import json, sys, time
+memoria = sys.argv[-1] == 'memoria'
+if memoria:
+    import tracemalloc
+    tracemalloc.start()
+inicio = time.perf_counter()
+
+import importlib
+importlib.import_module(sys.argv[1])
+etapas = {'wsgi': time.perf_counter() - inicio}
+
+from django.urls import get_resolver
+get_resolver().url_patterns
+etapas['urls'] = time.perf_counter() - inicio - sum(etapas.values())
+
+from django.template import engines
+engines.all()
+etapas['templates'] = time.perf_counter() - inicio - sum(etapas.values())
+
+resultado = {'total': time.perf_counter() - inicio, 'etapas': etapas, 'modulos': sorted(sys.modules)}
+try:
+    import resource
+    # ru_maxrss vem em KB no Linux (o ambiente da Vercel)
+    resultado['rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+except ImportError:
+    resultado['rss_kb'] = None
+
+if memoria:
+    arquivos = {}
+    for nome, modulo in list(sys.modules.items()):
+        arquivo = getattr(modulo, '__file__', None)
+        if arquivo:
+            arquivos[arquivo] = nome
+    por_modulo = {}
+    for estatistica in tracemalloc.take_snapshot().statistics('filename'):
+        nome = arquivos.get(estatistica.traceback[0].filename, '<outros>')
+        por_modulo[nome] = por_modulo.get(nome, 0) + estatistica.size
+    resultado['memoria'] = por_modulo
+print(json.dumps(resultado))
+'''
+
+_LINHA_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def _pacote(modulo):
+    return modulo.split('.')[0]
+
+
+class Command(BaseCommand):
+    help = ('Mede a partida a frio do processo (import do WSGI, URLconf e templates) num '
+            'interpretador novo: tempo e memória por pacote. Falha se passar do orçamento '
+            'PARTIDA_* do settings ou se algum módulo de PARTIDA_MODULOS_ADIADOS for carregado.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=3, help='Partidas medidas (vale a mediana).')
+        parser.add_argument('--top', type=int, default=15, help='Pacotes mostrados na tabela.')
+        parser.add_argument('--orcamento-ms', type=float, default=settings.PARTIDA_ORCAMENTO_MS,
+                            help='Tempo máximo da partida, em ms (padrão: PARTIDA_ORCAMENTO_MS).')
+        parser.add_argument('--orcamento-mb', type=float, default=settings.PARTIDA_ORCAMENTO_MB,
+                            help='Memória residente máxima, em MB (padrão: PARTIDA_ORCAMENTO_MB).')
+        parser.add_argument('--saida', help='Arquivo JSON com a medição completa, por módulo.')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes deve ser pelo menos 1.')
+        modulo_wsgi = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+
+        partidas = [self._sondar(modulo_wsgi, importtime=True) for _ in range(options['repeticoes'])]
+        partidas.sort(key=lambda partida: partida['total'])
+        mediana = partidas[len(partidas) // 2]
+        memoria = self._sondar(modulo_wsgi, memoria=True)['memoria']
+
+        tempo_pacotes = defaultdict(int)
+        for modulo in mediana['importtime']:
+            tempo_pacotes[_pacote(modulo['modulo'])] += modulo['proprio_us']
+        memoria_pacotes = defaultdict(int)
+        for modulo, tamanho in memoria.items():
+            memoria_pacotes[_pacote(modulo)] += tamanho
+
+        total_ms = statistics.median(partida['total'] for partida in partidas) * 1000
+        rss_mb = mediana['rss_kb'] / 1024 if mediana['rss_kb'] is not None else None
+        etapas = ', '.join(f'{etapa} {segundos * 1000:.0f} ms' for etapa, segundos in mediana['etapas'].items())
+        self.stdout.write(f'Partida: {total_ms:.0f} ms ({etapas})'
+                          + (f', {rss_mb:.1f} MB residentes' if rss_mb is not None else ''))
+        self.stdout.write(f'{"pacote":<28} {"import (ms)":>12} {"memória (KB)":>13}')
+        for pacote in sorted(tempo_pacotes, key=tempo_pacotes.get, reverse=True)[:options['top']]:
+            self.stdout.write(
+                f'{pacote:<28} {tempo_pacotes[pacote] / 1000:>12.1f} {memoria_pacotes.get(pacote, 0) // 1024:>13}'
+            )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as destino:
+                json.dump({
+                    'total_ms': round(total_ms, 1),
+                    'partidas_ms': [round(partida['total'] * 1000, 1) for partida in partidas],
+                    'etapas_ms': {etapa: round(s * 1000, 1) for etapa, s in mediana['etapas'].items()},
+                    'rss_mb': round(rss_mb, 1) if rss_mb is not None else None,
+                    'modulos': mediana['importtime'],
+                    'memoria_kb': {modulo: tamanho // 1024 for modulo, tamanho in memoria.items()},
+                }, destino, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Medição gravada em {options["saida"]}.'))
+
+        problemas = []
+        if total_ms > options['orcamento_ms']:
+            problemas.append(f'a partida levou {total_ms:.0f} ms (orçamento: {options["orcamento_ms"]:.0f} ms)')
+        if rss_mb is not None and rss_mb > options['orcamento_mb']:
+            problemas.append(f'a memória residente chegou a {rss_mb:.1f} MB (orçamento: {options["orcamento_mb"]:.0f} MB)')
+        carregados = {_pacote(modulo) for modulo in mediana['modulos']}
+        adiados = sorted(carregados & set(settings.PARTIDA_MODULOS_ADIADOS))
+        if adiados:
+            problemas.append(f'módulos que deveriam ser importados só no uso foram carregados: {", ".join(adiados)}')
+        if problemas:
+            raise CommandError('Orçamento de partida estourado: ' + '; '.join(problemas) + '.')
+        self.stdout.write(self.style.SUCCESS('Dentro do orçamento de partida.'))
+
+    def _sondar(self, modulo_wsgi, importtime=False, memoria=False):
+        comando = [sys.executable]
+        if importtime:
+            comando += ['-X', 'importtime']
+        comando += ['-c', SONDA, modulo_wsgi] + (['memoria'] if memoria else [])
+        # Herda o ambiente, inclusive o DJANGO_SETTINGS_MODULE em uso
+        processo = subprocess.run(comando, capture_output=True, text=True, cwd=settings.BASE_DIR)
+        if processo.returncode != 0:
+            erro = [linha for linha in processo.stderr.splitlines() if not linha.startswith('import time:')]
+            raise CommandError('A partida falhou:\n' + '\n'.join(erro[-20:]))
+        resultado = json.loads(processo.stdout.splitlines()[-1])
+        if importtime:
+            # O -X importtime escreve uma linha por módulo no stderr, recuada
+            # conforme quem o importou
+            linhas = (_LINHA_IMPORTTIME.match(linha) for linha in processo.stderr.splitlines())
+            resultado['importtime'] = [
+                {'modulo': nome, 'proprio_us': int(proprio), 'acumulado_us': int(acumulado), 'nivel': len(recuo) // 2}
+                for proprio, acumulado, recuo, nome in (linha.groups() for linha in linhas if linha)
+            ]
+        return resultado
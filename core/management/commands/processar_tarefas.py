@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.tarefas import reservar_proxima_tarefa, executar_tarefa, reenfileirar_travadas
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de tarefas em segundo plano (exportações e outros trabalhos pesados).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Processa as tarefas pendentes e encerra.')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera quando a fila está vazia.')
+        parser.add_argument('--tempo-limite', type=int, default=settings.TAREFAS_TEMPO_LIMITE,
+                            help='Minutos após os quais uma tarefa em execução é considerada travada e volta para a fila.')
+
+    def handle(self, *args, **options):
+        total = reenfileirar_travadas(options['tempo_limite'])
+        if total:
+            self.stdout.write(self.style.WARNING(f'{total} tarefa(s) travada(s) voltaram para a fila.'))
+
+        while True:
+            close_old_connections()
+            tarefa = reservar_proxima_tarefa()
+            if tarefa is None:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'Executando {tarefa}...')
+            executar_tarefa(tarefa)
+            if tarefa.status == 'erro':
+                self.stderr.write(self.style.ERROR(f'{tarefa} falhou:\n{tarefa.mensagem_erro}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{tarefa} concluída.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.estatisticas import contar_estatisticas, recalcular_estatisticas
+from core.models import Estatistica
+
+
+class Command(BaseCommand):
+    help = ('Refaz a tabela de estatísticas do efetivo com um GROUP BY nas tabelas de origem. '
+            'Os sinais mantêm a tabela em dia; use depois de cargas feitas fora do sistema.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true',
+                            help='Só compara a tabela com as contagens reais, sem alterar nada. '
+                                 'Falha se houver diferença.')
+
+    def handle(self, *args, **options):
+        if not options['verificar']:
+            contagens = recalcular_estatisticas()
+            self.stdout.write(self.style.SUCCESS(f'Estatísticas recalculadas ({len(contagens)} linha(s)).'))
+            return
+
+        reais = contar_estatisticas()
+        gravadas = {
+            (dimensao, valor): quantidade
+            for dimensao, valor, quantidade in Estatistica.objects.values_list('dimensao', 'valor', 'quantidade')
+        }
+        diferencas = sorted(
+            chave for chave in set(reais) | set(gravadas) if reais.get(chave, 0) != gravadas.get(chave, 0)
+        )
+        for dimensao, valor in diferencas:
+            self.stdout.write(
+                f'{dimensao} / {valor or "(vazio)"}: gravado {gravadas.get((dimensao, valor), 0)}, '
+                f'real {reais.get((dimensao, valor), 0)}'
+            )
+        if diferencas:
+            raise CommandError(f'{len(diferencas)} contagem(ns) divergente(s); rode recalcular_estatisticas.')
+        self.stdout.write(self.style.SUCCESS('Estatísticas em dia.'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from pessoal.models import InformacoesPessoais
+from familiar.models import Filho
+from core.estatisticas import recalcular_estatisticas
+from core.versoes import registrar_alteracoes
+
+
+class Command(BaseCommand):
+    help = ('Recalcula as idades gravadas de servidores e filhos com UPDATEs em lote. '
+            'Deve rodar uma vez por dia (ex.: cron), logo após a meia-noite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true',
+                            help='Só informa quantos registros estão desatualizados, sem alterar nada.')
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        # (descrição, queryset, caminho até o id do usuário dono do registro)
+        alvos = [
+            ('servidores', InformacoesPessoais.objects.all(), 'usuario_id'),
+            ('filhos', Filho.objects.all(), 'info_familiar__usuario_id'),
+        ]
+
+        with transaction.atomic():
+            usuarios_afetados = set()
+            for descricao, queryset, campo_usuario in alvos:
+                desatualizados = queryset.desatualizados(hoje)
+                if options['simular']:
+                    alteradas = desatualizados.count()
+                else:
+                    usuarios_afetados.update(desatualizados.values_list(campo_usuario, flat=True))
+                    alteradas = queryset.recalcular_idades(hoje)
+                self.stdout.write(f'{descricao}: {alteradas} idade(s) desatualizada(s).')
+
+            if usuarios_afetados:
+                # UPDATEs em massa não disparam sinais: invalida os caches aqui
+                registrar_alteracoes(usuarios_afetados)
+                # As faixas etárias dependem da idade gravada
+                recalcular_estatisticas()
+
+        if not options['simular']:
+            self.stdout.write(self.style.SUCCESS(f'Idades recalculadas para {hoje:%d/%m/%Y}.'))
@@ -0,0 +1,345 @@
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Máximo de consultas por requisição de cada view. Acima disso a requisição
+# é registrada como estouro (e `limite_consultas` falha nos testes).
+ORCAMENTO_CONSULTAS = {
+    'admin_visualizacao': 6,
+    'detalhe_usuario': 8,
+    'estatisticas': 3,  # sessão, usuário e a tabela Estatistica
+    # POST que regrava as três seções; cada documento ou filho apagado e cada
+    # arquivo enviado soma consultas próprias e aparece como estouro
+    'perfil_usuario': 16,
+}
+
+# Views que leem a tabela em lotes (keyset): a mesma consulta se repete uma
+# vez por lote de propósito, então ficam fora da detecção de N+1 e não têm
+# orçamento fixo (o número de consultas cresce com o de servidores).
+VIEWS_EM_LOTES = {
+    'exportar_excel', 'exportar_plano', 'exportar_documentos', 'exportar_documentos_usuario', 'relatorio',
+}
+
+_CHAVE_CACHE = 'cadastro:metricas'
+_TAMANHO_SQL = 300
+_EXEMPLOS = 5
+
+_medicao_atual = contextvars.ContextVar('medicao_atual', default=None)
+
+
+class Medicao:
+    """
+    Consultas e tempos de uma requisição (ou de um bloco em `limite_consultas`).
+    A medição ativa fica numa ContextVar, que o asgiref copia para as threads
+    do sync_to_async: consultas feitas por views assíncronas também contam.
+    Medições aninhadas somam as consultas também na de fora.
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_render = 0.0
+        self.sqls = Counter()
+        self._renderizando = 0
+        self._externa = None
+
+    def _registrar(self, sql, duracao):
+        medicao = self
+        while medicao is not None:
+            medicao.consultas += 1
+            medicao.tempo_banco += duracao
+            medicao.sqls[sql] += 1
+            medicao = medicao._externa
+
+    def repetidas(self, limiar=None):
+        """
+        SQLs executados `limiar` vezes ou mais. Como os parâmetros ficam fora
+        do texto, a mesma consulta com ids diferentes conta como repetição:
+        é o padrão N+1 (uma consulta por item de uma lista).
+        """
+        limiar = limiar or settings.METRICAS_LIMIAR_REPETICAO
+        return {sql: n for sql, n in self.sqls.most_common() if n >= limiar}
+
+    @contextlib.contextmanager
+    def medir(self):
+        # connections.all() não abre conexões; as de outras threads recebem
+        # o wrapper ao conectar (connection_created)
+        for conexao in connections.all():
+            _instalar(conexao)
+        self._externa = _medicao_atual.get()
+        token = _medicao_atual.set(self)
+        try:
+            yield self
+        finally:
+            _medicao_atual.reset(token)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    # Wrapper fixo de todas as conexões (connection.execute_wrappers): só
+    # mede quando há uma medição ativa no contexto
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao._registrar(sql, time.perf_counter() - inicio)
+
+
+def _instalar(conexao):
+    # No início da lista: quem usa `with connection.execute_wrapper(...)`
+    # remove o último item ao sair, que continua sendo o dele
+    if _medir_consulta not in conexao.execute_wrappers:
+        conexao.execute_wrappers.insert(0, _medir_consulta)
+
+
+connection_created.connect(lambda sender, connection, **kwargs: _instalar(connection), weak=False)
+
+
+# --- Tempo de renderização ---
+
+class _TemplateMedido:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        if medicao is None or medicao._renderizando:
+            # Templates renderizados por tags (crispy) já entram no tempo da página
+            return self.template.render(context, request)
+        medicao._renderizando += 1
+        inicio = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            medicao.tempo_render += time.perf_counter() - inicio
+            medicao._renderizando -= 1
+
+
+class TemplatesMedidos(DjangoTemplates):
+    """Backend DjangoTemplates que soma o tempo de renderização na medição atual."""
+
+    def from_string(self, template_code):
+        return _TemplateMedido(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TemplateMedido(super().get_template(template_name))
+
+
+# --- Agregação ---
+
+class _Agregador:
+    """
+    Soma as medições por view na memória do processo e, a cada
+    METRICAS_INTERVALO segundos, junta a soma no cache. Com um cache
+    compartilhado (Redis) o endpoint enxerga todas as instâncias; a junção
+    não é atômica, então sob concorrência alta algumas amostras se perdem.
+    """
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._pendentes = {}
+        self._ultima_gravacao = time.monotonic()
+
+    def registrar(self, view, medicao, tempo_total, tamanho):
+        repetidas = {} if view in VIEWS_EM_LOTES else medicao.repetidas()
+        orcamento = ORCAMENTO_CONSULTAS.get(view)
+        with self._trava:
+            dados = self._pendentes.setdefault(view, _vazio())
+            dados['requisicoes'] += 1
+            dados['consultas'] += medicao.consultas
+            dados['consultas_max'] = max(dados['consultas_max'], medicao.consultas)
+            dados['tempo_banco'] += medicao.tempo_banco
+            dados['tempo_render'] += medicao.tempo_render
+            dados['tempo_total'] += tempo_total
+            dados['tempo_total_max'] = max(dados['tempo_total_max'], tempo_total)
+            if tamanho is not None:
+                dados['bytes'] += tamanho
+                dados['respostas_medidas'] += 1
+            if orcamento is not None and medicao.consultas > orcamento:
+                dados['acima_orcamento'] += 1
+            if repetidas:
+                dados['n_mais_1'] += 1
+                for sql, vezes in repetidas.items():
+                    _guardar_exemplo(dados['exemplos_n_mais_1'], sql, vezes)
+            gravar = time.monotonic() - self._ultima_gravacao >= settings.METRICAS_INTERVALO
+        if gravar:
+            self.gravar()
+
+    def gravar(self):
+        with self._trava:
+            pendentes, self._pendentes = self._pendentes, {}
+            self._ultima_gravacao = time.monotonic()
+        if not pendentes:
+            return
+        todas = cache.get(_CHAVE_CACHE) or {}
+        for view, dados in pendentes.items():
+            todas[view] = _somar(todas.get(view) or _vazio(), dados)
+        cache.set(_CHAVE_CACHE, todas, None)
+
+    def zerar(self):
+        with self._trava:
+            self._pendentes = {}
+        cache.delete(_CHAVE_CACHE)
+
+
+def _vazio():
+    return {
+        'requisicoes': 0, 'consultas': 0, 'consultas_max': 0,
+        'tempo_banco': 0.0, 'tempo_render': 0.0, 'tempo_total': 0.0, 'tempo_total_max': 0.0,
+        'bytes': 0, 'respostas_medidas': 0, 'acima_orcamento': 0,
+        'n_mais_1': 0, 'exemplos_n_mais_1': [],
+    }
+
+
+def _guardar_exemplo(exemplos, sql, vezes):
+    sql = sql[:_TAMANHO_SQL]
+    for exemplo in exemplos:
+        if exemplo['sql'] == sql:
+            exemplo['vezes'] = max(exemplo['vezes'], vezes)
+            return
+    if len(exemplos) < _EXEMPLOS:
+        exemplos.append({'sql': sql, 'vezes': vezes})
+
+
+def _somar(a, b):
+    resultado = dict(a)
+    for campo in ('requisicoes', 'consultas', 'tempo_banco', 'tempo_render', 'tempo_total',
+                  'bytes', 'respostas_medidas', 'acima_orcamento', 'n_mais_1'):
+        resultado[campo] = a[campo] + b[campo]
+    for campo in ('consultas_max', 'tempo_total_max'):
+        resultado[campo] = max(a[campo], b[campo])
+    resultado['exemplos_n_mais_1'] = list(a['exemplos_n_mais_1'])
+    for exemplo in b['exemplos_n_mais_1']:
+        _guardar_exemplo(resultado['exemplos_n_mais_1'], exemplo['sql'], exemplo['vezes'])
+    return resultado
+
+
+agregador = _Agregador()
+
+
+def resumo_metricas():
+    """Médias por view, para o endpoint de métricas (tempos em milissegundos)."""
+    agregador.gravar()
+    resumo = {}
+    for view, dados in sorted((cache.get(_CHAVE_CACHE) or {}).items()):
+        n = dados['requisicoes'] or 1
+        resumo[view] = {
+            'requisicoes': dados['requisicoes'],
+            'consultas_media': round(dados['consultas'] / n, 1),
+            'consultas_max': dados['consultas_max'],
+            'orcamento_consultas': ORCAMENTO_CONSULTAS.get(view),
+            'acima_orcamento': dados['acima_orcamento'],
+            'tempo_banco_ms': round(dados['tempo_banco'] * 1000 / n, 1),
+            'tempo_render_ms': round(dados['tempo_render'] * 1000 / n, 1),
+            'tempo_total_ms': round(dados['tempo_total'] * 1000 / n, 1),
+            'tempo_total_max_ms': round(dados['tempo_total_max'] * 1000, 1),
+            'bytes_media': round(dados['bytes'] / dados['respostas_medidas']) if dados['respostas_medidas'] else None,
+            'requisicoes_n_mais_1': dados['n_mais_1'],
+            'exemplos_n_mais_1': dados['exemplos_n_mais_1'],
+        }
+    return resumo
+
+
+class MetricasMiddleware:
+    """
+    Mede cada requisição: número de consultas e tempo no banco (via
+    connection.execute_wrapper), tempo de renderização (backend
+    TemplatesMedidos), tempo total e tamanho da resposta. Consultas
+    repetidas (N+1) e estouros de ORCAMENTO_CONSULTAS vão para o log.
+
+    Respostas em streaming são medidas só até o início do envio: o que é
+    consultado enquanto o corpo é gerado não entra na conta.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Sob ASGI a cadeia segue assíncrona até as views async (core.views_async)
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        if not settings.METRICAS:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with Medicao().medir() as medicao:
+            response = self.get_response(request)
+        return self._concluir(request, response, medicao, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        if not settings.METRICAS:
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        with Medicao().medir() as medicao:
+            response = await self.get_response(request)
+        return self._concluir(request, response, medicao, time.perf_counter() - inicio)
+
+    def _concluir(self, request, response, medicao, tempo_total):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'sem_rota'
+        tamanho = None if response.streaming else len(response.content)
+        agregador.registrar(view, medicao, tempo_total, tamanho)
+        self._avisar(view, medicao)
+
+        if settings.METRICAS_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={medicao.tempo_banco * 1000:.1f};desc="{medicao.consultas} consultas", '
+                f'render;dur={medicao.tempo_render * 1000:.1f}, '
+                f'total;dur={tempo_total * 1000:.1f}'
+            )
+        return response
+
+    def _avisar(self, view, medicao):
+        orcamento = ORCAMENTO_CONSULTAS.get(view)
+        if orcamento is not None and medicao.consultas > orcamento:
+            logger.warning('%s: %d consultas (orçamento: %d)', view, medicao.consultas, orcamento)
+        if view in VIEWS_EM_LOTES:
+            return
+        for sql, vezes in medicao.repetidas().items():
+            logger.warning('%s: possível N+1, consulta repetida %d vezes: %s', view, vezes, sql[:_TAMANHO_SQL])
+
+
+# --- Testes ---
+
+@contextlib.contextmanager
+def limite_consultas(maximo):
+    """
+    Falha (AssertionError) se o bloco fizer mais consultas que `maximo`,
+    listando as consultas repetidas. `maximo` pode ser o nome de uma view
+    de ORCAMENTO_CONSULTAS:
+
+        with limite_consultas('detalhe_usuario'):
+            self.client.get(reverse('detalhe_usuario', args=[usuario.id]))
+    """
+    if isinstance(maximo, str):
+        maximo = ORCAMENTO_CONSULTAS[maximo]
+    with Medicao().medir() as medicao:
+        yield medicao
+    if medicao.consultas > maximo:
+        repetidas = ''.join(f'\n  {vezes}x {sql}' for sql, vezes in medicao.repetidas(2).items())
+        raise AssertionError(
+            f'{medicao.consultas} consultas, acima do limite de {maximo}.'
+            + (f' Repetidas:{repetidas}' if repetidas else '')
+        )
@@ -0,0 +1,53 @@
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+# unaccent() não é IMMUTABLE e por isso não pode ser usada em índices;
+# f_unaccent() fixa o dicionário e pode.
+CRIAR_FUNCAO = """
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+$$ SELECT unaccent('unaccent'::regdictionary, $1) $$
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+"""
+
+INDICES = [
+    ('pessoal_nome_completo_trgm', 'pessoal_informacoespessoais', 'nome_completo'),
+    ('pessoal_cpf_trgm', 'pessoal_informacoespessoais', 'cpf'),
+    ('pessoal_email_trgm', 'pessoal_informacoespessoais', 'email'),
+    ('funcional_nome_guerra_trgm', 'funcional_informacoesfuncionais', 'nome_guerra'),
+    ('funcional_matricula_trgm', 'funcional_informacoesfuncionais', 'matricula'),
+]
+
+
+def criar_indices_busca(apps, schema_editor):
+    # Recursos exclusivos do PostgreSQL; em outros bancos a busca não usa índice
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CRIAR_FUNCAO)
+    for nome, tabela, coluna in INDICES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} '
+            f'USING gin (f_unaccent(lower({coluna})) gin_trgm_ops);'
+        )
+
+
+def remover_indices_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, _, _ in INDICES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nome};')
+    schema_editor.execute('DROP FUNCTION IF EXISTS f_unaccent(text);')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('pessoal', '0002_alter_informacoespessoais_cnh_categoria_and_more'),
+        ('funcional', '0004_informacoesfuncionais_posto_ordem_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunPython(criar_indices_busca, remover_indices_busca),
+    ]
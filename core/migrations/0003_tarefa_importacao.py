@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarefa',
+            name='resumo',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Resumo'),
+        ),
+        migrations.AlterField(
+            model_name='tarefa',
+            name='tipo',
+            field=models.CharField(choices=[('exportar_excel', 'Exportação para Planilha'), ('importar_servidores', 'Importação de Servidores')], max_length=50, verbose_name='Tipo'),
+        ),
+    ]
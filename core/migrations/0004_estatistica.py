@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+from core.estatisticas import recalcular_estatisticas
+
+
+def preencher_estatisticas(apps, schema_editor):
+    recalcular_estatisticas(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_tarefa_importacao'),
+        ('pessoal', '0003_informacoespessoais_foto_derivados'),
+        ('funcional', '0005_conteudo_deduplicado'),
+        ('familiar', '0002_alter_filho_data_nascimento_alter_filho_idade_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Estatistica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimensao', models.CharField(max_length=30, verbose_name='Dimensão')),
+                ('valor', models.CharField(blank=True, max_length=50, verbose_name='Valor')),
+                ('quantidade', models.BigIntegerField(default=0, verbose_name='Quantidade')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimensao', 'valor'), name='estatistica_dimensao_valor')],
+            },
+        ),
+        migrations.RunPython(preencher_estatisticas, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,71 @@
 from django.db import models
+from django.contrib.auth.models import User
 
-# Create your models here.
+
+class VersaoDados(models.Model):
+    """
+    Contador incrementado sempre que os dados cadastrais mudam. Permite saber,
+    sem varrer as tabelas, se um resultado já calculado ainda é válido.
+    """
+    chave = models.CharField("Chave", max_length=50, unique=True)
+    versao = models.PositiveBigIntegerField("Versão", default=0)
+
+    def __str__(self):
+        return f'{self.chave}: {self.versao}'
+
+
+class Tarefa(models.Model):
+    TIPO_CHOICES = [
+        ('exportar_excel', 'Exportação para Planilha'),
+        ('importar_servidores', 'Importação de Servidores'),
+    ]
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    tipo = models.CharField("Tipo", max_length=50, choices=TIPO_CHOICES)
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default='pendente')
+    progresso = models.PositiveSmallIntegerField("Progresso (%)", default=0)
+    parametros = models.JSONField("Parâmetros", default=dict, blank=True)
+    chave_cache = models.CharField("Chave de Cache", max_length=64, db_index=True)
+    arquivo = models.FileField("Arquivo", upload_to='tarefas/', blank=True)
+    nome_arquivo = models.CharField("Nome do Arquivo", max_length=255, blank=True)
+    mensagem_erro = models.TextField("Mensagem de Erro", blank=True)
+    # Números do resultado que a tela mostra sem abrir o arquivo (ex.: linhas importadas)
+    resumo = models.JSONField("Resumo", default=dict, blank=True)
+    solicitado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tarefas')
+    criada_em = models.DateTimeField("Criada em", auto_now_add=True)
+    iniciada_em = models.DateTimeField("Iniciada em", null=True, blank=True)
+    concluida_em = models.DateTimeField("Concluída em", null=True, blank=True)
+
+    class Meta:
+        ordering = ['-criada_em']
+        indexes = [
+            models.Index(fields=['status', 'criada_em']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_tipo_display()} #{self.pk} ({self.get_status_display()})'
+
+
+class Estatistica(models.Model):
+    """
+    Quantidade de registros por dimensão e valor (ex.: posto_graduacao =
+    major). Mantida pelos sinais de core.estatisticas a cada alteração e
+    refeita por inteiro pelo comando recalcular_estatisticas: a página de
+    estatísticas lê só estas poucas linhas, seja qual for o efetivo.
+    """
+    dimensao = models.CharField("Dimensão", max_length=30)
+    valor = models.CharField("Valor", max_length=50, blank=True)
+    quantidade = models.BigIntegerField("Quantidade", default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimensao', 'valor'], name='estatistica_dimensao_valor'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimensao}={self.valor}: {self.quantidade}'
@@ -0,0 +1,159 @@
+from django.core import signing
+from django.db import connections
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+
+TAMANHO_PAGINA = 50
+
+_SALT = 'core.paginacao'
+
+
+class Pagina:
+    def __init__(self, itens, cursor_proximo=None, cursor_anterior=None):
+        self.itens = itens
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def _depois_de(chaves, valores):
+    """
+    Condição "vem depois de `valores`" na ordenação crescente das chaves,
+    com os nulos no final: (k1 > v1) OU (k1 = v1 E k2 > v2) OU ...
+    """
+    condicao = Q(pk__in=[])
+    iguais = Q()
+    for chave, valor in zip(chaves, valores):
+        if valor is None:
+            # Nada vem depois de um nulo nesta chave; segue para a próxima
+            iguais &= Q(**{f'{chave}__isnull': True})
+            continue
+        condicao |= iguais & (Q(**{f'{chave}__gt': valor}) | Q(**{f'{chave}__isnull': True}))
+        iguais &= Q(**{chave: valor})
+    return condicao
+
+
+def _antes_de(chaves, valores):
+    """Condição inversa de `_depois_de`."""
+    condicao = Q(pk__in=[])
+    iguais = Q()
+    for chave, valor in zip(chaves, valores):
+        if valor is None:
+            condicao |= iguais & Q(**{f'{chave}__isnull': False})
+            iguais &= Q(**{f'{chave}__isnull': True})
+            continue
+        condicao |= iguais & Q(**{f'{chave}__lt': valor})
+        iguais &= Q(**{chave: valor})
+    return condicao
+
+
+def _linha(expressoes):
+    # (a, b, c) no SQL: a comparação de linhas vira um único intervalo do índice composto
+    return Func(*expressoes, function='', output_field=Field())
+
+
+def _comparar_linhas(lookup, chaves, valores):
+    """Condição (k1, k2, ...) > ou < (v1, v2, ...), para chaves não nulas."""
+    return lookup(_linha([F(chave) for chave in chaves]), _linha([Value(valor) for valor in valores]))
+
+
+def _cursor(item, chaves):
+    return signing.dumps([getattr(item, chave) for chave in chaves], salt=_SALT)
+
+
+def _ler_cursor(cursor, chaves):
+    try:
+        valores = signing.loads(cursor, salt=_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(valores, list) or len(valores) != len(chaves):
+        return None
+    return valores
+
+
+def paginar_keyset(queryset, chaves, depois=None, antes=None, tamanho=TAMANHO_PAGINA, nulas=True):
+    """
+    Pagina `queryset` por "seek" (keyset) em vez de OFFSET.
+
+    `chaves` é a lista de campos (ou anotações) da ordenação, todos crescentes
+    e com nulos no final; a última deve ser única (ex.: 'id'). Cada página é
+    buscada a partir dos valores do último item visto, então o custo é o
+    mesmo na primeira página ou na quingentésima.
+
+    Com `nulas=False` (nenhuma chave pode ser nula), a página seguinte é
+    buscada com uma comparação de linhas, (k1, k2) > (v1, v2), e a ordem não
+    trata nulos: com um índice nas mesmas chaves, cada página é uma leitura
+    contínua do índice, sem os OR da versão com nulos.
+
+    `depois` e `antes` são os cursores devolvidos em `Pagina.cursor_proximo`
+    e `Pagina.cursor_anterior`.
+    """
+    valores_depois = _ler_cursor(depois, chaves) if depois else None
+    valores_antes = _ler_cursor(antes, chaves) if antes and not valores_depois else None
+
+    if valores_antes is not None:
+        if nulas:
+            ordem = [F(chave).desc(nulls_first=True) for chave in chaves]
+            condicao = _antes_de(chaves, valores_antes)
+        else:
+            ordem = [F(chave).desc() for chave in chaves]
+            condicao = _comparar_linhas(LessThan, chaves, valores_antes)
+        itens = list(queryset.filter(condicao).order_by(*ordem)[:tamanho + 1])
+        tem_anterior = len(itens) > tamanho
+        itens = itens[:tamanho][::-1]
+        tem_proximo = True
+    else:
+        ordem = [F(chave).asc(nulls_last=True) if nulas else F(chave).asc() for chave in chaves]
+        if valores_depois is not None:
+            queryset = queryset.filter(
+                _depois_de(chaves, valores_depois) if nulas
+                else _comparar_linhas(GreaterThan, chaves, valores_depois)
+            )
+        itens = list(queryset.order_by(*ordem)[:tamanho + 1])
+        tem_proximo = len(itens) > tamanho
+        itens = itens[:tamanho]
+        tem_anterior = valores_depois is not None
+
+    if not itens:
+        return Pagina(itens)
+    return Pagina(
+        itens,
+        cursor_proximo=_cursor(itens[-1], chaves) if tem_proximo else None,
+        cursor_anterior=_cursor(itens[0], chaves) if tem_anterior else None,
+    )
+
+
+def cursor_no_servidor(queryset):
+    """
+    Se `.iterator()` busca as linhas aos poucos nesta consulta. No PostgreSQL
+    isso depende de um cursor no servidor, desligado atrás do PgBouncer em
+    modo transação (DISABLE_SERVER_SIDE_CURSORS): sem ele, o driver traz o
+    resultado inteiro para a memória de uma vez.
+    """
+    conexao = connections[queryset.db]
+    return conexao.vendor != 'postgresql' or not conexao.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS')
+
+
+def percorrer_keyset(queryset, chaves, tamanho, valores_de=None):
+    """
+    Percorre `queryset` inteiro em lotes de `tamanho`, cada um buscado a
+    partir do último item do anterior (mesmas regras de `paginar_keyset`).
+    Cada lote é uma consulta independente, então funciona sem cursor no
+    servidor. `valores_de(item)` devolve os valores das chaves de um item
+    (padrão: os atributos de mesmo nome).
+    """
+    valores_de = valores_de or (lambda item: [getattr(item, chave) for chave in chaves])
+    ordem = [F(chave).asc(nulls_last=True) for chave in chaves]
+    valores = None
+    while True:
+        lote = queryset if valores is None else queryset.filter(_depois_de(chaves, valores))
+        itens = list(lote.order_by(*ordem)[:tamanho])
+        yield from itens
+        if len(itens) < tamanho:
+            return
+        valores = list(valores_de(itens[-1]))
@@ -0,0 +1,215 @@
+"""
+Relatórios por período: CNHs que vencem nos próximos dias, filhos que
+completam certas idades num ano e aniversariantes dos próximos dias.
+
+Cada relatório é um filtro de intervalo sobre uma coluna de data indexada
+(ver os índices de pessoal e familiar), ordenado pela mesma expressão do
+índice. Assim o banco lê só as linhas da janela, já na ordem, e o
+resultado pode ser transmitido (HTML ou CSV) enquanto é lido.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais
+from familiar.models import Filho
+from .idades import mes_dia
+from .paginacao import cursor_no_servidor, percorrer_keyset
+
+# Linhas lidas por vez do banco (cursor no servidor ou keyset)
+TAMANHO_LOTE_RELATORIO = 1000
+
+# Linhas da tabela HTML por bloco enviado: o navegador mostra as primeiras
+# enquanto as demais ainda estão sendo lidas
+TAMANHO_BLOCO_HTML = 200
+
+_POSTOS = dict(InformacoesFuncionais.POSTO_CHOICES)
+
+
+def _data(valor):
+    return valor.strftime('%d/%m/%Y') if valor else ''
+
+
+def _aniversario(valor):
+    # MMDD de `mes_dia` (no PostgreSQL chega como Decimal)
+    valor = int(valor)
+    return f'{valor % 100:02d}/{valor // 100:02d}'
+
+
+def _inteiro(texto, padrao, minimo, maximo):
+    """Parâmetro inteiro da URL; ValueError se inválido ou fora dos limites."""
+    if texto in (None, ''):
+        return padrao
+    valor = int(texto)
+    if not minimo <= valor <= maximo:
+        raise ValueError(f'{valor} fora do intervalo {minimo}-{maximo}.')
+    return valor
+
+
+def _servidor(prefixo):
+    # Colunas do servidor dono do registro, a partir de `prefixo` (caminho até o User)
+    return [
+        ('Nome', f'{prefixo}info_pessoais__nome_completo', None),
+        ('Matrícula', f'{prefixo}info_funcionais__matricula', None),
+        ('Posto/Graduação', f'{prefixo}info_funcionais__posto_graduacao', _POSTOS.get),
+    ]
+
+
+class Relatorio:
+    """
+    Um relatório: título, colunas (cabeçalho, campo, formatação opcional) e
+    `consultar(parametros, hoje)`, que devolve a consulta já filtrada e as
+    chaves da ordenação (usadas também para percorrer por keyset).
+    """
+
+    def __init__(self, titulo, descricao, colunas, consultar, parametros):
+        self.titulo = titulo
+        self.descricao = descricao
+        self.colunas = colunas
+        self.consultar = consultar
+        # {nome: (rótulo, padrão, mínimo, máximo)}; padrão None = calculado na hora
+        self.parametros = parametros
+
+    def ler_parametros(self, dados):
+        """Parâmetros de `dados` (ex.: request.GET). ValueError se inválidos."""
+        return {
+            nome: _inteiro(dados.get(nome), padrao, minimo, maximo)
+            for nome, (_, padrao, minimo, maximo) in self.parametros.items()
+        }
+
+    def linhas(self, parametros, hoje=None):
+        """
+        Iterador com uma tupla de valores já formatados por registro, na ordem
+        das colunas. A consulta é montada aqui, antes de a resposta começar.
+        """
+        consulta, chaves = self.consultar(parametros, hoje or timezone.localdate())
+        campos = [campo for _, campo, _ in self.colunas]
+        if cursor_no_servidor(consulta):
+            linhas = consulta.order_by(*chaves).values_list(*campos).iterator(chunk_size=TAMANHO_LOTE_RELATORIO)
+        else:
+            # As chaves vão no fim de cada linha, para achar o próximo lote
+            linhas = percorrer_keyset(
+                consulta.values_list(*campos, *chaves), chaves, TAMANHO_LOTE_RELATORIO,
+                valores_de=lambda linha: linha[len(campos):],
+            )
+        formatos = [formatar for _, _, formatar in self.colunas]
+        return (
+            tuple(formatar(valor) if formatar and valor is not None else valor
+                  for valor, formatar in zip(linha, formatos))
+            for linha in linhas
+        )
+
+    @property
+    def cabecalho(self):
+        return [titulo for titulo, _, _ in self.colunas]
+
+
+def html_em_blocos(linhas, colunas, tamanho=TAMANHO_BLOCO_HTML):
+    """Gera as linhas <tr> da tabela de um relatório em blocos de texto."""
+    bloco = []
+    total = 0
+    for linha in linhas:
+        bloco.append(format_html(
+            '<tr>{}</tr>', format_html_join('', '<td>{}</td>', (('' if v is None else v,) for v in linha)),
+        ))
+        total += 1
+        if len(bloco) >= tamanho:
+            yield ''.join(bloco)
+            bloco = []
+    if not total:
+        bloco.append(format_html(
+            '<tr><td colspan="{}" class="text-center text-muted">Nenhum registro no período.</td></tr>', colunas,
+        ))
+    yield ''.join(bloco)
+
+
+def _cnh_vencendo(parametros, hoje):
+    fim = hoje + timedelta(days=parametros['dias'])
+    consulta = InformacoesPessoais.objects.filter(
+        usuario__is_superuser=False, cnh_validade__range=(hoje, fim),
+    )
+    return consulta, ['cnh_validade', 'id']
+
+
+def _filhos_por_idade(parametros, hoje):
+    ano = parametros['ano'] or hoje.year
+    idades = sorted({parametros['idade'], parametros['outra_idade']} - {0})
+    # Quem completa N anos em `ano` nasceu em `ano` - N: um intervalo por idade
+    nascidos = Q(pk__in=[])
+    for idade in idades:
+        nascidos |= Q(data_nascimento__range=(date(ano - idade, 1, 1), date(ano - idade, 12, 31)))
+    consulta = Filho.objects.filter(
+        nascidos, info_familiar__usuario__is_superuser=False,
+    ).annotate(idade_no_ano=Value(ano) - ExtractYear('data_nascimento'))
+    return consulta, ['data_nascimento', 'id']
+
+
+def _aniversariantes(parametros, hoje):
+    inicio = hoje.month * 100 + hoje.day
+    fim_data = hoje + timedelta(days=parametros['dias'])
+    fim = fim_data.month * 100 + fim_data.day
+    consulta = InformacoesPessoais.objects.filter(usuario__is_superuser=False)
+    consulta = consulta.annotate(aniversario=mes_dia('data_nascimento'))
+    # Os intervalos já deixam de fora quem não tem data de nascimento
+    if fim_data.year == hoje.year:
+        consulta = consulta.filter(aniversario__range=(inicio, fim))
+    elif parametros['dias'] < 365:
+        # A janela passa do fim do ano: dois intervalos do mesmo índice
+        consulta = consulta.filter(Q(aniversario__gte=inicio) | Q(aniversario__lte=fim))
+    else:
+        consulta = consulta.filter(data_nascimento__isnull=False)
+    # Os de janeiro, quando a janela vira o ano, vêm depois dos de dezembro
+    consulta = consulta.annotate(
+        proximo_ano=Case(When(aniversario__lt=inicio, then=Value(1)), default=Value(0), output_field=IntegerField()),
+    ).annotate(
+        idade_completa=Value(hoje.year) + F('proximo_ano') - ExtractYear('data_nascimento'),
+    )
+    return consulta, ['proximo_ano', 'aniversario', 'id']
+
+
+RELATORIOS = {
+    'cnh_vencendo': Relatorio(
+        'CNHs vencendo',
+        'Servidores cuja CNH vence de hoje até os próximos dias.',
+        [
+            ('Validade da CNH', 'cnh_validade', _data),
+            *_servidor('usuario__'),
+            ('Nº da CNH', 'cnh_numero', None),
+            ('Categoria', 'cnh_categoria', None),
+        ],
+        _cnh_vencendo,
+        {'dias': ('Próximos dias', 60, 1, 3660)},
+    ),
+    'filhos_idade': Relatorio(
+        'Filhos completando idade',
+        'Filhos que completam as idades informadas no ano (ex.: 18 e 24 anos).',
+        [
+            ('Filho(a)', 'nome', None),
+            ('Data de Nascimento', 'data_nascimento', _data),
+            ('Idade no ano', 'idade_no_ano', None),
+            *_servidor('info_familiar__usuario__'),
+        ],
+        _filhos_por_idade,
+        {
+            'idade': ('Idade', 18, 0, 120),
+            'outra_idade': ('Outra idade (0 = nenhuma)', 24, 0, 120),
+            'ano': ('Ano', None, 1900, 2200),
+        },
+    ),
+    'aniversariantes': Relatorio(
+        'Aniversariantes',
+        'Servidores que fazem aniversário de hoje até os próximos dias.',
+        [
+            ('Aniversário', 'aniversario', _aniversario),
+            *_servidor('usuario__'),
+            ('Data de Nascimento', 'data_nascimento', _data),
+            ('Idade que completa', 'idade_completa', None),
+        ],
+        _aniversariantes,
+        {'dias': ('Próximos dias', 30, 0, 366)},
+    ),
+}
@@ -0,0 +1,95 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais, Documento
+from familiar.models import InformacoesFamiliares, Filho
+from .autenticacao import esquecer_usuarios
+from .estatisticas import ajustar_estatisticas, campos_estatisticas, valores_estatisticas
+from .versoes import agendar_alteracao
+
+
+def _usuario_id(instance):
+    """Descobre a qual usuário pertence o registro alterado."""
+    if isinstance(instance, User):
+        return instance.pk
+    if isinstance(instance, Documento):
+        campo = 'info_funcional'
+    elif isinstance(instance, Filho):
+        campo = 'info_familiar'
+    else:
+        return instance.usuario_id
+
+    field = instance._meta.get_field(campo)
+    if field.is_cached(instance):
+        return getattr(instance, campo).usuario_id
+    return field.related_model.objects.filter(
+        pk=getattr(instance, field.attname)
+    ).values_list('usuario_id', flat=True).first()
+
+
+def dados_cadastrais_alterados(sender, instance, **kwargs):
+    agendar_alteracao(_usuario_id(instance))
+
+
+def usuario_alterado(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    # Senha, is_active e is_superuser valem já na próxima requisição
+    esquecer_usuarios(instance.pk)
+    # O login só atualiza last_login, que não aparece em nenhuma tela
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    if not instance.is_superuser and not raw:
+        # O painel lista os servidores a partir da seção funcional
+        # (core.consultas): vale para os novos e para administradores que
+        # deixaram de sê-lo. Fixtures (raw) trazem as próprias seções.
+        InformacoesFuncionais.objects.get_or_create(usuario=instance)
+    agendar_alteracao(instance.pk)
+
+
+def usuario_excluido(sender, instance, **kwargs):
+    esquecer_usuarios(instance.pk)
+    agendar_alteracao(instance.pk)
+
+
+def guardar_estatisticas_anteriores(sender, instance, update_fields=None, **kwargs):
+    # Lê do banco os valores antes do save, para tirar o registro da contagem antiga
+    campos = campos_estatisticas(sender)
+    if not campos or instance._state.adding or (update_fields is not None and not set(update_fields) & set(campos)):
+        instance._estatisticas_anteriores = None
+        return
+    instance._estatisticas_anteriores = sender._default_manager.filter(pk=instance.pk).values(*campos).first()
+
+
+def estatisticas_salvas(sender, instance, created, **kwargs):
+    anteriores = getattr(instance, '_estatisticas_anteriores', None)
+    if not created and anteriores is None:
+        # Nenhum campo contado pode ter mudado
+        return
+    variacoes = Counter(valores_estatisticas(sender, instance))
+    if not created:
+        variacoes.subtract(valores_estatisticas(sender, anteriores))
+    ajustar_estatisticas(variacoes)
+
+
+def estatisticas_excluidas(sender, instance, **kwargs):
+    variacoes = Counter(valores_estatisticas(sender, instance))
+    ajustar_estatisticas({chave: -delta for chave, delta in variacoes.items()})
+
+
+# Modelos cujos dados aparecem nas exportações e nas telas do painel
+MODELOS_CADASTRAIS = (InformacoesPessoais, InformacoesFuncionais, Documento, InformacoesFamiliares, Filho)
+
+for modelo in MODELOS_CADASTRAIS:
+    post_save.connect(dados_cadastrais_alterados, sender=modelo)
+    post_delete.connect(dados_cadastrais_alterados, sender=modelo)
+
+post_save.connect(usuario_alterado, sender=User)
+post_delete.connect(usuario_excluido, sender=User)
+
+# Modelos contados na tabela Estatistica (ver core.estatisticas)
+for modelo in (InformacoesPessoais, InformacoesFuncionais, Filho):
+    pre_save.connect(guardar_estatisticas_anteriores, sender=modelo)
+    post_save.connect(estatisticas_salvas, sender=modelo)
+    post_delete.connect(estatisticas_excluidas, sender=modelo)
@@ -0,0 +1,160 @@
+"""
+Servidores sintéticos para desenvolvimento e para o benchmark: cadastros
+completos (três seções, filhos, documentos e foto) gravados em lote.
+"""
+import io
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from pessoal.models import InformacoesPessoais
+from funcional.models import InformacoesFuncionais, Documento
+from funcional.conteudo import armazenar_arquivo
+from familiar.models import InformacoesFamiliares, Filho
+from .estatisticas import recalcular_estatisticas
+from .versoes import registrar_alteracao
+
+PREFIXO_PADRAO = 'sintetico'
+_BASE_CPF = 9 * 10 ** 10
+TAMANHO_LOTE_SINTETICOS = 1000
+
+# Distribuição aproximada de um efetivo: poucos oficiais, muitas praças
+PESOS_POSTO = {
+    'coronel': 1, 'tenente_coronel': 2, 'major': 4, 'capitao': 6, 'tenente': 8,
+    'aspirante': 2, 'subtenente': 5, 'sargento': 20, 'cabo': 22, 'soldado': 30,
+}
+NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sabrina', 'Thiago', 'Vanessa', 'Wagner',
+]
+SOBRENOMES = [
+    'Almeida', 'Barbosa', 'Cardoso', 'Costa', 'Ferreira', 'Gomes', 'Lima', 'Martins', 'Oliveira', 'Pereira',
+    'Ribeiro', 'Rocha', 'Santos', 'Silva', 'Souza',
+]
+CIDADES = ['Salvador', 'Feira de Santana', 'Vitória da Conquista', 'Camaçari', 'Itabuna', 'Juazeiro']
+DOCUMENTOS = ['RG', 'CPF', 'CNH', 'Comprovante de Residência', 'Certidão de Casamento', 'Diploma']
+
+
+def _data(aleatorio, anos_min, anos_max):
+    hoje = date.today()
+    return hoje - timedelta(days=aleatorio.randint(anos_min * 365, anos_max * 365))
+
+
+def _foto_sintetica():
+    # Uma única foto para todos: basta para exercitar miniaturas e listagens
+    from PIL import Image
+
+    nome = 'fotos_pessoais/sintetico.jpg'
+    if default_storage.exists(nome):
+        return nome
+    tamanho = (800, 800)
+    imagem = Image.merge('RGB', [
+        Image.linear_gradient('L').resize(tamanho),
+        Image.radial_gradient('L').resize(tamanho),
+        Image.new('L', tamanho, 128),
+    ])
+    saida = io.BytesIO()
+    imagem.save(saida, 'JPEG', quality=85)
+    return default_storage.save(nome, ContentFile(saida.getvalue()))
+
+
+def _conteudo_sintetico():
+    # Todos os documentos apontam para o mesmo conteúdo (deduplicado)
+    corpo = b'%PDF-1.4\n% documento sintetico\n' + b'0' * 32 * 1024 + b'\n%%EOF\n'
+    return armazenar_arquivo(ContentFile(corpo, name='sintetico.pdf'))
+
+
+def gerar_servidores(quantidade, prefixo=PREFIXO_PADRAO, filhos_max=3, documentos_max=3,
+                     com_foto=True, semente=None, tamanho_lote=TAMANHO_LOTE_SINTETICOS, ao_progredir=None):
+    """
+    Cria `quantidade` servidores sintéticos, com usernames `<prefixo>_000001`
+    em diante (continua a numeração dos que já existem). Cada lote é gravado
+    com bulk_create numa transação. Devolve a quantidade criada.
+    """
+    aleatorio = random.Random(semente)
+    postos, pesos = zip(*PESOS_POSTO.items())
+    inicio = User.objects.filter(username__startswith=f'{prefixo}_').count()
+    # CPF e matrícula são únicos entre todos os prefixos: continuam do maior
+    # CPF sintético (faixa própria, começando em 9, para não colidir com os reais)
+    ultimo_cpf = (
+        InformacoesPessoais.objects.filter(cpf__startswith=str(_BASE_CPF)[0])
+        .order_by('-cpf').values_list('cpf', flat=True).first()
+    )
+    serial = int(''.join(c for c in ultimo_cpf if c.isdigit())) - _BASE_CPF if ultimo_cpf else 0
+    foto = _foto_sintetica() if com_foto else None
+    conteudo = _conteudo_sintetico() if documentos_max else None
+
+    criados = 0
+    while criados < quantidade:
+        numeros = range(inicio + criados + 1, inicio + min(criados + tamanho_lote, quantidade) + 1)
+        with transaction.atomic():
+            usuarios = User.objects.bulk_create([
+                User(username=f'{prefixo}_{n:06d}', password='!') for n in numeros
+            ])
+            pessoais, funcionais, familiares = [], [], []
+            for n, usuario in zip(numeros, usuarios):
+                serial += 1
+                nome = f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}'
+                cpf = f'{_BASE_CPF + serial:011d}'
+                pessoais.append(InformacoesPessoais(
+                    usuario=usuario, nome_completo=nome, foto=foto,
+                    cpf=f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}',
+                    email=f'{usuario.username}@sintetico.invalid',
+                    data_nascimento=_data(aleatorio, 20, 58),
+                    telefone=f'(71) 9{aleatorio.randint(1000, 9999)}-{aleatorio.randint(1000, 9999)}',
+                    estado_civil=aleatorio.choice(InformacoesPessoais.ESTADO_CIVIL_CHOICES)[0],
+                    escolaridade=aleatorio.choice(InformacoesPessoais.ESCOLARIDADE_CHOICES)[0],
+                    cnh_categoria=aleatorio.choice(['', 'A', 'B', 'AB', 'D']),
+                    cnh_validade=_data(aleatorio, -5, 2),
+                ))
+                funcionais.append(InformacoesFuncionais(
+                    usuario=usuario, nome_guerra=nome.split()[0], matricula=f'S{serial:07d}',
+                    posto_graduacao=aleatorio.choices(postos, pesos)[0],
+                    data_admissao=_data(aleatorio, 0, 35),
+                    banco='001', agencia=f'{aleatorio.randint(1000, 9999)}',
+                    conta_corrente=f'{aleatorio.randint(10000, 99999)}-{aleatorio.randint(0, 9)}',
+                ))
+                familiares.append(InformacoesFamiliares(
+                    usuario=usuario, endereco=f'Rua {aleatorio.choice(SOBRENOMES)}',
+                    numero_casa=str(aleatorio.randint(1, 999)), bairro='Centro',
+                    cidade=aleatorio.choice(CIDADES),
+                    cep=f'4{aleatorio.randint(0, 9999):04d}-{aleatorio.randint(0, 999):03d}',
+                ))
+            InformacoesPessoais.objects.bulk_create(pessoais)
+            funcionais = InformacoesFuncionais.objects.bulk_create(funcionais)
+            familiares = InformacoesFamiliares.objects.bulk_create(familiares)
+
+            Filho.objects.bulk_create([
+                Filho(info_familiar=familiar, nome=f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}',
+                      data_nascimento=_data(aleatorio, 0, 25))
+                for familiar in familiares for _ in range(aleatorio.randint(0, filhos_max))
+            ])
+            if conteudo is not None:
+                Documento.objects.bulk_create([
+                    Documento(info_funcional=funcional, nome_documento=nome_documento,
+                              arquivo=conteudo.arquivo.name, conteudo=conteudo)
+                    for funcional in funcionais
+                    for nome_documento in aleatorio.sample(DOCUMENTOS, aleatorio.randint(0, documentos_max))
+                ])
+        criados += len(usuarios)
+        if ao_progredir:
+            ao_progredir(criados)
+
+    # Usuários novos não têm nada em cache: basta a versão global
+    registrar_alteracao()
+    recalcular_estatisticas()
+    return criados
+
+
+def remover_servidores(prefixo=PREFIXO_PADRAO):
+    """Apaga os servidores sintéticos com esse prefixo. Devolve quantos eram."""
+    usuarios = User.objects.filter(username__startswith=f'{prefixo}_', password='!')
+    quantidade = usuarios.count()
+    with transaction.atomic():
+        usuarios.delete()
+        registrar_alteracao()
+    return quantidade
@@ -0,0 +1,157 @@
+import hashlib
+import io
+import json
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Tarefa
+from .versoes import versao_atual
+from .exportacao import planilha_excel_temporaria
+from .importacao import importar_servidores, relatorio_csv
+from .armazenamento import ler_em_blocos
+
+
+def _exportar_excel(tarefa, reportar):
+    return 'cadastros_usuarios.xlsx', planilha_excel_temporaria(ao_progredir=reportar)
+
+
+def _importar_servidores(tarefa, reportar):
+    # O arquivo enviado é copiado do storage em blocos: o XLSX precisa de um
+    # arquivo posicionável, e assim ele não fica inteiro na memória
+    nome = tarefa.parametros['arquivo']
+    try:
+        with tempfile.TemporaryFile() as copia:
+            for bloco in ler_em_blocos(nome):
+                copia.write(bloco)
+            copia.seek(0)
+            resultado = importar_servidores(copia, nome, simular=tarefa.parametros.get('simular', False))
+    finally:
+        default_storage.delete(nome)
+
+    tarefa.resumo = resultado.como_dict()
+    relatorio = tempfile.TemporaryFile()
+    texto = io.TextIOWrapper(relatorio, encoding='utf-8-sig', newline='')
+    relatorio_csv(resultado, texto)
+    texto.flush()
+    texto.detach()
+    relatorio.seek(0)
+    return 'relatorio_importacao.csv', relatorio
+
+
+# Cada tipo de tarefa recebe a tarefa e uma função para reportar o progresso
+# (processados, total) e devolve (nome do arquivo, arquivo aberto).
+EXECUTORES = {
+    'exportar_excel': _exportar_excel,
+    'importar_servidores': _importar_servidores,
+}
+
+
+def calcular_chave_cache(tipo, parametros):
+    """
+    Identifica o resultado de uma tarefa a partir do tipo, dos parâmetros e
+    da versão atual dos dados. Enquanto os dados não mudarem, a chave é a mesma
+    e o arquivo já gerado pode ser reaproveitado.
+    """
+    conteudo = json.dumps([tipo, parametros, versao_atual()], sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def solicitar_tarefa(tipo, usuario=None, parametros=None):
+    """
+    Enfileira uma tarefa, ou devolve uma equivalente que já esteja na fila ou
+    concluída com os dados atuais.
+    """
+    parametros = parametros or {}
+    chave = calcular_chave_cache(tipo, parametros)
+
+    existente = Tarefa.objects.filter(
+        tipo=tipo, chave_cache=chave, status__in=['pendente', 'executando', 'concluida']
+    ).order_by('-criada_em').first()
+    if existente:
+        return existente
+
+    return Tarefa.objects.create(tipo=tipo, parametros=parametros, chave_cache=chave, solicitado_por=usuario)
+
+
+def reservar_proxima_tarefa():
+    """
+    Marca a tarefa pendente mais antiga como em execução e a devolve.
+    Usa SKIP LOCKED para que vários workers possam rodar ao mesmo tempo.
+    """
+    with transaction.atomic():
+        tarefa = Tarefa.objects.select_for_update(skip_locked=True).filter(
+            status='pendente'
+        ).order_by('criada_em').first()
+        if tarefa is None:
+            return None
+        tarefa.status = 'executando'
+        tarefa.iniciada_em = timezone.now()
+        tarefa.save(update_fields=['status', 'iniciada_em'])
+    return tarefa
+
+
+def reenfileirar_travadas(minutos):
+    """
+    Devolve para a fila as tarefas em execução há mais de `minutos` (o
+    worker caiu ou a função estourou o tempo). Devolve quantas eram.
+    """
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return Tarefa.objects.filter(status='executando', iniciada_em__lt=limite).update(
+        status='pendente', progresso=0, iniciada_em=None
+    )
+
+
+def processar_pendentes(segundos=None):
+    """
+    Executa as tarefas pendentes, uma por vez, até a fila esvaziar ou, com
+    `segundos`, até passar esse tempo (nenhuma tarefa nova começa depois
+    disso). Devolve as tarefas executadas.
+    """
+    inicio = time.monotonic()
+    executadas = []
+    while segundos is None or time.monotonic() - inicio < segundos:
+        tarefa = reservar_proxima_tarefa()
+        if tarefa is None:
+            break
+        executadas.append(executar_tarefa(tarefa))
+    return executadas
+
+
+def executar_tarefa(tarefa):
+    def reportar(processados, total):
+        if total:
+            progresso = min(99, int(processados * 100 / total))
+            Tarefa.objects.filter(pk=tarefa.pk).update(progresso=progresso)
+
+    try:
+        nome_arquivo, arquivo = EXECUTORES[tarefa.tipo](tarefa, reportar)
+        with arquivo:
+            tarefa.arquivo.save(nome_arquivo, File(arquivo), save=False)
+    except Exception:
+        tarefa.status = 'erro'
+        tarefa.mensagem_erro = traceback.format_exc()
+        tarefa.concluida_em = timezone.now()
+        tarefa.save(update_fields=['status', 'mensagem_erro', 'concluida_em'])
+        return tarefa
+
+    tarefa.status = 'concluida'
+    tarefa.progresso = 100
+    tarefa.nome_arquivo = nome_arquivo
+    tarefa.concluida_em = timezone.now()
+    tarefa.save(update_fields=['status', 'progresso', 'arquivo', 'nome_arquivo', 'resumo', 'concluida_em'])
+
+    # Remove os arquivos de execuções anteriores, que já não refletem os dados
+    antigas = Tarefa.objects.filter(
+        tipo=tarefa.tipo, parametros=tarefa.parametros, status='concluida'
+    ).exclude(pk=tarefa.pk)
+    for antiga in antigas:
+        antiga.arquivo.delete(save=False)
+    antigas.delete()
+    return tarefa
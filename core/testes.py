@@ -0,0 +1,48 @@
+"""
+Ajustes comuns aos testes das apps (os tests.py de cada uma).
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.urls import include, path
+
+from . import views_async
+from .urls import rotas
+
+# Arquivos em memória (nada vai para o MEDIA_ROOT nem para o bucket: o
+# rollback do banco não desfaria essas gravações) e estáticos sem manifest
+# (os testes não rodam collectstatic).
+STORAGES_TESTES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+armazenamento_de_testes = override_settings(STORAGES=STORAGES_TESTES)
+
+
+class ExecutorTestes(DiscoverRunner):
+    """
+    O executor do manage.py test (TEST_RUNNER). Liga o que vale para todos
+    os testes, com VIEWS_ASYNC ligado ou não: as consultas das views
+    assíncronas rodam na thread da requisição, dentro da transação do
+    TestCase (ver core.views_async).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.VIEWS_ASYNC_PARALELO = False
+
+
+class UrlsAsync:
+    """
+    As rotas do projeto com as telas de leitura de core.views_async, como
+    com VIEWS_ASYNC ligado, qualquer que seja o ambiente dos testes.
+    """
+    urlpatterns = [
+        path('admin/', admin.site.urls),
+        path('', include(rotas(views_async))),
+    ]
+
+
+rotas_async = override_settings(ROOT_URLCONF=UrlsAsync)
@@ -1,3 +1,970 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import unittest
+import zipfile
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from pessoal.forms import InformacoesPessoaisForm
+from funcional.forms import InformacoesFuncionaisForm
+from familiar.forms import InformacoesFamiliaresForm
+from pessoal.models import InformacoesPessoais
+from funcional.models import Documento, InformacoesFuncionais
+from familiar.models import Filho, InformacoesFamiliares
+from funcional.conteudo import armazenar_arquivo
+from .consultas import (
+    CHAVES_HIERARQUIA, carregar_servidor, com_chaves_hierarquia, ordenar_por_hierarquia, paginar_servidores,
+    secoes_servidor,
+)
+from .estatisticas import contar_estatisticas
+from .autenticacao import BackendComCache
+from .busca import buscar_servidores, normalizar_termo
+from .cache import _chave, em_cache
+from .exportacao import (
+    COLUNAS_PLANAS, _nome_seguro, gerar_zip_documentos, linhas_planas, planilha_excel_temporaria,
+)
+from .importacao import importar_servidores
+from .metricas import limite_consultas
+from .models import Estatistica
+from .paginacao import _SALT, TAMANHO_PAGINA, paginar_keyset
+from .relatorios import RELATORIOS
+from .sinteticos import gerar_servidores
+from .testes import STORAGES_TESTES, armazenamento_de_testes, rotas_async
+from .uploads import _SALT as _SALT_UPLOADS, confirmar_upload, preparar_upload
+from .versoes import agendar_alteracao, registrar_alteracao, registrar_alteracoes, versao_atual, versao_usuario
+
+
+def _dados_perfil(usuario):
+    # O POST do perfil reenviando os dados atuais, como o navegador faria
+    dados = {}
+    for classe, instancia in zip(
+        (InformacoesPessoaisForm, InformacoesFuncionaisForm, InformacoesFamiliaresForm),
+        secoes_servidor(carregar_servidor(usuario.id)),
+    ):
+        formulario = classe(instance=instancia)
+        for nome, campo in formulario.fields.items():
+            valor = formulario[nome].value()
+            if valor is None or nome == 'foto':
+                continue
+            dados[nome] = campo.widget.format_value(valor) if hasattr(valor, 'strftime') else valor
+    return dados
+
+
+@armazenamento_de_testes
+class OrcamentoConsultasTests(TestCase):
+    """
+    As principais telas ficam dentro do orçamento de consultas de
+    ORCAMENTO_CONSULTAS, com servidores que têm filhos e documentos: uma
+    consulta por linha (N+1) estoura o limite e a falha lista as repetidas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Mais de uma página do painel
+        gerar_servidores(TAMANHO_PAGINA + 10, filhos_max=3, documentos_max=3, com_foto=False, semente=1)
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        cls.servidor = User.objects.filter(
+            is_superuser=False, info_familiares__filhos__isnull=False, info_funcionais__documentos__isnull=False,
+        ).distinct().first()
+
+    def setUp(self):
+        # As páginas em cache não fariam consulta nenhuma
+        cache.clear()
+
+    def test_detalhe_usuario(self):
+        self.client.force_login(self.admin)
+        with limite_consultas('detalhe_usuario'):
+            resposta = self.client.get(reverse('detalhe_usuario', args=[self.servidor.id]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['usuario_selecionado'].id, self.servidor.id)
+
+    def test_admin_visualizacao(self):
+        self.client.force_login(self.admin)
+        with limite_consultas('admin_visualizacao'):
+            resposta = self.client.get(reverse('admin_visualizacao'))
+        self.assertEqual(resposta.status_code, 200)
+        pagina = resposta.context['pagina']
+        self.assertTrue(pagina.cursor_proximo)
+
+        # A página seguinte custa o mesmo que a primeira
+        cache.clear()
+        with limite_consultas('admin_visualizacao'):
+            resposta = self.client.get(reverse('admin_visualizacao'), {'depois': pagina.cursor_proximo})
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_perfil_usuario_get(self):
+        self.client.force_login(self.servidor)
+        with limite_consultas('perfil_usuario'):
+            resposta = self.client.get(reverse('perfil_usuario'))
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_perfil_usuario_post(self):
+        self.client.force_login(self.servidor)
+        dados = _dados_perfil(self.servidor)
+        with limite_consultas('perfil_usuario'):
+            resposta = self.client.post(reverse('perfil_usuario'), dados)
+        self.assertRedirects(resposta, reverse('perfil_usuario'))
+
+
+async def _juntar(blocos):
+    return b''.join([bloco async for bloco in blocos])
+
+
+def _corpo(resposta):
+    # As views assíncronas respondem em streaming com um iterador assíncrono
+    if resposta.is_async:
+        return async_to_sync(_juntar)(resposta.streaming_content)
+    return b''.join(resposta.streaming_content)
+
+
+@armazenamento_de_testes
+@rotas_async
+class ViewsAsyncTests(TestCase):
+    """
+    As telas de leitura de core.views_async, servidas pelas mesmas rotas
+    quando VIEWS_ASYNC está ligado, devolvem o mesmo que as síncronas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(TAMANHO_PAGINA + 10, filhos_max=3, documentos_max=3, com_foto=False, semente=2)
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        cls.servidor = User.objects.filter(
+            is_superuser=False, info_familiares__filhos__isnull=False, info_funcionais__documentos__isnull=False,
+        ).distinct().first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_admin_visualizacao(self):
+        resposta = self.client.get(reverse('admin_visualizacao'))
+        self.assertEqual(resposta.status_code, 200)
+        pagina = resposta.context['pagina']
+        self.assertEqual(len(pagina.itens), TAMANHO_PAGINA)
+
+        resposta = self.client.get(reverse('admin_visualizacao'), {'depois': pagina.cursor_proximo})
+        self.assertEqual(resposta.status_code, 200)
+        seguinte = resposta.context['pagina']
+        self.assertEqual(len(seguinte.itens), 10)
+        self.assertFalse({u.id for u in pagina.itens} & {u.id for u in seguinte.itens})
+
+    def test_detalhe_usuario(self):
+        resposta = self.client.get(reverse('detalhe_usuario', args=[self.servidor.id]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['usuario_selecionado'].id, self.servidor.id)
+        self.assertEqual(
+            [d.id for d in resposta.context['info_funcionais'].documentos.all()],
+            list(Documento.objects.filter(info_funcional__usuario=self.servidor).order_by('id')
+                 .values_list('id', flat=True)),
+        )
+
+        resposta = self.client.get(reverse('detalhe_usuario', args=[0]))
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_detalhe_usuario_so_para_administradores(self):
+        self.client.force_login(self.servidor)
+        resposta = self.client.get(reverse('detalhe_usuario', args=[self.servidor.id]))
+        self.assertEqual(resposta.status_code, 302)
+
+    def test_exportar_csv(self):
+        resposta = self.client.get(reverse('exportar_plano', args=['csv']))
+        self.assertEqual(resposta.status_code, 200)
+        linhas = list(csv.reader(io.StringIO(_corpo(resposta).decode('utf-8-sig'))))
+        # Cabeçalho mais um servidor por linha
+        self.assertEqual(len(linhas) - 1, User.objects.filter(is_superuser=False).count())
+
+        resposta = self.client.get(reverse('exportar_plano', args=['xml']))
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_exportar_documentos_usuario(self):
+        resposta = self.client.get(reverse('exportar_documentos_usuario', args=[self.servidor.id]))
+        self.assertEqual(resposta.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(_corpo(resposta))) as arquivo_zip:
+            self.assertEqual(
+                len(arquivo_zip.namelist()),
+                Documento.objects.filter(info_funcional__usuario=self.servidor).count(),
+            )
+            self.assertIsNone(arquivo_zip.testzip())
+
+
+def _importar(texto, **kwargs):
+    return importar_servidores(io.BytesIO(texto.encode('utf-8')), 'servidores.csv', **kwargs)
+
+
+@armazenamento_de_testes
+class ImportacaoTests(TestCase):
+    """
+    A importação cria ou atualiza servidores pelo CPF ou pela matrícula,
+    grava só as colunas do arquivo e reporta os conflitos por linha.
+    """
+
+    CABECALHO = 'CPF;Matrícula;Nome Completo;E-mail;Posto/Graduação\n'
+
+    def setUp(self):
+        _importar(
+            self.CABECALHO
+            + '111.111.111-11;M1;Ana Souza;ana@example.com;Major\n'
+            + '222.222.222-22;M2;Bruno Lima;bruno@example.com;Capitão\n'
+        )
+        self.ana = InformacoesPessoais.objects.get(cpf='111.111.111-11').usuario
+        self.bruno = InformacoesPessoais.objects.get(cpf='222.222.222-22').usuario
+
+    def test_cria_servidores(self):
+        self.assertEqual(self.ana.info_pessoais.nome_completo, 'Ana Souza')
+        # O rótulo da escolha ("Major") vira o valor gravado, com a ordem do posto
+        self.assertEqual(self.ana.info_funcionais.posto_graduacao, 'major')
+        self.assertEqual(
+            self.ana.info_funcionais.posto_ordem, InformacoesFuncionais.ordem_do_posto('major'),
+        )
+        self.assertFalse(self.ana.has_usable_password())
+
+    def test_atualiza_so_as_colunas_do_arquivo(self):
+        resultado = _importar('Matrícula;Posto/Graduação\nM1;Coronel\n')
+        self.assertEqual(resultado.como_dict()['atualizados'], 1)
+        self.assertEqual(resultado.como_dict()['criados'], 0)
+
+        funcionais = InformacoesFuncionais.objects.get(usuario=self.ana)
+        self.assertEqual(funcionais.posto_graduacao, 'coronel')
+        self.assertEqual(funcionais.posto_ordem, InformacoesFuncionais.ordem_do_posto('coronel'))
+        self.assertEqual(InformacoesPessoais.objects.get(usuario=self.ana).nome_completo, 'Ana Souza')
+        self.assertEqual(User.objects.filter(is_superuser=False).count(), 2)
+
+    def test_conflitos(self):
+        resultado = _importar(
+            self.CABECALHO
+            # CPF da Ana com a matrícula do Bruno
+            + '111.111.111-11;M2;Ana Souza;;\n'
+            # E-mail do Bruno na linha da Ana
+            + '111.111.111-11;M1;Ana Souza;bruno@example.com;\n'
+            # Novo servidor, e o mesmo CPF de novo no arquivo
+            + '333.333.333-33;M3;Carla Dias;;\n'
+            + '333.333.333-33;M4;Carla Dias;;\n'
+            # Sem CPF nem matrícula
+            + ';;Sem Chave;;\n'
+        )
+        erros = dict(resultado.erros)
+        self.assertEqual(set(erros), {2, 3, 5, 6})
+        self.assertIn('servidores diferentes', erros[2])
+        self.assertIn('já pertence a outro servidor', erros[3])
+        self.assertIn('repetido (linha 4)', erros[5])
+        self.assertIn('CPF ou a matrícula', erros[6])
+        self.assertEqual(resultado.criados, 1)
+
+        # As linhas com erro não gravaram nada
+        self.assertEqual(InformacoesFuncionais.objects.get(usuario=self.ana).matricula, 'M1')
+        self.assertEqual(InformacoesPessoais.objects.get(usuario=self.ana).email, 'ana@example.com')
+        self.assertFalse(InformacoesFuncionais.objects.filter(matricula='M4').exists())
+
+    def test_simular_nao_grava(self):
+        resultado = _importar(self.CABECALHO + '444.444.444-44;M5;Davi Rocha;;Tenente\n', simular=True)
+        self.assertEqual(resultado.criados, 1)
+        self.assertFalse(InformacoesPessoais.objects.filter(cpf='444.444.444-44').exists())
+
+    def test_arquivo_sem_colunas_de_identificacao(self):
+        with self.assertRaises(ValueError):
+            _importar('Nome Completo\nAna Souza\n')
+
+
+@armazenamento_de_testes
+class EstatisticasTests(TestCase):
+    """
+    A tabela Estatistica, ajustada pelos sinais e pelas gravações em lote,
+    fica igual às contagens calculadas das tabelas de origem.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(20, filhos_max=3, documentos_max=0, com_foto=False, semente=3)
+        cls.servidor = User.objects.filter(is_superuser=False, info_familiares__filhos__isnull=False).first()
+
+    def assertEstatisticasEmDia(self):
+        gravadas = {
+            (dimensao, valor): quantidade
+            for dimensao, valor, quantidade in Estatistica.objects.values_list('dimensao', 'valor', 'quantidade')
+            if quantidade
+        }
+        calculadas = {chave: quantidade for chave, quantidade in contar_estatisticas().items() if quantidade}
+        self.assertEqual(gravadas, calculadas)
+
+    def test_salvar_e_alterar(self):
+        self.assertEstatisticasEmDia()
+
+        # O sinal de usuário cria a seção funcional, que já conta sem posto
+        usuario = User.objects.create_user('novo_servidor')
+        self.assertEstatisticasEmDia()
+
+        pessoais = InformacoesPessoais.objects.create(
+            usuario=usuario, data_nascimento=date(1990, 5, 17), estado_civil='solteiro',
+        )
+        self.assertEstatisticasEmDia()
+
+        pessoais.estado_civil = 'casado'
+        pessoais.data_nascimento = date(1960, 1, 2)
+        pessoais.save()
+        self.assertEstatisticasEmDia()
+
+        funcionais = usuario.info_funcionais
+        funcionais.posto_graduacao = 'major'
+        funcionais.save(update_fields=['posto_graduacao'])
+        self.assertEstatisticasEmDia()
+
+        familiares = InformacoesFamiliares.objects.create(usuario=usuario)
+        Filho.objects.create(info_familiar=familiares, nome='Filho', data_nascimento=date(2015, 3, 4))
+        self.assertEstatisticasEmDia()
+
+    def test_excluir(self):
+        self.servidor.info_familiares.filhos.first().delete()
+        self.assertEstatisticasEmDia()
+
+        # Em cascata: as três seções e os filhos
+        self.servidor.delete()
+        self.assertEstatisticasEmDia()
+
+    def test_perfil_usuario_post(self):
+        self.client.force_login(self.servidor)
+        dados = _dados_perfil(self.servidor)
+        dados.update({
+            'escolaridade': 'pos_graduacao',
+            'filhos_a_deletar': [self.servidor.info_familiares.filhos.first().id],
+            'nome_filho_novo': ['Filho Novo', 'Filha Nova'],
+            'nascimento_filho_novo': ['2020-01-01', '2021-06-30'],
+        })
+        resposta = self.client.post(reverse('perfil_usuario'), dados)
+        self.assertRedirects(resposta, reverse('perfil_usuario'))
+        self.assertEstatisticasEmDia()
+
+    def test_importacao(self):
+        _importar('Matrícula;Posto/Graduação\nM-EST-1;Tenente\nM-EST-2;Major\n')
+        self.assertEstatisticasEmDia()
+
+
+@armazenamento_de_testes
+class RelatoriosTests(TestCase):
+    """
+    Cada relatório devolve só os registros da janela pedida, na ordem do
+    calendário, inclusive quando a janela passa do fim do ano.
+    """
+
+    HOJE = date(2025, 12, 20)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        for username, nascimento, cnh_validade in [
+            ('dezembro', date(1990, 12, 25), date(2026, 1, 5)),
+            ('janeiro', date(1985, 1, 10), date(2026, 2, 18)),
+            ('hoje', date(2000, 12, 20), date(2025, 12, 20)),
+            ('ontem', date(1980, 12, 19), date(2025, 12, 19)),
+            ('fora', date(1970, 1, 25), date(2026, 3, 1)),
+        ]:
+            usuario = User.objects.create_user(username)
+            InformacoesPessoais.objects.create(
+                usuario=usuario, nome_completo=username, data_nascimento=nascimento, cnh_validade=cnh_validade,
+            )
+        familiares = InformacoesFamiliares.objects.create(usuario=User.objects.get(username='janeiro'))
+        for nome, nascimento in [('Dezoito', date(2007, 8, 1)), ('Vinte e quatro', date(2001, 1, 1)),
+                                 ('Dez', date(2015, 5, 5))]:
+            Filho.objects.create(info_familiar=familiares, nome=nome, data_nascimento=nascimento)
+
+    def _linhas(self, relatorio, **parametros):
+        definicao = RELATORIOS[relatorio]
+        return list(definicao.linhas(definicao.ler_parametros(parametros), hoje=self.HOJE))
+
+    def test_aniversariantes_na_virada_do_ano(self):
+        linhas = self._linhas('aniversariantes', dias='30')
+        # (aniversário, nome, ..., idade que completa): dezembro antes de janeiro
+        self.assertEqual(
+            [(linha[0], linha[1], linha[-1]) for linha in linhas],
+            [('20/12', 'hoje', 25), ('25/12', 'dezembro', 35), ('10/01', 'janeiro', 41)],
+        )
+
+    def test_aniversariantes_no_mesmo_ano(self):
+        linhas = self._linhas('aniversariantes', dias='5')
+        self.assertEqual([linha[1] for linha in linhas], ['hoje', 'dezembro'])
+
+    def test_cnh_vencendo(self):
+        linhas = self._linhas('cnh_vencendo', dias='60')
+        self.assertEqual([linha[1] for linha in linhas], ['hoje', 'dezembro', 'janeiro'])
+
+    def test_filhos_por_idade(self):
+        linhas = self._linhas('filhos_idade', idade='18', outra_idade='24', ano='2025')
+        self.assertEqual([(linha[0], linha[2]) for linha in linhas], [('Vinte e quatro', 24), ('Dezoito', 18)])
+
+    def test_parametros_invalidos(self):
+        with self.assertRaises(ValueError):
+            RELATORIOS['aniversariantes'].ler_parametros({'dias': '400'})
+
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('relatorio', args=['aniversariantes', 'csv']), {'dias': 'x'})
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_csv(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('relatorio', args=['cnh_vencendo', 'csv']), {'dias': '3660'})
+        self.assertEqual(resposta.status_code, 200)
+        linhas = list(csv.reader(io.StringIO(_corpo(resposta).decode('utf-8-sig'))))
+        self.assertEqual(linhas[0], RELATORIOS['cnh_vencendo'].cabecalho)
+
+
+@armazenamento_de_testes
+class PaginacaoTests(TestCase):
+    """
+    O painel pagina por keyset: as páginas, para frente e para trás, cobrem
+    todos os servidores uma vez, na ordem hierárquica, e um cursor
+    adulterado não é aceito.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(2 * TAMANHO_PAGINA + 7, filhos_max=0, documentos_max=0, com_foto=False, semente=4)
+        # Sem matrícula nem posto: entram na ordem como vazios
+        for indice in range(3):
+            User.objects.create_user(f'sem_cadastro_{indice}')
+
+    def _ordem_esperada(self):
+        return list(
+            InformacoesFuncionais.objects.filter(usuario__is_superuser=False)
+            .order_by('posto_ordem', F('matricula').asc(nulls_first=True), 'usuario_id')
+            .values_list('usuario_id', flat=True)
+        )
+
+    def test_percorre_para_frente_e_para_tras(self):
+        paginas = [paginar_servidores()]
+        self.assertIsNone(paginas[0].cursor_anterior)
+        while paginas[-1].cursor_proximo:
+            paginas.append(paginar_servidores(depois=paginas[-1].cursor_proximo))
+        self.assertEqual(len(paginas), 3)
+        self.assertEqual([u.id for pagina in paginas for u in pagina.itens], self._ordem_esperada())
+
+        # De volta, a partir da última página
+        voltando = [paginas[-1]]
+        while voltando[-1].cursor_anterior:
+            voltando.append(paginar_servidores(antes=voltando[-1].cursor_anterior))
+        self.assertEqual(
+            [[u.id for u in pagina.itens] for pagina in voltando[::-1]],
+            [[u.id for u in pagina.itens] for pagina in paginas],
+        )
+
+    def test_chaves_nulas(self):
+        # Usuários sem seção funcional (o administrador) ficam no fim
+        User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        consulta = com_chaves_hierarquia(User.objects.all())
+        vistos = []
+        pagina = paginar_keyset(consulta, CHAVES_HIERARQUIA)
+        while True:
+            vistos += [u.username for u in pagina.itens]
+            if not pagina.cursor_proximo:
+                break
+            pagina = paginar_keyset(consulta, CHAVES_HIERARQUIA, depois=pagina.cursor_proximo)
+        self.assertEqual(len(vistos), User.objects.count())
+        self.assertEqual(vistos[-1], 'admin_testes')
+
+    def test_cursor_adulterado(self):
+        cursor = paginar_servidores().cursor_proximo
+        valores, assinatura = cursor.split(':', 1)
+        adulterado = valores[:-1] + ('A' if valores[-1] != 'A' else 'B') + ':' + assinatura
+        primeira = [u.id for u in paginar_servidores().itens]
+        # Cursor inválido: volta à primeira página, sem erro
+        for invalido in (adulterado, 'lixo', cursor + 'x'):
+            self.assertEqual([u.id for u in paginar_servidores(depois=invalido).itens], primeira)
+            self.assertEqual([u.id for u in paginar_servidores(antes=invalido).itens], primeira)
+
+        # Um cursor assinado, mas com outra quantidade de chaves
+        outro = signing.dumps([1], salt=_SALT)
+        self.assertEqual([u.id for u in paginar_servidores(depois=outro).itens], primeira)
+
+
+@armazenamento_de_testes
+class ExportacaoExcelTests(TestCase):
+    """
+    A planilha tem uma aba por servidor, na ordem hierárquica, e é lida do
+    banco em lotes: o número de consultas não depende do de servidores.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(30, filhos_max=2, documentos_max=2, com_foto=False, semente=5)
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+
+    def test_planilha(self):
+        # Os ids e, para o único lote, usuários com seções e os filhos e documentos
+        with self.assertNumQueries(3):
+            arquivo = planilha_excel_temporaria()
+        with arquivo:
+            planilha = openpyxl.load_workbook(arquivo, read_only=True)
+            usernames = list(
+                ordenar_por_hierarquia(User.objects.filter(is_superuser=False)).values_list('username', flat=True)
+            )
+            self.assertEqual(planilha.sheetnames, [''.join(filter(str.isalnum, nome))[:31] for nome in usernames])
+            linhas = list(planilha.worksheets[0].iter_rows(values_only=True))
+            self.assertEqual(linhas[0], ('Seção', 'Campo', 'Valor'))
+            planilha.close()
+
+    def test_view(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('exportar_excel'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(_corpo(resposta).startswith(b'PK'))
+
+
+@armazenamento_de_testes
+class ExportacaoPlanaTests(TestCase):
+    """
+    CSV e JSONL: uma linha por servidor, na ordem hierárquica, com os
+    rótulos das escolhas e as contagens de filhos e documentos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(25, filhos_max=3, documentos_max=3, com_foto=False, semente=6)
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        cls.servidor = User.objects.filter(is_superuser=False, info_familiares__filhos__isnull=False).first()
+        funcionais = cls.servidor.info_funcionais
+        funcionais.posto_graduacao = 'major'
+        funcionais.save()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_linhas_em_lotes(self):
+        esperados = list(
+            ordenar_por_hierarquia(User.objects.filter(is_superuser=False)).values_list('id', flat=True)
+        )
+        # Lotes menores que o total: a leitura por keyset emenda os lotes sem repetir nem pular
+        with mock.patch('core.exportacao.TAMANHO_LOTE_PLANO', 7):
+            linhas = list(linhas_planas())
+        self.assertEqual([linha[0] for linha in linhas], esperados)
+
+    def test_csv(self):
+        resposta = self.client.get(reverse('exportar_plano', args=['csv']))
+        self.assertEqual(resposta.status_code, 200)
+        linhas = list(csv.reader(io.StringIO(_corpo(resposta).decode('utf-8-sig'))))
+        self.assertEqual(linhas[0], [titulo for titulo, _, _ in COLUNAS_PLANAS])
+        self.assertEqual(len(linhas) - 1, User.objects.filter(is_superuser=False).count())
+
+        linha = dict(zip(linhas[0], next(valores for valores in linhas[1:] if valores[0] == str(self.servidor.id))))
+        self.assertEqual(linha['Posto/Graduação'], 'Major')
+        self.assertEqual(int(linha['Qtd. Filhos']), self.servidor.info_familiares.filhos.count())
+        self.assertEqual(int(linha['Qtd. Documentos']), self.servidor.info_funcionais.documentos.count())
+
+    def test_jsonl(self):
+        resposta = self.client.get(reverse('exportar_plano', args=['jsonl']))
+        self.assertEqual(resposta.status_code, 200)
+        registros = [json.loads(linha) for linha in _corpo(resposta).decode('utf-8').splitlines()]
+        self.assertEqual(len(registros), User.objects.filter(is_superuser=False).count())
+        registro = next(r for r in registros if r['id'] == self.servidor.id)
+        self.assertEqual(registro['username'], self.servidor.username)
+        self.assertEqual(registro['posto_graduacao'], 'Major')
+
+    def test_formato_invalido(self):
+        resposta = self.client.get(reverse('exportar_plano', args=['xml']))
+        self.assertEqual(resposta.status_code, 404)
+
+
+@armazenamento_de_testes
+class ExportacaoDocumentosTests(TestCase):
+    """
+    O ZIP dos documentos tem uma pasta por servidor, nomes que não saem da
+    pasta e os arquivos ausentes do storage listados à parte.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(12, filhos_max=0, documentos_max=3, com_foto=False, semente=7)
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+
+        cls.servidor = User.objects.create_user('malicioso')
+        funcionais = cls.servidor.info_funcionais
+        funcionais.matricula = '../..'
+        funcionais.nome_guerra = '/etc'
+        funcionais.save()
+        conteudo = armazenar_arquivo(ContentFile(b'%PDF-1.4 malicioso', name='x.pdf'))
+        for nome in ('../../../passwd', '../../../passwd', '.bashrc'):
+            Documento.objects.create(
+                info_funcional=funcionais, nome_documento=nome, conteudo=conteudo, arquivo=conteudo.arquivo.name,
+            )
+        Documento.objects.create(info_funcional=funcionais, nome_documento='Sumido', arquivo='documentos/sumido.pdf')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _zip(self, resposta):
+        self.assertEqual(resposta.status_code, 200)
+        return zipfile.ZipFile(io.BytesIO(_corpo(resposta)))
+
+    def test_nome_seguro(self):
+        self.assertEqual(_nome_seguro('..'), 'sem nome')
+        self.assertEqual(_nome_seguro('../../etc/passwd'), '-..-etc-passwd')
+        self.assertEqual(_nome_seguro('.oculto'), 'oculto')
+        self.assertEqual(_nome_seguro('C:\\Windows'), 'C:-Windows')
+        self.assertEqual(_nome_seguro('  Nome   com\tespaços '), 'Nome com espaços')
+
+    def test_nomes_dentro_da_pasta(self):
+        with self._zip(self.client.get(reverse('exportar_documentos_usuario', args=[self.servidor.id]))) as arquivo:
+            nomes = arquivo.namelist()
+            self.assertIsNone(arquivo.testzip())
+            erros = arquivo.read('LEIA-ME-ERROS.txt').decode('utf-8')
+        pasta = '-.. - -etc'
+        self.assertEqual(sorted(nomes), sorted([
+            f'{pasta}/-..-..-passwd.pdf', f'{pasta}/-..-..-passwd (2).pdf', f'{pasta}/bashrc.pdf',
+            'LEIA-ME-ERROS.txt',
+        ]))
+        for nome in nomes:
+            self.assertNotIn('..', nome.split('/'))
+            self.assertFalse(nome.startswith('/'))
+        self.assertIn('documentos/sumido.pdf', erros)
+
+    def test_todos_os_documentos(self):
+        with mock.patch('core.exportacao.TAMANHO_LOTE_EXPORTACAO', 5):
+            with self._zip(self.client.get(reverse('exportar_documentos'))) as arquivo:
+                nomes = arquivo.namelist()
+        # Todos, menos o ausente, e a lista de erros
+        self.assertEqual(len(nomes), Documento.objects.count())
+        pastas = list(dict.fromkeys(nome.split('/')[0] for nome in nomes if '/' in nome))
+        self.assertEqual(len(pastas), Documento.objects.values('info_funcional').distinct().count())
+
+    def test_filtro_por_usuarios(self):
+        outro = User.objects.filter(is_superuser=False, info_funcionais__documentos__isnull=False).exclude(
+            pk=self.servidor.pk,
+        ).first()
+        resposta = self.client.get(reverse('exportar_documentos'), {'usuario': [outro.id]})
+        with self._zip(resposta) as arquivo:
+            self.assertEqual(len(arquivo.namelist()), outro.info_funcionais.documentos.count())
+
+        resposta = self.client.get(reverse('exportar_documentos'), {'usuario': ['x']})
+        self.assertEqual(resposta.status_code, 404)
+        resposta = self.client.get(reverse('exportar_documentos_usuario', args=[0]))
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_gerador_em_blocos(self):
+        blocos = list(gerar_zip_documentos(User.objects.filter(pk=self.servidor.pk)))
+        self.assertGreater(len(blocos), 1)
+
+
+@armazenamento_de_testes
+class CacheVersionadoTests(TestCase):
+    """
+    Os resultados em cache trazem a versão dos dados na chave: qualquer
+    alteração (pelos sinais ou registrada à mão) faz o próximo acesso
+    recalcular, e a versão de um usuário só muda com os dados dele.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        gerar_servidores(3, filhos_max=0, documentos_max=0, com_foto=False, semente=8)
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        cls.servidor, cls.outro = User.objects.filter(is_superuser=False)[:2]
+
+    def setUp(self):
+        cache.clear()
+        self.calculos = 0
+
+    def _calcular(self):
+        self.calculos += 1
+        return self.calculos
+
+    def test_versao_global(self):
+        self.assertEqual(em_cache('teste', self._calcular, 'a'), 1)
+        self.assertEqual(em_cache('teste', self._calcular, 'a'), 1)
+        # Outras partes, outra chave
+        self.assertEqual(em_cache('teste', self._calcular, 'b'), 2)
+
+        registrar_alteracao()
+        self.assertEqual(em_cache('teste', self._calcular, 'a'), 3)
+
+    def test_versao_por_usuario(self):
+        self.assertEqual(em_cache('teste', self._calcular, usuario_id=self.servidor.id), 1)
+        registrar_alteracoes([self.outro.id])
+        self.assertEqual(em_cache('teste', self._calcular, usuario_id=self.servidor.id), 1)
+        registrar_alteracoes([self.outro.id, self.servidor.id])
+        self.assertEqual(em_cache('teste', self._calcular, usuario_id=self.servidor.id), 2)
+
+    def test_chave_segura(self):
+        chave = _chave('busca', 7, ('Maria José da Silva ' * 20, None))
+        self.assertTrue(chave.startswith('cadastro:busca:7:'))
+        self.assertLess(len(chave), 250)
+        self.assertRegex(chave, r'^[\w:.]+$')
+        self.assertNotEqual(chave, _chave('busca', 7, ('Maria José da Silva ',)))
+
+    def test_uma_alteracao_por_transacao(self):
+        global_antes, usuario_antes = versao_atual(), versao_usuario(self.servidor.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                for _ in range(3):
+                    agendar_alteracao(self.servidor.id)
+                agendar_alteracao(self.outro.id)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(versao_atual(), global_antes + 1)
+        self.assertEqual(versao_usuario(self.servidor.id), usuario_antes + 1)
+
+    def test_transacao_desfeita_nao_altera(self):
+        antes = versao_atual()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    agendar_alteracao(self.servidor.id)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(versao_atual(), antes)
+
+    def test_sinais_invalidam_a_ficha(self):
+        self.client.force_login(self.admin)
+        url = reverse('detalhe_usuario', args=[self.servidor.id])
+        self.client.get(url)
+        pessoais = self.servidor.info_pessoais
+        pessoais.nome_completo = 'Nome Alterado'
+        with self.captureOnCommitCallbacks(execute=True):
+            pessoais.save()
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.context['info_pessoais'].nome_completo, 'Nome Alterado')
+
+        # Outro servidor alterado: a ficha continua vindo do cache
+        outros = self.outro.info_pessoais
+        outros.nome_completo = 'Outro Nome'
+        with self.captureOnCommitCallbacks(execute=True):
+            outros.save()
+        # Só a sessão e a versão do servidor: o usuário logado também vem do cache
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+
+@armazenamento_de_testes
+class AutenticacaoTests(TestCase):
+    """
+    O usuário logado vem do cache, e qualquer save do usuário (senha,
+    desativação, permissão) tira a entrada na hora.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('servidor_testes', password='x')
+
+    def setUp(self):
+        cache.clear()
+        self.backend = BackendComCache()
+
+    def test_usuario_em_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.usuario.pk), self.usuario)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.usuario.pk), self.usuario)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(self.backend.aget_user)(self.usuario.pk), self.usuario)
+        self.assertIsNone(self.backend.get_user(0))
+
+    def test_save_tira_do_cache(self):
+        self.backend.get_user(self.usuario.pk)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(self.backend.get_user(self.usuario.pk))
+
+        self.usuario.is_active = True
+        self.usuario.is_superuser = True
+        self.usuario.save()
+        self.assertTrue(self.backend.get_user(self.usuario.pk).is_superuser)
+
+    def test_excluir_tira_do_cache(self):
+        self.backend.get_user(self.usuario.pk)
+        pk = self.usuario.pk
+        self.usuario.delete()
+        self.assertIsNone(self.backend.get_user(pk))
+
+    @override_settings(AUTH_USUARIO_CACHE_TIMEOUT=0)
+    def test_cache_desligado(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.backend.get_user(self.usuario.pk)
+
+    def test_requisicao_autenticada(self):
+        self.client.login(username='servidor_testes', password='x')
+        self.client.get(reverse('perfil_usuario'))
+        # Da segunda requisição em diante o auth_user não é consultado
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('perfil_usuario'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.wsgi_request.user, self.usuario)
+        self.assertFalse([
+            consulta for consulta in consultas
+            # A busca do AuthenticationMiddleware; a view carrega o cadastro com joins
+            if 'FROM "auth_user" WHERE "auth_user"."id" =' in consulta['sql']
+        ])
+
+
+# Um bucket S3 só para assinar URLs: gerar a URL pré-assinada não acessa a rede
+BUCKET_TESTES = override_settings(STORAGES={**STORAGES_TESTES, 'default': {
+    'BACKEND': 'storages.backends.s3.S3Storage',
+    'OPTIONS': {'bucket_name': 'bucket-testes', 'access_key': 'x', 'secret_key': 'x', 'region_name': 'us-east-1'},
+}})
+
+
+def _png():
+    imagem = io.BytesIO()
+    Image.new('RGB', (4, 4)).save(imagem, 'PNG')
+    return imagem.getvalue()
+
+
+@armazenamento_de_testes
+class UploadDiretoTests(TestCase):
+    """
+    O upload direto reserva um nome no bucket por usuário e por upload, e o
+    token só é aceito de volta pelo mesmo usuário, para o mesmo destino, com
+    o arquivo no storage, do tamanho declarado e com o conteúdo esperado.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('servidor_testes')
+        cls.outro = User.objects.create_user('outro_servidor')
+
+    def _preparar(self, destino, dados, tipo='application/pdf', nome='meu arquivo.pdf'):
+        """Prepara o upload (com o bucket) e grava o arquivo onde o navegador gravaria."""
+        with BUCKET_TESTES:
+            preparado = preparar_upload(self.usuario, destino, nome, tipo, len(dados))
+        nome = signing.loads(preparado['token'], salt=_SALT_UPLOADS)['nome']
+        default_storage.save(nome, ContentFile(dados))
+        return preparado, nome
+
+    def test_url_pre_assinada(self):
+        preparado, nome = self._preparar('documento', b'%PDF-1.4 direto')
+        self.assertTrue(nome.startswith(f'documentos/{self.usuario.pk}/'))
+        self.assertTrue(nome.endswith('/meu_arquivo.pdf'))
+        self.assertIn('bucket-testes', preparado['url'])
+        self.assertIn('Signature=', preparado['url'])
+        self.assertEqual(preparado['cabecalhos']['Content-Type'], 'application/pdf')
+
+    def test_pedidos_recusados(self):
+        with BUCKET_TESTES:
+            for destino, tipo, tamanho in [
+                ('outro', 'application/pdf', 10),
+                ('foto', 'application/pdf', 10),
+                ('documento', 'application/pdf', 0),
+                ('documento', 'application/pdf', 'x'),
+                ('documento', 'application/pdf', 10 ** 12),
+            ]:
+                with self.assertRaises(ValidationError):
+                    preparar_upload(self.usuario, destino, 'a.pdf', tipo, tamanho)
+
+    def test_sem_bucket(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.post(reverse('preparar_upload'), {'destino': 'documento', 'tamanho': 10})
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_confirmar(self):
+        preparado, nome = self._preparar('documento', b'%PDF-1.4 direto')
+        self.assertEqual(confirmar_upload(self.usuario, 'documento', preparado['token']), nome)
+
+        for usuario, destino, token in [
+            (self.outro, 'documento', preparado['token']),
+            (self.usuario, 'importacao', preparado['token']),
+            (self.usuario, 'documento', preparado['token'] + 'x'),
+        ]:
+            with self.assertRaisesMessage(ValidationError, 'Envie o arquivo novamente'):
+                confirmar_upload(usuario, destino, token)
+
+    def test_arquivo_ausente_ou_diferente(self):
+        preparado, nome = self._preparar('documento', b'%PDF-1.4 direto')
+        default_storage.delete(nome)
+        with self.assertRaisesMessage(ValidationError, 'não chegou'):
+            confirmar_upload(self.usuario, 'documento', preparado['token'])
+
+        with BUCKET_TESTES:
+            preparado = preparar_upload(self.usuario, 'documento', 'a.pdf', 'application/pdf', 100)
+        nome = signing.loads(preparado['token'], salt=_SALT_UPLOADS)['nome']
+        default_storage.save(nome, ContentFile(b'menor que o declarado'))
+        with self.assertRaisesMessage(ValidationError, 'difere do declarado'):
+            confirmar_upload(self.usuario, 'documento', preparado['token'])
+        self.assertFalse(default_storage.exists(nome))
+
+    def test_foto_precisa_ser_imagem(self):
+        preparado, nome = self._preparar('foto', b'nao sou uma imagem', tipo='image/png', nome='foto.png')
+        with self.assertRaisesMessage(ValidationError, 'imagem válida'):
+            confirmar_upload(self.usuario, 'foto', preparado['token'])
+        self.assertFalse(default_storage.exists(nome))
+
+        preparado, nome = self._preparar('foto', _png(), tipo='image/png', nome='foto.png')
+        self.assertEqual(confirmar_upload(self.usuario, 'foto', preparado['token']), nome)
+
+    def test_documento_no_perfil(self):
+        # O objeto enviado é adotado por conteúdo: bytes repetidos não ficam duas vezes
+        existente = armazenar_arquivo(ContentFile(b'%PDF-1.4 repetido', name='a.pdf'))
+        preparado, nome = self._preparar('documento', b'%PDF-1.4 repetido')
+        self.client.force_login(self.usuario)
+        resposta = self.client.post(reverse('perfil_usuario'), {
+            'nome_documento': ['Certidão'], 'upload_documento': [preparado['token']],
+        })
+        self.assertRedirects(resposta, reverse('perfil_usuario'))
+        documento = Documento.objects.get(info_funcional__usuario=self.usuario)
+        self.assertEqual(documento.conteudo, existente)
+        self.assertFalse(default_storage.exists(nome))
+
+
+@armazenamento_de_testes
+class BuscaTests(TestCase):
+    """
+    A busca ignora acentos e maiúsculas e ordena pela semelhança. As
+    consultas usam f_unaccent e trigramas, que só existem no PostgreSQL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_testes', 'admin@example.com', 'x')
+        for username, nome, nome_guerra, matricula in [
+            ('joao', 'João Conceição', 'Conceição', '1001'),
+            ('maria', 'Maria José Araújo', 'Araújo', '2002'),
+            ('joana', 'Joana Pereira', 'Joana', '3003'),
+        ]:
+            usuario = User.objects.create_user(username)
+            InformacoesPessoais.objects.create(usuario=usuario, nome_completo=nome)
+            funcionais = usuario.info_funcionais
+            funcionais.nome_guerra = nome_guerra
+            funcionais.matricula = matricula
+            funcionais.save()
+
+    def test_normalizar_termo(self):
+        self.assertEqual(normalizar_termo('  CONCEIÇÃO Araújo '), 'conceicao araujo')
+
+    def test_termo_curto_nao_consulta(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(list(buscar_servidores(' J ')), [])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'f_unaccent e pg_trgm só existem no PostgreSQL')
+    def test_sem_acentos_e_por_semelhanca(self):
+        self.assertEqual([u.username for u in buscar_servidores('conceicao')], ['joao'])
+        self.assertEqual([u.username for u in buscar_servidores('ARAUJO')], ['maria'])
+        self.assertEqual([u.username for u in buscar_servidores('2002')], ['maria'])
+        # "joana" é idêntico ao nome de guerra dela, mais parecido do que com "João"
+        self.assertEqual([u.username for u in buscar_servidores('joa')][:1], ['joana'])
+        self.assertEqual(len(buscar_servidores('jo', limite=1)), 1)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'f_unaccent e pg_trgm só existem no PostgreSQL')
+    def test_api(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('buscar_servidores_api'), {'q': 'araujo', 'limite': '999'})
+        self.assertEqual(resposta.status_code, 200)
+        resultado, = resposta.json()['resultados']
+        self.assertEqual(resultado['nome'], 'Maria José Araújo')
+        self.assertEqual(resultado['url'], reverse('detalhe_usuario', args=[resultado['id']]))
+
+    def test_api_so_para_administradores(self):
+        self.client.force_login(User.objects.get(username='joao'))
+        resposta = self.client.get(reverse('buscar_servidores_api'), {'q': 'araujo'})
+        self.assertEqual(resposta.status_code, 302)
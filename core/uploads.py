@@ -0,0 +1,124 @@
+import posixpath
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+
+_SALT = 'core.uploads'
+
+
+def _verificar_imagem(nome):
+    """
+    O Content-Type do PUT é declarado pelo navegador: confere com o Pillow,
+    como o ImageField faria num upload comum, que o arquivo é uma imagem.
+    """
+    from PIL import Image
+
+    try:
+        with default_storage.open(nome, 'rb') as arquivo:
+            Image.open(arquivo).verify()
+    except Exception:
+        raise ValidationError('O arquivo enviado não é uma imagem válida.')
+
+
+# Destinos aceitos: pasta no bucket (a mesma do upload_to do campo), o
+# prefixo de Content-Type permitido e a verificação do conteúdo recebido
+DESTINOS = {
+    'documento': ('documentos/', '', None),
+    'foto': ('fotos_pessoais/', 'image/', _verificar_imagem),
+    'importacao': ('importacoes/', '', None),
+}
+
+
+def upload_direto_disponivel():
+    """
+    O upload direto só existe quando o armazenamento padrão é um bucket S3
+    (django-storages); com o FileSystemStorage os arquivos vão no formulário.
+    """
+    return settings.UPLOAD_DIRETO and getattr(default_storage, 'bucket_name', None) is not None
+
+
+def _chave(nome):
+    # Nome no storage -> chave do objeto no bucket (considera AWS_LOCATION)
+    return default_storage._normalize_name(nome)
+
+
+def preparar_upload(usuario, destino, nome_arquivo, content_type, tamanho):
+    """
+    Reserva um nome no bucket e devolve o que o navegador precisa para
+    enviar o arquivo direto para lá:
+
+        {'url': ..., 'metodo': 'PUT', 'cabecalhos': {...}, 'token': ...}
+
+    O `token` volta no POST do formulário e é conferido por `confirmar_upload`.
+    Levanta ValidationError se o pedido não puder ser atendido.
+    """
+    if destino not in DESTINOS:
+        raise ValidationError('Destino de upload inválido.')
+    pasta, tipo_permitido, _ = DESTINOS[destino]
+    content_type = content_type or 'application/octet-stream'
+    if not content_type.startswith(tipo_permitido):
+        raise ValidationError('Tipo de arquivo não permitido.')
+    try:
+        tamanho = int(tamanho)
+    except (TypeError, ValueError):
+        raise ValidationError('Tamanho do arquivo inválido.')
+    if not 0 < tamanho <= settings.UPLOAD_DIRETO_TAMANHO_MAXIMO:
+        raise ValidationError('Arquivo vazio ou maior que o permitido.')
+
+    # Pasta própria por usuário e por upload: o nome nunca colide e um token
+    # não serve para sobrescrever o arquivo de outra pessoa
+    nome = posixpath.join(
+        pasta, str(usuario.pk), uuid.uuid4().hex, get_valid_filename(nome_arquivo or 'arquivo')
+    )
+    cabecalhos = {'Content-Type': content_type}
+    parametros = {'Bucket': default_storage.bucket_name, 'Key': _chave(nome), 'ContentType': content_type}
+    cache_control = default_storage.object_parameters.get('CacheControl')
+    if cache_control:
+        parametros['CacheControl'] = cache_control
+        cabecalhos['Cache-Control'] = cache_control
+
+    url = default_storage.connection.meta.client.generate_presigned_url(
+        'put_object', Params=parametros, ExpiresIn=settings.UPLOAD_DIRETO_VALIDADE,
+    )
+    token = signing.dumps(
+        {'usuario': usuario.pk, 'destino': destino, 'nome': nome, 'tamanho': tamanho}, salt=_SALT,
+    )
+    return {'url': url, 'metodo': 'PUT', 'cabecalhos': cabecalhos, 'token': token}
+
+
+def confirmar_upload(usuario, destino, token):
+    """
+    Confere um token de `preparar_upload` depois que o navegador enviou o
+    arquivo e devolve o nome dele no storage, pronto para ser atribuído a um
+    FileField. Levanta ValidationError se o token for inválido, expirado, de
+    outro usuário ou destino, se o arquivo não estiver no bucket ou se o
+    conteúdo não passar na verificação do destino (fotos: imagem válida).
+    """
+    try:
+        dados = signing.loads(token, salt=_SALT, max_age=settings.UPLOAD_DIRETO_VALIDADE * 2)
+    except signing.BadSignature:
+        raise ValidationError('Upload expirado ou inválido. Envie o arquivo novamente.')
+    if dados.get('usuario') != usuario.pk or dados.get('destino') != destino:
+        raise ValidationError('Upload inválido. Envie o arquivo novamente.')
+
+    nome = dados['nome']
+    # HEAD no objeto: confirma que o PUT terminou e que o tamanho é o declarado
+    try:
+        tamanho = default_storage.size(nome)
+    except Exception:
+        raise ValidationError('O arquivo não chegou ao armazenamento. Envie-o novamente.')
+    if tamanho != dados['tamanho']:
+        default_storage.delete(nome)
+        raise ValidationError('O arquivo enviado difere do declarado. Envie-o novamente.')
+    verificar = DESTINOS[destino][2]
+    if verificar:
+        try:
+            verificar(nome)
+        except ValidationError:
+            default_storage.delete(nome)
+            raise
+    return nome
@@ -1,14 +1,47 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 
-urlpatterns = [
-    path('', views.login_view, name='login'),
-    path('logout/', auth_views.LogoutView.as_view(), name='logout'),
-    path('perfil/', views.perfil_usuario_view, name='perfil_usuario'),
-    path('dashboard/', views.admin_visualizacao, name='admin_visualizacao'),
-    path('usuario/<int:user_id>/', views.detalhe_usuario, name='detalhe_usuario'),
-    path('dashboard/exportar/', views.exportar_excel_view, name='exportar_excel'),
-    # A rota de cadastro completo pelo admin (opcional)
-    path('cadastro-admin/', views.cadastro_admin_view, name='cadastro_admin'),
-]
\ No newline at end of file
+
+def rotas(leitura):
+    """Rotas da app, com as telas de leitura (painel, ficha e exportações) de `leitura`."""
+    return [
+        path('', views.login_view, name='login'),
+        path('logout/', auth_views.LogoutView.as_view(), name='logout'),
+        path('perfil/', views.perfil_usuario_view, name='perfil_usuario'),
+        path('dashboard/', leitura.admin_visualizacao, name='admin_visualizacao'),
+        path('api/servidores/busca/', views.buscar_servidores_api, name='buscar_servidores_api'),
+        path('api/uploads/', views.preparar_upload_view, name='preparar_upload'),
+        path('api/documentos/uploads/', views.iniciar_upload_documento_view, name='iniciar_upload_documento'),
+        path('api/documentos/uploads/<uuid:upload_id>/', views.upload_documento_view, name='upload_documento'),
+        path('api/documentos/uploads/<uuid:upload_id>/partes/<int:numero>/', views.upload_documento_view,
+             name='parte_upload_documento'),
+        path('api/documentos/uploads/<uuid:upload_id>/concluir/', views.upload_documento_view, {'concluir': True},
+             name='concluir_upload_documento'),
+        path('usuario/<int:user_id>/', leitura.detalhe_usuario, name='detalhe_usuario'),
+        path('usuario/<int:user_id>/foto/<str:tamanho>.<str:formato>', views.foto_derivada_view, name='foto_derivada'),
+        path('dashboard/exportar/', leitura.exportar_excel_view, name='exportar_excel'),
+        path('dashboard/exportar/plano.<str:formato>', leitura.exportar_plano_view, name='exportar_plano'),
+        path('dashboard/exportar/documentos.zip', leitura.exportar_documentos_view, name='exportar_documentos'),
+        path('usuario/<int:user_id>/documentos.zip', leitura.exportar_documentos_view,
+             name='exportar_documentos_usuario'),
+        path('dashboard/exportar/solicitar/', views.solicitar_exportacao_view, name='solicitar_exportacao'),
+        path('dashboard/estatisticas/', views.estatisticas_view, name='estatisticas'),
+        path('dashboard/relatorios/', views.relatorios_view, name='relatorios'),
+        path('dashboard/relatorios/<str:relatorio>.<str:formato>', views.relatorio_view, name='relatorio'),
+        path('dashboard/metricas/', views.metricas_view, name='metricas'),
+        path('tarefas/processar/', views.processar_tarefas_view, name='processar_tarefas'),
+        path('tarefas/<int:tarefa_id>/', views.status_tarefa_view, name='status_tarefa'),
+        path('tarefas/<int:tarefa_id>/download/', views.baixar_tarefa_view, name='baixar_tarefa'),
+        # A rota de cadastro completo pelo admin (opcional)
+        path('cadastro-admin/', views.cadastro_admin_view, name='cadastro_admin'),
+    ]
+
+
+# Sob ASGI, as telas de leitura podem usar as versões assíncronas
+if settings.VIEWS_ASYNC:
+    from . import views_async
+    urlpatterns = rotas(views_async)
+else:
+    urlpatterns = rotas(views)
@@ -0,0 +1,129 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import VersaoDados
+
+CHAVE_GLOBAL = 'global'
+
+
+def chave_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def _versao(chave):
+    versao = VersaoDados.objects.filter(chave=chave).values_list('versao', flat=True).first()
+    return versao or 0
+
+
+def versao_atual():
+    """
+    Retorna a versão atual dos dados cadastrais (0 se nunca houve alteração).
+    """
+    return _versao(CHAVE_GLOBAL)
+
+
+def versao_usuario(usuario_id):
+    """
+    Retorna a versão dos dados de um único usuário. Só muda quando os
+    dados daquele usuário mudam.
+    """
+    return _versao(chave_usuario(usuario_id))
+
+
+async def _versao_async(chave):
+    versao = await VersaoDados.objects.filter(chave=chave).values_list('versao', flat=True).afirst()
+    return versao or 0
+
+
+async def versao_atual_async():
+    """Versão assíncrona de `versao_atual` (views de core.views_async)."""
+    return await _versao_async(CHAVE_GLOBAL)
+
+
+async def versao_usuario_async(usuario_id):
+    """Versão assíncrona de `versao_usuario`."""
+    return await _versao_async(chave_usuario(usuario_id))
+
+
+def _incrementar(chave):
+    if VersaoDados.objects.filter(chave=chave).update(versao=F('versao') + 1):
+        return
+    try:
+        with transaction.atomic():
+            VersaoDados.objects.create(chave=chave, versao=1)
+    except IntegrityError:
+        # Outra requisição criou o registro ao mesmo tempo
+        VersaoDados.objects.filter(chave=chave).update(versao=F('versao') + 1)
+
+
+def registrar_alteracao(usuario_id=None):
+    """
+    Incrementa a versão dos dados (e a do usuário, se informado). Deve ser
+    chamada sempre que algum dado cadastral mudar, inclusive em operações em
+    lote que não disparam sinais.
+    """
+    _incrementar(CHAVE_GLOBAL)
+    if usuario_id is not None:
+        _incrementar(chave_usuario(usuario_id))
+
+
+def registrar_alteracoes(usuario_ids):
+    """
+    Versão em lote de `registrar_alteracao`, para operações que alteram
+    dados de muitos usuários de uma vez (UPDATEs em massa, importações).
+    Faz um número fixo de consultas, seja qual for a quantidade de usuários.
+    """
+    chaves = {chave_usuario(usuario_id) for usuario_id in usuario_ids if usuario_id is not None}
+    _incrementar(CHAVE_GLOBAL)
+    if not chaves:
+        return
+    existentes = set(VersaoDados.objects.filter(chave__in=chaves).values_list('chave', flat=True))
+    VersaoDados.objects.filter(chave__in=existentes).update(versao=F('versao') + 1)
+    # Quem ainda não tinha versão começa em 1; se outra requisição criou o
+    # registro nesse meio tempo, a versão dela já difere de 0 de qualquer forma
+    VersaoDados.objects.bulk_create(
+        [VersaoDados(chave=chave, versao=1) for chave in chaves - existentes],
+        ignore_conflicts=True,
+    )
+
+
+class _AlteracoesPendentes:
+    """Usuários alterados na transação atual, gravados de uma vez no commit."""
+
+    def __init__(self):
+        self.usuario_ids = set()
+
+    def __call__(self):
+        usuario_ids = self.usuario_ids - {None}
+        if len(usuario_ids) == 1:
+            # Caso comum (um save de perfil): dois UPDATEs
+            registrar_alteracao(usuario_ids.pop())
+        else:
+            registrar_alteracoes(usuario_ids)
+
+
+def agendar_alteracao(usuario_id=None):
+    """
+    Como `registrar_alteracao`, mas dentro de uma transação só anota o
+    usuário: as versões são incrementadas uma única vez, no commit, para
+    todos os usuários alterados nela (um save de perfil toca várias linhas
+    de várias tabelas). Se a transação for desfeita, nada é incrementado.
+    Fora de transação, incrementa na hora.
+    """
+    conexao = transaction.get_connection()
+    if not conexao.in_atomic_block:
+        registrar_alteracao(usuario_id)
+        return
+    pendentes = getattr(conexao, '_alteracoes_pendentes', None)
+    # A anotação anterior pode ter sido descartada (commit já feito ou
+    # rollback de um savepoint) ou ser de outro nível de savepoint: então
+    # agenda uma nova. Reaproveitar a de um nível de fora faria o incremento
+    # depender do commit dele, o que não vale para os savepoints de um
+    # TestCase (o bloco de fora nunca é confirmado).
+    savepoints = set(conexao.savepoint_ids)
+    if pendentes is None or not any(
+        funcao is pendentes and ids == savepoints for ids, funcao, _ in conexao.run_on_commit
+    ):
+        pendentes = conexao._alteracoes_pendentes = _AlteracoesPendentes()
+        transaction.on_commit(pendentes)
+    pendentes.usuario_ids.add(usuario_id)
@@ -4,19 +4,51 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db import transaction
+from django.core.exceptions import ValidationError
 from django.contrib import messages
+from django.conf import settings
 from datetime import datetime
-from django.db.models import Case, When, Value, IntegerField
-from django.http import HttpResponse
-import openpyxl
-from openpyxl.styles import Font
+import logging
+import posixpath
+import uuid
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 
 from pessoal.models import InformacoesPessoais
-from funcional.models import InformacoesFuncionais, Documento
+from funcional.models import InformacoesFuncionais, Documento, UploadParcial
 from familiar.models import InformacoesFamiliares, Filho
 from pessoal.forms import InformacoesPessoaisForm
 from funcional.forms import InformacoesFuncionaisForm
 from familiar.forms import InformacoesFamiliaresForm
+from pessoal.imagens import TAMANHOS, FORMATOS, derivados_prontos, garantir_derivados, url_derivado
+from funcional.conteudo import (
+    armazenar_arquivo, adotar_objeto, confirmar_token, token_conteudo,
+    iniciar_upload, receber_parte, concluir_upload,
+)
+from .exportacao import (
+    planilha_excel_temporaria, gerar_zip_documentos, csv_em_blocos, FORMATOS_PLANOS, TAMANHO_BLOCO_RESPOSTA,
+)
+from .models import Tarefa
+from .consultas import (
+    servidores, paginar_servidores, carregar_servidor, secoes_servidor,
+)
+from .busca import buscar_servidores, LIMITE_PADRAO, LIMITE_MAXIMO
+from .cache import em_cache
+from .versoes import agendar_alteracao, registrar_alteracao
+from .tarefas import solicitar_tarefa, processar_pendentes, reenfileirar_travadas
+from .metricas import agregador, resumo_metricas
+from .estatisticas import ajustar_estatisticas, resumo_estatisticas
+from .relatorios import RELATORIOS, html_em_blocos
+from .importacao import colunas_importaveis, EXTENSOES as EXTENSOES_IMPORTACAO
+from .uploads import upload_direto_disponivel, preparar_upload, confirmar_upload
+
+logger = logging.getLogger(__name__)
 
 def is_admin(user):
     return user.is_superuser
@@ -50,61 +82,40 @@ def login_view(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_visualizacao(request):
-    posto_order = Case(
-        When(info_funcionais__posto_graduacao='coronel', then=Value(1)),
-        When(info_funcionais__posto_graduacao='tenente_coronel', then=Value(2)),
-        When(info_funcionais__posto_graduacao='major', then=Value(3)),
-        When(info_funcionais__posto_graduacao='capitao', then=Value(4)),
-        When(info_funcionais__posto_graduacao='tenente', then=Value(5)),
-        When(info_funcionais__posto_graduacao='aspirante', then=Value(6)),       
-        When(info_funcionais__posto_graduacao='subtenente', then=Value(7)),      
-        When(info_funcionais__posto_graduacao='sargento', then=Value(8)),        
-        When(info_funcionais__posto_graduacao='cabo', then=Value(9)),            
-        When(info_funcionais__posto_graduacao='soldado', then=Value(10)),        
-        default=Value(11),                                                       
-        output_field=IntegerField(),
-    )
-    
-    usuarios = User.objects.filter(is_superuser=False).select_related(
-        'info_pessoais', 'info_funcionais'
-    ).annotate(
-        posto_order=posto_order
-    ).order_by('posto_order', 'info_funcionais__matricula')
+    termo = request.GET.get('q', '').strip()
+    if termo:
+        # Com um termo de busca, mostra os resultados mais relevantes em vez da lista completa
+        usuarios = em_cache('busca', lambda: list(buscar_servidores(termo, limite=LIMITE_MAXIMO)), termo)
+        return render(request, 'core/admin_visualizacao.html', {'usuarios': usuarios, 'termo': termo})
+
+    # Paginação por cursor sobre (posto, matrícula, id), lida do índice da
+    # listagem: cada página custa o mesmo, seja a primeira ou a última.
+    depois = request.GET.get('depois')
+    antes = request.GET.get('antes')
+    pagina = em_cache('painel', lambda: paginar_servidores(depois=depois, antes=antes), depois, antes)
 
-    return render(request, 'core/admin_visualizacao.html', {'usuarios': usuarios})
+    return render(request, 'core/admin_visualizacao.html', {'usuarios': pagina, 'pagina': pagina})
 
 
 @login_required
 @user_passes_test(is_admin)
 def detalhe_usuario(request, user_id):
-    # Primeiro, buscamos o usuário específico que o admin quer ver.
-    # Se não existir, a página retornará um erro 404 (Página Não Encontrada).
-    usuario_selecionado = get_object_or_404(User, id=user_id)
+    # O contexto só é recalculado quando os dados deste usuário mudam.
+    context = em_cache('detalhe', lambda: _contexto_detalhe_usuario(user_id), usuario_id=user_id)
+    return render(request, 'core/detalhe_usuario.html', context)
 
-    # Agora, buscamos cada bloco de informação relacionado a esse usuário.
-    # Usamos try/except para o caso de o usuário ainda não ter preenchido aquela seção.
-    
-    info_pessoais = None
-    try:
-        # Para OneToOneField, podemos acessar diretamente.
-        info_pessoais = usuario_selecionado.info_pessoais
-    except InformacoesPessoais.DoesNotExist:
-        pass  # Se não existir, a variável continua como None
 
-    info_funcionais = None
+def _contexto_detalhe_usuario(user_id):
+    # Usuário, as três seções e seus documentos/filhos em duas consultas.
+    # Se não existir, a página retornará um erro 404 (Página Não Encontrada).
     try:
-        # Usamos .prefetch_related() para otimizar a busca dos documentos.
-        info_funcionais = InformacoesFuncionais.objects.prefetch_related('documentos').get(usuario=usuario_selecionado)
-    except InformacoesFuncionais.DoesNotExist:
-        pass
+        usuario_selecionado = carregar_servidor(user_id)
+    except User.DoesNotExist:
+        raise Http404("Usuário não encontrado.")
+
+    # Seções que o usuário ainda não preencheu vêm como None.
+    info_pessoais, info_funcionais, info_familiares = secoes_servidor(usuario_selecionado)
 
-    info_familiares = None
-    try:
-        # Otimizamos também a busca dos filhos.
-        info_familiares = InformacoesFamiliares.objects.prefetch_related('filhos').get(usuario=usuario_selecionado)
-    except InformacoesFamiliares.DoesNotExist:
-        pass
-    
     # Montamos o contexto para enviar ao template.
     context = {
         'usuario_selecionado': usuario_selecionado,
@@ -112,89 +123,134 @@ def detalhe_usuario(request, user_id):
         'info_funcionais': info_funcionais,
         'info_familiares': info_familiares,
     }
-    
-    return render(request, 'core/detalhe_usuario.html', context)
+    return context
+
+
+@login_required
+@user_passes_test(is_admin)
+def buscar_servidores_api(request):
+    # Autocompletar da busca do painel: devolve os N servidores mais parecidos com o termo.
+    try:
+        limite = max(1, min(int(request.GET.get('limite', LIMITE_PADRAO)), LIMITE_MAXIMO))
+    except ValueError:
+        limite = LIMITE_PADRAO
+
+    resultados = []
+    for usuario in buscar_servidores(request.GET.get('q', ''), limite=limite):
+        pessoais = getattr(usuario, 'info_pessoais', None)
+        funcionais = getattr(usuario, 'info_funcionais', None)
+        resultados.append({
+            'id': usuario.id,
+            'nome': (pessoais.nome_completo if pessoais else '') or usuario.username,
+            'nome_guerra': funcionais.nome_guerra if funcionais else '',
+            'matricula': funcionais.matricula if funcionais else None,
+            'posto_graduacao': funcionais.get_posto_graduacao_display() if funcionais else '',
+            'url': reverse('detalhe_usuario', args=[usuario.id]),
+        })
+    return JsonResponse({'resultados': resultados})
 
 
 # Em core/views.py
 
 @login_required
-@transaction.atomic
 def perfil_usuario_view(request):
     """
     View para que o usuário comum edite suas informações, agora com
     lógica não-destrutiva completa para adicionar e remover documentos e filhos.
+
+    O GET só lê: uma busca com joins e, para as seções ainda não preenchidas,
+    instâncias vazias não salvas. Linhas só são criadas (e a transação só é
+    aberta) no POST.
     """
     if request.user.is_superuser:
         return redirect('admin_visualizacao')
 
+    if request.method == 'POST':
+        return _salvar_perfil(request)
+
+    user = request.user
+    pessoal_info, funcional_info, familiar_info = secoes_servidor(carregar_servidor(user.id))
+
+    context = {
+        'pessoal_form': InformacoesPessoaisForm(instance=pessoal_info or InformacoesPessoais(usuario=user)),
+        'funcional_form': InformacoesFuncionaisForm(instance=funcional_info or InformacoesFuncionais(usuario=user)),
+        'familiar_form': InformacoesFamiliaresForm(instance=familiar_info or InformacoesFamiliares(usuario=user)),
+        'documentos_existentes': funcional_info.documentos.all() if funcional_info else [],
+        'filhos_existentes': familiar_info.filhos.all() if familiar_info else [],
+        'upload_direto': upload_direto_disponivel(),
+    }
+    return render(request, 'core/perfil_usuario.html', context)
+
+
+@transaction.atomic
+def _salvar_perfil(request):
     user = request.user
     pessoal_info, _ = InformacoesPessoais.objects.get_or_create(usuario=user)
     funcional_info, _ = InformacoesFuncionais.objects.get_or_create(usuario=user)
     familiar_info, _ = InformacoesFamiliares.objects.get_or_create(usuario=user)
 
-    if request.method == 'POST':
-        pessoal_form = InformacoesPessoaisForm(request.POST, request.FILES, instance=pessoal_info)
-        funcional_form = InformacoesFuncionaisForm(request.POST, instance=funcional_info)
-        familiar_form = InformacoesFamiliaresForm(request.POST, instance=familiar_info)
-
-        if pessoal_form.is_valid() and funcional_form.is_valid() and familiar_form.is_valid():
-            pessoal_form.save()
-            funcional_instance = funcional_form.save()
-            familiar_instance = familiar_form.save()
-
-            # --- LÓGICA DE DOCUMENTOS NÃO-DESTRUTIVA ---
-            # 1. Processa as exclusões solicitadas
-            documentos_ids_para_deletar = request.POST.getlist('documentos_a_deletar')
-            if documentos_ids_para_deletar:
-                Documento.objects.filter(id__in=documentos_ids_para_deletar, info_funcional=funcional_instance).delete()
-
-            # 2. Processa as novas adições
-            documentos_nomes = request.POST.getlist('nome_documento')
-            documentos_arquivos = request.FILES.getlist('arquivo_documento')
-            for i, nome in enumerate(documentos_nomes):
-                if nome and i < len(documentos_arquivos):
-                    Documento.objects.create(
-                        info_funcional=funcional_instance,
-                        nome_documento=nome,
-                        arquivo=documentos_arquivos[i]
-                    )
-
-            # --- LÓGICA DE FILHOS NÃO-DESTRUTIVA (AGORA COMPLETA) ---
-            # 1. Processa as exclusões solicitadas
-            filhos_ids_para_deletar = request.POST.getlist('filhos_a_deletar')
-            if filhos_ids_para_deletar:
-                Filho.objects.filter(id__in=filhos_ids_para_deletar, info_familiar=familiar_instance).delete()
-
-            # 2. Processa as novas adições
-            filhos_nomes_novos = request.POST.getlist('nome_filho_novo')
-            filhos_nascimentos_novos = request.POST.getlist('nascimento_filho_novo')
-            for i, nome in enumerate(filhos_nomes_novos):
-                if nome and i < len(filhos_nascimentos_novos) and filhos_nascimentos_novos[i]:
-                    data_nasc_obj = datetime.strptime(filhos_nascimentos_novos[i], '%Y-%m-%d').date()
-                    Filho.objects.create(
-                        info_familiar=familiar_instance,
-                        nome=nome,
-                        data_nascimento=data_nasc_obj
-                    )
-
-            messages.success(request, 'Suas informações foram salvas com sucesso!')
-            return redirect('perfil_usuario')
-        else:
-            # Lógica de depuração para ver erros de validação
-            print("--- ERROS DE VALIDAÇÃO ---")
-            if pessoal_form.errors: print("Erros Pessoais:", pessoal_form.errors.as_json())
-            if funcional_form.errors: print("Erros Funcionais:", funcional_form.errors.as_json())
-            if familiar_form.errors: print("Erros Familiares:", familiar_form.errors.as_json())
-            print("--------------------------")
-            messages.error(request, 'Houve um erro no formulário. Por favor, verifique os dados.')
-
-    # O resto da view permanece igual
-    pessoal_form = InformacoesPessoaisForm(instance=pessoal_info)
-    funcional_form = InformacoesFuncionaisForm(instance=funcional_info)
-    familiar_form = InformacoesFamiliaresForm(instance=familiar_info)
-    documentos_existentes = funcional_info.documentos.all()
-    filhos_existentes = familiar_info.filhos.all()
+    pessoal_form = InformacoesPessoaisForm(request.POST, request.FILES, instance=pessoal_info)
+    funcional_form = InformacoesFuncionaisForm(request.POST, instance=funcional_info)
+    familiar_form = InformacoesFamiliaresForm(request.POST, instance=familiar_info)
+
+    # Os documentos e filhos novos são montados e validados antes de qualquer escrita
+    novos_documentos, erros_documentos = _novos_documentos(request, funcional_info)
+    novos_filhos, erros_filhos = _novos_filhos(request, familiar_info)
+
+    foto_enviada, erros_foto = _foto_enviada(request)
+
+    forms_validos = all([pessoal_form.is_valid(), funcional_form.is_valid(), familiar_form.is_valid()])
+    if forms_validos and not erros_documentos and not erros_filhos and not erros_foto:
+        if foto_enviada:
+            # Foto enviada direto para o bucket: só o nome é gravado
+            pessoal_form.instance.foto.name = foto_enviada
+        pessoal_form.save()
+        funcional_instance = funcional_form.save()
+        familiar_instance = familiar_form.save()
+
+        # --- LÓGICA DE DOCUMENTOS NÃO-DESTRUTIVA ---
+        # 1. Processa as exclusões solicitadas (um único DELETE)
+        documentos_ids_para_deletar = request.POST.getlist('documentos_a_deletar')
+        if documentos_ids_para_deletar:
+            # Pelo related manager: os documentos apagados já vêm com a seção em
+            # cache, e o sinal não consulta o dono de cada um
+            funcional_instance.documentos.filter(id__in=documentos_ids_para_deletar).delete()
+
+        # 2. Processa as novas adições (um único INSERT)
+        if novos_documentos:
+            Documento.objects.bulk_create(novos_documentos)
+
+        # --- LÓGICA DE FILHOS NÃO-DESTRUTIVA ---
+        filhos_ids_para_deletar = request.POST.getlist('filhos_a_deletar')
+        if filhos_ids_para_deletar:
+            familiar_instance.filhos.filter(id__in=filhos_ids_para_deletar).delete()
+
+        if novos_filhos:
+            # A idade de todos é calculada pelo bulk_create de Filho
+            Filho.objects.bulk_create(novos_filhos)
+            # bulk_create não dispara os sinais que mantêm a contagem
+            ajustar_estatisticas({('dependentes', ''): len(novos_filhos)})
+
+        # bulk_create não dispara sinais: anota a alteração aqui (as versões
+        # são incrementadas uma vez só, no commit, junto com as dos sinais)
+        agendar_alteracao(user.id)
+
+        messages.success(request, 'Suas informações foram salvas com sucesso!')
+        return redirect('perfil_usuario')
+
+    for erro in erros_foto + erros_documentos + erros_filhos:
+        messages.error(request, erro)
+
+    # Erros de validação ficam no log de depuração
+    for secao, form in (('pessoais', pessoal_form), ('funcionais', funcional_form), ('familiares', familiar_form)):
+        if form.errors:
+            logger.debug('Erros de validação (%s) do usuário %s: %s', secao, user.id, form.errors.as_json())
+    messages.error(request, 'Houve um erro no formulário. Por favor, verifique os dados.')
+
+    # Nada foi salvo: desfaz também as seções criadas acima e mostra os erros
+    documentos_existentes = list(funcional_info.documentos.all())
+    filhos_existentes = list(familiar_info.filhos.all())
+    transaction.set_rollback(True)
 
     context = {
         'pessoal_form': pessoal_form,
@@ -202,130 +258,433 @@ def perfil_usuario_view(request):
         'familiar_form': familiar_form,
         'documentos_existentes': documentos_existentes,
         'filhos_existentes': filhos_existentes,
+        'upload_direto': upload_direto_disponivel(),
     }
     return render(request, 'core/perfil_usuario.html', context)
 
 
+def _erros_de_validacao(objeto, exclude):
+    try:
+        objeto.full_clean(exclude=exclude)
+    except ValidationError as e:
+        return [mensagem for mensagens in e.message_dict.values() for mensagem in mensagens]
+    return []
+
+
+def _foto_enviada(request):
+    """
+    Nome no storage da foto enviada por upload direto, se houver.
+    Devolve (nome ou None, mensagens de erro).
+    """
+    token = request.POST.get('upload_foto')
+    if not token:
+        return None, []
+    try:
+        return confirmar_upload(request.user, 'foto', token), []
+    except ValidationError as e:
+        return None, [f'Foto: {mensagem}' for mensagem in e.messages]
+
+
+def _novos_documentos(request, info_funcional):
+    """
+    Monta (sem salvar) os documentos enviados no formulário e os valida.
+    Devolve (documentos, mensagens de erro).
+
+    Cada linha nova traz o arquivo de uma de três formas: no próprio POST,
+    já no bucket (upload direto, token em `upload_documento`) ou já montado
+    pelo upload em partes (token em `conteudo_documento`). Em todos os casos
+    o arquivo é guardado por conteúdo: bytes repetidos não ocupam espaço novo.
+    """
+    documentos, erros = [], []
+    documentos_nomes = request.POST.getlist('nome_documento')
+    tokens_diretos = request.POST.getlist('upload_documento')
+    tokens_conteudo = request.POST.getlist('conteudo_documento')
+    # Só as linhas sem token trazem arquivo no POST, na mesma ordem
+    arquivos = iter(request.FILES.getlist('arquivo_documento'))
+    for i, nome in enumerate(documentos_nomes):
+        token_direto = tokens_diretos[i] if i < len(tokens_diretos) else ''
+        token_conteudo = tokens_conteudo[i] if i < len(tokens_conteudo) else ''
+        arquivo = None if token_direto or token_conteudo else next(arquivos, None)
+        if not nome or not (arquivo or token_direto or token_conteudo):
+            continue
+        try:
+            if token_conteudo:
+                conteudo = confirmar_token(request.user, token_conteudo)
+            elif token_direto:
+                conteudo = adotar_objeto(confirmar_upload(request.user, 'documento', token_direto))
+            else:
+                conteudo = armazenar_arquivo(arquivo)
+        except ValidationError as e:
+            erros += [f'Documento "{nome}": {mensagem}' for mensagem in e.messages]
+            continue
+        documento = Documento(info_funcional=info_funcional, nome_documento=nome,
+                              conteudo=conteudo, arquivo=conteudo.arquivo.name)
+        erros += [f'Documento "{nome}": {erro}' for erro in _erros_de_validacao(documento, ['info_funcional'])]
+        documentos.append(documento)
+    return documentos, erros
+
+
+def _novos_filhos(request, info_familiar):
+    """
+    Monta (sem salvar) os filhos enviados no formulário e os valida.
+    Devolve (filhos, mensagens de erro).
+    """
+    filhos, erros = [], []
+    filhos_nomes_novos = request.POST.getlist('nome_filho_novo')
+    filhos_nascimentos_novos = request.POST.getlist('nascimento_filho_novo')
+    for i, nome in enumerate(filhos_nomes_novos):
+        if nome and i < len(filhos_nascimentos_novos) and filhos_nascimentos_novos[i]:
+            try:
+                data_nasc_obj = datetime.strptime(filhos_nascimentos_novos[i], '%Y-%m-%d').date()
+            except ValueError:
+                erros.append(f'Filho(a) "{nome}": data de nascimento inválida.')
+                continue
+            filho = Filho(info_familiar=info_familiar, nome=nome, data_nascimento=data_nasc_obj)
+            erros += [f'Filho(a) "{nome}": {erro}' for erro in _erros_de_validacao(filho, ['info_familiar'])]
+            filhos.append(filho)
+    return filhos, erros
+
+
+@login_required
+@require_POST
+def preparar_upload_view(request):
+    """
+    Devolve uma URL pré-assinada para o navegador enviar um documento ou a
+    foto direto ao bucket. O token da resposta vai no POST do perfil.
+    """
+    if not upload_direto_disponivel():
+        return JsonResponse({'erro': 'Upload direto indisponível.'}, status=404)
+    try:
+        dados = preparar_upload(
+            request.user,
+            request.POST.get('destino'),
+            request.POST.get('nome'),
+            request.POST.get('tipo'),
+            request.POST.get('tamanho'),
+        )
+    except ValidationError as e:
+        return JsonResponse({'erro': ' '.join(e.messages)}, status=400)
+    return JsonResponse(dados)
+
+
+def _estado_upload(upload):
+    return {
+        'upload': str(upload.pk),
+        'tamanho_parte': upload.tamanho_parte,
+        'total_partes': upload.total_partes,
+        'partes_recebidas': upload.partes_recebidas,
+        'url': reverse('upload_documento', args=[upload.pk]),
+        'desafio': {'inicio': upload.desafio_inicio, 'tamanho': upload.desafio_tamanho}
+                   if upload.desafio_tamanho else None,
+    }
+
+
+@login_required
+@require_POST
+def iniciar_upload_documento_view(request):
+    """
+    Abre um upload de documento em partes. O navegador envia cada parte com
+    PUT em `<url>partes/<n>/` e termina com POST em `<url>concluir/`; o token
+    devolvido vai no campo `conteudo_documento` do formulário do perfil.
+    """
+    try:
+        upload = iniciar_upload(
+            request.user, request.POST.get('nome'), request.POST.get('tamanho'), request.POST.get('sha256'),
+        )
+    except ValidationError as e:
+        return JsonResponse({'erro': ' '.join(e.messages)}, status=400)
+    return JsonResponse(_estado_upload(upload))
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'POST'])
+def upload_documento_view(request, upload_id, numero=None, concluir=False):
+    """Estado (GET), envio de uma parte (PUT) e conclusão (POST) de um upload."""
+    upload = get_object_or_404(UploadParcial, pk=upload_id, usuario=request.user)
+    try:
+        if numero is not None and request.method == 'PUT':
+            upload = receber_parte(upload, numero, request, request.headers.get('X-Conteudo-Sha256', ''))
+        elif concluir and request.method == 'POST':
+            conteudo = concluir_upload(upload, request.POST.get('prova', ''))
+            return JsonResponse({'token': token_conteudo(request.user, conteudo)})
+        elif request.method != 'GET' or numero is not None or concluir:
+            return JsonResponse({'erro': 'Método não permitido.'}, status=405)
+    except ValidationError as e:
+        # Um upload descartado (arquivo montado diferente do declarado) não tem mais estado
+        estado = _estado_upload(upload) if upload.pk is not None else {}
+        return JsonResponse({'erro': ' '.join(e.messages), **estado}, status=400)
+    return JsonResponse(_estado_upload(upload))
+
+
+@login_required
+def foto_derivada_view(request, user_id, tamanho, formato):
+    """
+    Gera, na primeira requisição, as miniaturas da foto do servidor e
+    redireciona para a pedida. Depois disso os templates apontam direto para
+    o arquivo no storage e esta view deixa de ser chamada.
+    """
+    if not (request.user.is_superuser or request.user.id == user_id):
+        raise Http404
+    if tamanho not in TAMANHOS or formato not in FORMATOS:
+        raise Http404
+    info_pessoais = get_object_or_404(InformacoesPessoais.objects.only('id', 'usuario_id', 'foto', 'foto_derivados'),
+                                      usuario_id=user_id)
+    if not info_pessoais.foto:
+        raise Http404
+    if garantir_derivados(info_pessoais):
+        # As páginas em cache ainda apontam para esta view
+        registrar_alteracao(user_id)
+    if not derivados_prontos(info_pessoais):
+        # O Pillow não conseguiu ler a foto: serve a original
+        return redirect(info_pessoais.foto.url)
+    return redirect(url_derivado(info_pessoais, tamanho, formato))
+
+
 @login_required
 @user_passes_test(is_admin)
 def exportar_excel_view(request):
-    workbook = openpyxl.Workbook()
-    workbook.remove(workbook.active)  # Remove a planilha padrão
-
-    # Otimiza a busca no banco de dados
-    usuarios = User.objects.filter(is_superuser=False).select_related(
-        'info_pessoais', 'info_funcionais', 'info_familiares'
-    ).prefetch_related(
-        'info_funcionais__documentos', 'info_familiares__filhos'
+    # A planilha é montada em modo write-only, lendo os usuários em lotes,
+    # e gravada em um arquivo temporário que é transmitido em blocos.
+    # Assim o uso de memória fica constante, não importa quantos usuários existam.
+    arquivo = planilha_excel_temporaria()
+
+    response = FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename='cadastros_usuarios.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
     )
+    response.block_size = TAMANHO_BLOCO_RESPOSTA
+    return response
 
-    for usuario in usuarios:
-        # Garante que o nome da planilha seja válido
-        sheet_title = ''.join(filter(str.isalnum, usuario.username))[:31]
-        sheet = workbook.create_sheet(title=sheet_title)
-        
-        header_font = Font(bold=True)
-        sheet['A1'] = "Seção"
-        sheet['B1'] = "Campo"
-        sheet['C1'] = "Valor"
-        sheet['A1'].font = header_font
-        sheet['B1'].font = header_font
-        sheet['C1'].font = header_font
-
-        row = 2
-        def add_data(secao, campo, valor):
-            nonlocal row
-            sheet.cell(row=row, column=1, value=secao)
-            sheet.cell(row=row, column=2, value=campo)
-            # Formata datas para um formato legível, se for um objeto date/datetime
-            if hasattr(valor, 'strftime'):
-                valor = valor.strftime('%d/%m/%Y')
-            sheet.cell(row=row, column=3, value=str(valor) if valor is not None else "")
-            row += 1
-
-        # --- Informações Pessoais ---
-        try:
-            p = usuario.info_pessoais
-            add_data("Pessoal", "Nome Completo", p.nome_completo)
-            add_data("Pessoal", "CPF", p.cpf)
-            add_data("Pessoal", "RG", p.rg)
-            add_data("Pessoal", "Email", p.email)
-            add_data("Pessoal", "Data de Nascimento", p.data_nascimento)
-            add_data("Pessoal", "Idade", p.idade)
-            add_data("Pessoal", "Telefone", p.telefone)
-            add_data("Pessoal", "Grupo Sanguíneo", p.grupo_sanguineo)
-            add_data("Pessoal", "Estado Civil", p.get_estado_civil_display())
-            add_data("Pessoal", "Escolaridade", p.get_escolaridade_display())
-            add_data("Pessoal", "Nº CNH", p.cnh_numero)
-            add_data("Pessoal", "Categoria CNH", p.cnh_categoria)
-            add_data("Pessoal", "Validade CNH", p.cnh_validade)
-            add_data("Pessoal", "Título de Eleitor", p.titulo_eleitor)
-            add_data("Pessoal", "Zona Eleitoral", p.zona)
-            add_data("Pessoal", "Seção Eleitoral", p.secao)
-            add_data("Pessoal", "Município de Votação", p.municipio_votacao)
-        except InformacoesPessoais.DoesNotExist:
-            add_data("Pessoal", "Status", "Não cadastrado")
-
-        # --- Informações Funcionais ---
-        try:
-            f = usuario.info_funcionais
-            add_data("Funcional", "Nome de Guerra", f.nome_guerra)
-            add_data("Funcional", "Posto/Graduação", f.get_posto_graduacao_display())
-            add_data("Funcional", "Matrícula", f.matricula)
-            add_data("Funcional", "Data de Admissão", f.data_admissao)
-            add_data("Funcional", "Banco", f.banco)
-            add_data("Funcional", "Agência", f.agencia)
-            add_data("Funcional", "Conta Corrente", f.conta_corrente)
-        except InformacoesFuncionais.DoesNotExist:
-            add_data("Funcional", "Status", "Não cadastrado")
-
-        # --- Informações Familiares ---
+
+@login_required
+@user_passes_test(is_admin)
+def exportar_plano_view(request, formato):
+    # Uma linha por servidor, transmitida à medida que é lida do banco.
+    if formato not in FORMATOS_PLANOS:
+        raise Http404("Formato de exportação inválido.")
+    gerador, content_type = FORMATOS_PLANOS[formato]
+
+    response = StreamingHttpResponse(gerador(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="cadastros_usuarios.{formato}"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+def exportar_documentos_view(request, user_id=None):
+    """
+    ZIP com os documentos de um servidor (`user_id`), de um conjunto filtrado
+    (`?usuario=1&usuario=2` ou `?posto=major`) ou de todos. O arquivo é
+    montado enquanto é transmitido, então o download começa na hora.
+    """
+    usuarios, nome_arquivo = _usuarios_documentos(request, user_id)
+    response = StreamingHttpResponse(gerar_zip_documentos(usuarios), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+
+def _usuarios_documentos(request, user_id=None):
+    """Consulta dos usuários exportados no ZIP de documentos e o nome do arquivo."""
+    usuarios = servidores()
+    nome_arquivo = 'documentos_servidores.zip'
+    if user_id is not None:
+        usuarios = usuarios.filter(pk=user_id)
+        if not usuarios.exists():
+            raise Http404("Usuário não encontrado.")
+        nome_arquivo = f'documentos_usuario_{user_id}.zip'
+    elif request.GET.getlist('usuario'):
         try:
-            fam = usuario.info_familiares
-            add_data("Familiar", "Endereço", f"{fam.endereco}, {fam.numero_casa} - {fam.bairro}")
-            add_data("Familiar", "Complemento", fam.complemento)
-            add_data("Familiar", "Cidade", fam.cidade)
-            add_data("Familiar", "CEP", fam.cep)
-            add_data("Familiar", "Nome do Cônjuge", fam.conjuge_nome)
-            add_data("Familiar", "Data Nasc. Cônjuge", fam.conjuge_data_nascimento)
-            
-            # --- Filhos ---
-            if fam.filhos.exists():
-                for i, filho in enumerate(fam.filhos.all()):
-                    add_data("Filhos", f"Filho(a) {i+1} - Nome", filho.nome)
-                    add_data("Filhos", f"Filho(a) {i+1} - Data Nasc.", filho.data_nascimento)
-            else:
-                add_data("Filhos", "Status", "Nenhum filho cadastrado")
-
-        except InformacoesFamiliares.DoesNotExist:
-            add_data("Familiar", "Status", "Não cadastrado")
-            
-        # Ajustar largura das colunas
-        sheet.column_dimensions['A'].width = 15
-        sheet.column_dimensions['B'].width = 30
-        sheet.column_dimensions['C'].width = 40
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="cadastros_usuarios.xlsx"'
-    workbook.save(response)
+            ids = [int(valor) for valor in request.GET.getlist('usuario')]
+        except ValueError:
+            raise Http404("Filtro de usuários inválido.")
+        usuarios = usuarios.filter(pk__in=ids)
+    elif request.GET.get('posto'):
+        usuarios = usuarios.filter(info_funcionais__posto_graduacao=request.GET['posto'])
+    return usuarios, nome_arquivo
+
+
+@login_required
+@user_passes_test(is_admin)
+@require_POST
+def solicitar_exportacao_view(request):
+    # A exportação é feita pelo worker (manage.py processar_tarefas).
+    # Se os dados não mudaram desde a última exportação, o arquivo já pronto é reaproveitado.
+    tarefa = solicitar_tarefa('exportar_excel', request.user)
+    return JsonResponse(_status_tarefa(tarefa))
+
+
+@login_required
+@user_passes_test(is_admin)
+@require_http_methods(['GET', 'POST'])
+def metricas_view(request):
+    # Métricas agregadas por view (core.metricas); POST zera a contagem.
+    if request.method == 'POST':
+        agregador.zerar()
+    return JsonResponse({'views': resumo_metricas()}, json_dumps_params={'ensure_ascii': False})
+
+
+@login_required
+@user_passes_test(is_admin)
+def estatisticas_view(request):
+    # Lê só a tabela Estatistica, mantida pelos sinais (core.estatisticas)
+    return render(request, 'core/estatisticas.html', resumo_estatisticas())
+
+
+# Onde as linhas entram no HTML renderizado de um relatório
+_MARCADOR_LINHAS = '<!-- linhas do relatório -->'
+
+
+@login_required
+@user_passes_test(is_admin)
+def relatorios_view(request):
+    relatorios = [
+        {
+            'slug': slug,
+            'relatorio': relatorio,
+            'parametros': [
+                {'nome': nome, 'rotulo': rotulo, 'padrao': padrao, 'minimo': minimo, 'maximo': maximo}
+                for nome, (rotulo, padrao, minimo, maximo) in relatorio.parametros.items()
+            ],
+        }
+        for slug, relatorio in RELATORIOS.items()
+    ]
+    return render(request, 'core/relatorios.html', {'relatorios': relatorios})
+
+
+@login_required
+@user_passes_test(is_admin)
+def relatorio_view(request, relatorio, formato):
+    """
+    Relatório por período (core.relatorios) em HTML ou CSV, transmitido à
+    medida que as linhas são lidas do banco.
+    """
+    if relatorio not in RELATORIOS or formato not in ('html', 'csv'):
+        raise Http404("Relatório não encontrado.")
+    definicao = RELATORIOS[relatorio]
+    try:
+        parametros = definicao.ler_parametros(request.GET)
+        linhas = definicao.linhas(parametros)
+    except ValueError:
+        raise Http404("Parâmetros do relatório inválidos.")
+
+    if formato == 'csv':
+        response = StreamingHttpResponse(
+            csv_em_blocos(definicao.cabecalho, linhas), content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{relatorio}.csv"'
+        return response
+
+    # A página é renderizada uma vez, sem as linhas, e enviada em volta delas
+    pagina = render_to_string('core/relatorio.html', {
+        'slug': relatorio,
+        'relatorio': definicao,
+        'parametros': [(definicao.parametros[nome][0], valor) for nome, valor in parametros.items()],
+        'consulta': request.GET.urlencode(),
+        'linhas': mark_safe(_MARCADOR_LINHAS),
+    }, request)
+    antes, depois = pagina.split(_MARCADOR_LINHAS, 1)
+
+    def gerar():
+        yield antes
+        yield from html_em_blocos(linhas, len(definicao.colunas))
+        yield depois
+
+    return StreamingHttpResponse(gerar(), content_type='text/html; charset=utf-8')
+
+
+@require_GET
+def processar_tarefas_view(request):
+    """
+    Processa a fila de tarefas quando não há worker rodando: chamada pelo
+    cron da Vercel (vercel.json), que envia `Authorization: Bearer
+    <CRON_SECRET>`. Sem o segredo configurado, a rota não existe.
+    """
+    segredo = settings.TAREFAS_CRON_SEGREDO
+    if not segredo or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {segredo}'):
+        raise Http404
+    reenfileiradas = reenfileirar_travadas(settings.TAREFAS_TEMPO_LIMITE)
+    executadas = processar_pendentes(settings.TAREFAS_CRON_SEGUNDOS)
+    return JsonResponse({
+        'reenfileiradas': reenfileiradas,
+        'executadas': [{'id': tarefa.id, 'status': tarefa.status} for tarefa in executadas],
+    })
+
+
+@login_required
+@user_passes_test(is_admin)
+def status_tarefa_view(request, tarefa_id):
+    tarefa = get_object_or_404(Tarefa, id=tarefa_id)
+    return JsonResponse(_status_tarefa(tarefa))
+
+
+@login_required
+@user_passes_test(is_admin)
+def baixar_tarefa_view(request, tarefa_id):
+    tarefa = get_object_or_404(Tarefa, id=tarefa_id, status='concluida')
+    response = FileResponse(tarefa.arquivo.open('rb'), as_attachment=True, filename=tarefa.nome_arquivo)
+    response.block_size = TAMANHO_BLOCO_RESPOSTA
     return response
 
 
+def _status_tarefa(tarefa):
+    dados = {
+        'id': tarefa.id,
+        'tipo': tarefa.tipo,
+        'status': tarefa.status,
+        'progresso': tarefa.progresso,
+        'resumo': tarefa.resumo,
+        'url_status': reverse('status_tarefa', args=[tarefa.id]),
+    }
+    if tarefa.status == 'concluida':
+        dados['url_download'] = reverse('baixar_tarefa', args=[tarefa.id])
+    return dados
+
+
 @login_required
 @user_passes_test(is_admin)
-@transaction.atomic
 def cadastro_admin_view(request):
-    # Esta view é opcional, para o admin criar um usuário completo de uma vez
+    """
+    Importação em massa de servidores (XLSX ou CSV). O arquivo vai para o
+    storage e a importação roda na fila de tarefas; a página lista as
+    últimas importações com o resumo e o relatório de erros por linha.
+    """
     if request.method == 'POST':
-        # ... (lógica da view cadastro_usuario anterior, se desejar mantê-la)
-        return redirect('admin_visualizacao')
-    
-    pessoal_form = InformacoesPessoaisForm()
-    funcional_form = InformacoesFuncionaisForm()
-    familiar_form = InformacoesFamiliaresForm()
+        try:
+            nome = _arquivo_importacao(request)
+        except ValidationError as e:
+            for mensagem in e.messages:
+                messages.error(request, mensagem)
+            return redirect('cadastro_admin')
+        simular = bool(request.POST.get('simular'))
+        solicitar_tarefa('importar_servidores', request.user, {'arquivo': nome, 'simular': simular})
+        messages.success(request, 'Arquivo recebido. A importação foi colocada na fila.')
+        return redirect('cadastro_admin')
+
+    importacoes = list(Tarefa.objects.filter(tipo='importar_servidores')[:10])
     context = {
-        'pessoal_form': pessoal_form,
-        'funcional_form': funcional_form,
-        'familiar_form': familiar_form
+        'importacoes': importacoes,
+        'em_andamento': any(tarefa.status in ('pendente', 'executando') for tarefa in importacoes),
+        'colunas': colunas_importaveis(),
+        'upload_direto': upload_direto_disponivel(),
     }
-    return render(request, 'core/cadastro_admin.html', context)
\ No newline at end of file
+    return render(request, 'core/cadastro_admin.html', context)
+
+
+def _arquivo_importacao(request):
+    """Nome no storage do arquivo enviado, direto para o bucket ou no POST."""
+    token = request.POST.get('upload_importacao')
+    if token:
+        nome = confirmar_upload(request.user, 'importacao', token)
+    else:
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            raise ValidationError('Selecione um arquivo.')
+        nome = default_storage.save(
+            posixpath.join('importacoes', uuid.uuid4().hex, get_valid_filename(arquivo.name)), arquivo
+        )
+    if posixpath.splitext(nome.lower())[1] not in EXTENSOES_IMPORTACAO:
+        default_storage.delete(nome)
+        raise ValidationError(f'Formato não suportado: use {" ou ".join(EXTENSOES_IMPORTACAO)}.')
+    return nome
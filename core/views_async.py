@@ -0,0 +1,194 @@
+"""
+Versões assíncronas (ASGI) das telas de leitura do painel: lista, ficha do
+servidor e exportações. Entram no lugar das de core.views quando
+VIEWS_ASYNC está ligado (ver core/urls.py), o que só vale a pena servindo
+por sistema_cadastro.asgi (uvicorn, daphne...). Sob WSGI cada view async
+ganharia um loop só para ela.
+
+Por que o ORM síncrono num pool de threads, e não o ORM assíncrono
+(aget, afirst, `async for`)? No Django 5.2 esses métodos são só o ORM
+síncrono embrulhado em sync_to_async(thread_sensitive=True): todas as
+consultas, de todas as requisições do processo, fazem fila numa única
+thread compartilhada, e o psycopg2 não tem driver assíncrono que mude
+isso. As três consultas da ficha, por exemplo, andariam uma depois da
+outra. Por isso o trabalho de banco vai para `em_thread`: cada chamada
+roda numa thread do executor, com a conexão dela, e várias podem estar
+no banco ao mesmo tempo, da mesma requisição ou de requisições
+diferentes. O custo é uma conexão por thread ocupada, que o
+close_old_connections devolve ao fim de cada chamada.
+
+Com VIEWS_ASYNC_PARALELO desligado (os testes, ver core.testes), as
+chamadas voltam para a thread da requisição: é a conexão dela que está
+dentro da transação do TestCase, e uma conexão à parte veria outro banco
+(ou, no SQLite, esbarraria na tabela travada).
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import render
+
+from funcional.models import Documento
+from familiar.models import Filho
+from .busca import buscar_servidores, LIMITE_MAXIMO
+from .cache import em_cache_async
+from .consultas import paginar_servidores, montar_servidor, secoes_servidor
+from .exportacao import (
+    planilha_excel_temporaria, gerar_zip_documentos, FORMATOS_PLANOS, TAMANHO_BLOCO_RESPOSTA,
+)
+from .views import is_admin, _usuarios_documentos
+
+
+def _isolada(funcao):
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            # Mesma regra do fim de uma requisição, para a conexão desta thread:
+            # fecha (ou devolve ao pool) se não deve ser reaproveitada
+            close_old_connections()
+    return executar
+
+
+async def em_thread(funcao, *args, **kwargs):
+    """
+    Roda `funcao` (síncrona, pode usar o ORM) numa thread do executor, sem
+    bloquear o loop nem esperar a thread compartilhada do ORM assíncrono.
+    """
+    if not settings.VIEWS_ASYNC_PARALELO:
+        return await sync_to_async(funcao, thread_sensitive=True)(*args, **kwargs)
+    return await sync_to_async(_isolada(funcao), thread_sensitive=False)(*args, **kwargs)
+
+
+async def iterar_em_thread(gerador):
+    """
+    Consome um gerador síncrono (ex.: um ZIP lido do storage) numa thread
+    só dele, bloco a bloco. A thread é sempre a mesma porque o gerador pode
+    manter um cursor aberto, que pertence à conexão da thread que o abriu.
+    """
+    if settings.VIEWS_ASYNC_PARALELO:
+        executor = ThreadPoolExecutor(max_workers=1)
+        na_thread = functools.partial(sync_to_async, thread_sensitive=False, executor=executor)
+    else:
+        executor = None
+        na_thread = functools.partial(sync_to_async, thread_sensitive=True)
+    proximo = na_thread(next)
+    fim = object()
+    try:
+        while (bloco := await proximo(gerador, fim)) is not fim:
+            yield bloco
+    finally:
+        if executor is None:
+            await na_thread(gerador.close)()
+        else:
+            await na_thread(_isolada(gerador.close))()
+            executor.shutdown(wait=False)
+
+
+async def _carregar_usuario(request):
+    # Os context processors leem request.user de forma síncrona: troca o
+    # objeto preguiçoso pelo usuário que o login_required já carregou
+    request.user = await request.auser()
+
+
+@login_required
+@user_passes_test(is_admin)
+async def admin_visualizacao(request):
+    await _carregar_usuario(request)
+    termo = request.GET.get('q', '').strip()
+    if termo:
+        usuarios = await em_cache_async(
+            'busca', lambda: em_thread(lambda: list(buscar_servidores(termo, limite=LIMITE_MAXIMO))), termo,
+        )
+        return render(request, 'core/admin_visualizacao.html', {'usuarios': usuarios, 'termo': termo})
+
+    depois = request.GET.get('depois')
+    antes = request.GET.get('antes')
+    pagina = await em_cache_async(
+        'painel', lambda: em_thread(paginar_servidores, depois=depois, antes=antes), depois, antes,
+    )
+    return render(request, 'core/admin_visualizacao.html', {'usuarios': pagina, 'pagina': pagina})
+
+
+@login_required
+@user_passes_test(is_admin)
+async def detalhe_usuario(request, user_id):
+    await _carregar_usuario(request)
+    # Mesma chave de cache da versão síncrona: as duas se aproveitam
+    context = await em_cache_async('detalhe', lambda: _contexto_detalhe_usuario(user_id), usuario_id=user_id)
+    return render(request, 'core/detalhe_usuario.html', context)
+
+
+async def _contexto_detalhe_usuario(user_id):
+    # Usuário com as três seções, documentos e filhos: três consultas
+    # independentes, feitas ao mesmo tempo
+    usuario, documentos, filhos = await asyncio.gather(
+        em_thread(
+            lambda: User.objects.select_related('info_pessoais', 'info_funcionais', 'info_familiares')
+            .filter(pk=user_id).first()
+        ),
+        em_thread(lambda: list(Documento.objects.filter(info_funcional__usuario_id=user_id).order_by('id'))),
+        em_thread(lambda: list(Filho.objects.filter(info_familiar__usuario_id=user_id).order_by('id'))),
+    )
+    if usuario is None:
+        raise Http404("Usuário não encontrado.")
+    montar_servidor(usuario, documentos, filhos)
+    info_pessoais, info_funcionais, info_familiares = secoes_servidor(usuario)
+    return {
+        'usuario_selecionado': usuario,
+        'info_pessoais': info_pessoais,
+        'info_funcionais': info_funcionais,
+        'info_familiares': info_familiares,
+    }
+
+
+@login_required
+@user_passes_test(is_admin)
+async def exportar_excel_view(request):
+    # A planilha é montada numa thread do executor; o loop segue atendendo
+    arquivo = await em_thread(planilha_excel_temporaria)
+    response = FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename='cadastros_usuarios.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    response.block_size = TAMANHO_BLOCO_RESPOSTA
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+async def exportar_plano_view(request, formato):
+    # O gerador síncrono (cursor no servidor ou keyset) roda numa thread só
+    # dele. O aiterator() não serve aqui: com values_list() ele executa a
+    # consulta na thread do loop
+    if formato not in FORMATOS_PLANOS:
+        raise Http404("Formato de exportação inválido.")
+    gerador, content_type = FORMATOS_PLANOS[formato]
+
+    response = StreamingHttpResponse(iterar_em_thread(gerador()), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="cadastros_usuarios.{formato}"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+async def exportar_documentos_view(request, user_id=None):
+    """
+    ZIP dos documentos (ver a versão síncrona). Os arquivos são lidos do
+    storage numa thread própria do download, sem ocupar o loop.
+    """
+    usuarios, nome_arquivo = await em_thread(_usuarios_documentos, request, user_id)
+    response = StreamingHttpResponse(
+        iterar_em_thread(gerar_zip_documentos(usuarios)), content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('familiar', '0002_alter_filho_data_nascimento_alter_filho_idade_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filho',
+            index=models.Index(fields=['data_nascimento'], name='familiar_filho_nascimento_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from datetime import date
+
+from core.idades import IdadeQuerySet, calcular_idade
 
 class InformacoesFamiliares(models.Model):
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='info_familiares')
@@ -22,12 +23,18 @@ class Filho(models.Model):
     data_nascimento = models.DateField("Data de Nascimento")
     idade = models.PositiveIntegerField("Idade", editable=False, blank=True, null=True)
 
+    # A idade também é calculada em bulk_create e pode ser recalculada
+    # em lote (manage.py recalcular_idades)
+    objects = IdadeQuerySet.as_manager()
+
+    class Meta:
+        # Filhos que completam certa idade num ano (core/relatorios.py)
+        indexes = [
+            models.Index(fields=['data_nascimento'], name='familiar_filho_nascimento_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        if self.data_nascimento:
-            today = date.today()
-            self.idade = today.year - self.data_nascimento.year - ((today.month, today.day) < (self.data_nascimento.month, self.data_nascimento.day))
-        else:
-            self.idade = None
+        self.idade = calcular_idade(self.data_nascimento)
         super().save(*args, **kwargs)
 
     def __str__(self):
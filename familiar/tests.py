@@ -1,3 +1,33 @@
+from datetime import date
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from core.idades import calcular_idade
+from core.testes import armazenamento_de_testes
+from .models import Filho, InformacoesFamiliares
+
+
+@armazenamento_de_testes
+class IdadeFilhosTests(TestCase):
+    """A idade dos filhos segue as mesmas regras da dos servidores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.familiares = InformacoesFamiliares.objects.create(usuario=User.objects.create_user('servidor_testes'))
+
+    def test_save_bulk_create_e_recalculo(self):
+        filho = Filho.objects.create(info_familiar=self.familiares, nome='Ana', data_nascimento=date(2010, 4, 5))
+        outro, = Filho.objects.bulk_create([
+            Filho(info_familiar=self.familiares, nome='Bia', data_nascimento=date(2016, 12, 31)),
+        ])
+        self.assertEqual(filho.idade, calcular_idade(date(2010, 4, 5)))
+        self.assertEqual(outro.idade, calcular_idade(date(2016, 12, 31)))
+
+        hoje = date(2030, 12, 31)
+        self.assertEqual(Filho.objects.recalcular_idades(hoje), 2)
+        self.assertEqual(
+            dict(Filho.objects.values_list('nome', 'idade')),
+            {'Ana': 20, 'Bia': 14},
+        )
+        self.assertEqual(Filho.objects.recalcular_idades(hoje), 0)
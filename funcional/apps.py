@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FuncionalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'funcional'
+
+    def ready(self):
+        # Conecta a contagem de referências dos arquivos deduplicados
+        from . import signals  # noqa: F401
@@ -0,0 +1,229 @@
+import hashlib
+import hmac
+import posixpath
+import random
+import tempfile
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from core.armazenamento import ler_em_blocos, ler_trecho
+from .models import ArquivoConteudo, UploadParcial
+
+_SALT = 'funcional.conteudo'
+
+# Partes abaixo do limite de corpo das funções da Vercel (4,5 MB)
+TAMANHO_PARTE = 4 * 1024 * 1024
+TAMANHO_MAXIMO = 200 * 1024 * 1024
+TAMANHO_BLOCO = 64 * 1024
+TAMANHO_DESAFIO = 64 * 1024
+# Validade do token de um conteúdo pronto, até o formulário ser salvo
+VALIDADE_TOKEN = 24 * 60 * 60
+
+
+def _caminho_conteudo(sha256, nome_arquivo):
+    # documentos/conteudo/ab/abcdef....pdf: a extensão só ajuda quem baixa
+    extensao = posixpath.splitext(nome_arquivo)[1].lower()[:10]
+    return f'documentos/conteudo/{sha256[:2]}/{sha256}{extensao}'
+
+
+def _copiar_com_hash(blocos, destino=None):
+    """
+    Consome `blocos` calculando o SHA-256 e copiando para `destino` (se
+    houver). Devolve (hash, tamanho).
+    """
+    hash_ = hashlib.sha256()
+    tamanho = 0
+    for bloco in blocos:
+        hash_.update(bloco)
+        tamanho += len(bloco)
+        if destino is not None:
+            destino.write(bloco)
+    if destino is not None:
+        destino.seek(0)
+    return hash_.hexdigest(), tamanho
+
+
+def _guardar(arquivo, sha256, tamanho, nome_arquivo):
+    """
+    Devolve o ArquivoConteudo com esse hash, gravando `arquivo` no storage só
+    se o conteúdo ainda não existir. Se a transação de quem chama for
+    desfeita, o arquivo gravado fica sem registro até o `limpar_uploads`.
+    """
+    existente = ArquivoConteudo.objects.filter(sha256=sha256).first()
+    if existente is not None:
+        return existente
+    nome = default_storage.save(_caminho_conteudo(sha256, nome_arquivo), File(arquivo))
+    try:
+        with transaction.atomic():
+            return ArquivoConteudo.objects.create(sha256=sha256, tamanho=tamanho, arquivo=nome)
+    except IntegrityError:
+        # O mesmo conteúdo foi gravado ao mesmo tempo por outra requisição
+        default_storage.delete(nome)
+        return ArquivoConteudo.objects.get(sha256=sha256)
+
+
+def armazenar_arquivo(arquivo):
+    """
+    Guarda um arquivo recebido no formulário (UploadedFile) por conteúdo.
+    É lido em blocos: nunca fica inteiro na memória.
+    """
+    with tempfile.TemporaryFile() as copia:
+        sha256, tamanho = _copiar_com_hash(arquivo.chunks(TAMANHO_BLOCO), copia)
+        return _guardar(copia, sha256, tamanho, arquivo.name)
+
+
+def adotar_objeto(nome):
+    """
+    Registra por conteúdo um objeto que já está no storage (upload direto
+    para o bucket). Se o conteúdo já existia, o objeto novo é apagado.
+    """
+    sha256, tamanho = _copiar_com_hash(ler_em_blocos(nome, TAMANHO_BLOCO))
+    existente = ArquivoConteudo.objects.filter(sha256=sha256).first()
+    if existente is not None:
+        default_storage.delete(nome)
+        return existente
+    try:
+        with transaction.atomic():
+            return ArquivoConteudo.objects.create(sha256=sha256, tamanho=tamanho, arquivo=nome)
+    except IntegrityError:
+        default_storage.delete(nome)
+        return ArquivoConteudo.objects.get(sha256=sha256)
+
+
+# --- Upload em partes ---
+
+def _nome_parte(upload, numero):
+    return f'uploads_parciais/{upload.pk}/{numero:05d}'
+
+
+def _partes(upload):
+    # As partes em sequência, uma de cada vez e em blocos
+    for numero in range(upload.total_partes):
+        yield from ler_em_blocos(_nome_parte(upload, numero), TAMANHO_BLOCO)
+
+
+def token_conteudo(usuario, conteudo):
+    """Token que o formulário do perfil troca pelo conteúdo (`confirmar_token`)."""
+    return signing.dumps({'usuario': usuario.pk, 'conteudo': conteudo.pk}, salt=_SALT)
+
+
+def confirmar_token(usuario, token):
+    """Devolve o ArquivoConteudo de um token de `token_conteudo`."""
+    try:
+        dados = signing.loads(token, salt=_SALT, max_age=VALIDADE_TOKEN)
+    except signing.BadSignature:
+        raise ValidationError('Upload expirado ou inválido. Envie o arquivo novamente.')
+    if dados.get('usuario') != usuario.pk:
+        raise ValidationError('Upload inválido. Envie o arquivo novamente.')
+    try:
+        return ArquivoConteudo.objects.get(pk=dados['conteudo'])
+    except ArquivoConteudo.DoesNotExist:
+        raise ValidationError('O arquivo enviado não está mais disponível. Envie-o novamente.')
+
+
+def iniciar_upload(usuario, nome_arquivo, tamanho, sha256=''):
+    """
+    Abre um upload em partes. Se o navegador informar o SHA-256, o upload
+    recebe um desafio: o hash de um trecho sorteado do arquivo. Se o conteúdo
+    já existir, a resposta certa em `concluir_upload` dispensa o envio das
+    partes. (Só o hash não basta: quem soubesse o hash de um documento
+    alheio conseguiria anexá-lo sem tê-lo.)
+
+    O desafio vem mesmo quando o conteúdo não existe, para a resposta não
+    revelar quais hashes o servidor tem, e só para arquivos maiores que o
+    trecho: num arquivo menor, o trecho seria o arquivo inteiro e a prova
+    seria o próprio hash declarado.
+    """
+    try:
+        tamanho = int(tamanho)
+    except (TypeError, ValueError):
+        raise ValidationError('Tamanho do arquivo inválido.')
+    if not 0 < tamanho <= TAMANHO_MAXIMO:
+        raise ValidationError('Arquivo vazio ou maior que o permitido.')
+    sha256 = (sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise ValidationError('SHA-256 inválido.')
+
+    upload = UploadParcial(
+        usuario=usuario, nome_arquivo=(nome_arquivo or 'arquivo')[:255], tamanho=tamanho,
+        tamanho_parte=TAMANHO_PARTE, sha256=sha256,
+    )
+    if sha256 and tamanho > TAMANHO_DESAFIO:
+        upload.conteudo_existente = ArquivoConteudo.objects.filter(sha256=sha256, tamanho=tamanho).first()
+        upload.desafio_tamanho = TAMANHO_DESAFIO
+        upload.desafio_inicio = random.SystemRandom().randrange(tamanho - upload.desafio_tamanho + 1)
+    upload.save()
+    return upload
+
+
+def receber_parte(upload, numero, corpo, sha256=''):
+    """
+    Grava a parte `numero` (a partir de 0) lendo `corpo` (o request) em
+    blocos e calculando o hash enquanto os bytes chegam; se `sha256` for
+    informado, a parte é conferida. Reenviar uma parte a substitui: é o que
+    permite retomar um upload interrompido.
+    """
+    if not 0 <= numero < upload.total_partes:
+        raise ValidationError('Parte inexistente.')
+    esperado = min(upload.tamanho_parte, upload.tamanho - numero * upload.tamanho_parte)
+    with tempfile.TemporaryFile() as copia:
+        hash_parte, tamanho = _copiar_com_hash(iter(lambda: corpo.read(TAMANHO_BLOCO), b''), copia)
+        if tamanho != esperado:
+            raise ValidationError(f'A parte {numero} deveria ter {esperado} bytes, chegaram {tamanho}.')
+        if sha256 and sha256.lower() != hash_parte:
+            raise ValidationError(f'A parte {numero} chegou corrompida.')
+        nome = _nome_parte(upload, numero)
+        default_storage.delete(nome)
+        default_storage.save(nome, File(copia))
+
+    with transaction.atomic():
+        upload = UploadParcial.objects.select_for_update().get(pk=upload.pk)
+        if numero not in upload.partes_recebidas:
+            upload.partes_recebidas = sorted([*upload.partes_recebidas, numero])
+            upload.save(update_fields=['partes_recebidas'])
+    return upload
+
+
+def descartar_upload(upload):
+    """Apaga as partes já recebidas e o próprio upload."""
+    for numero in upload.partes_recebidas:
+        default_storage.delete(_nome_parte(upload, numero))
+    upload.delete()
+
+
+def concluir_upload(upload, prova=''):
+    """
+    Conclui o upload e devolve o ArquivoConteudo. Com a prova do desafio
+    correta, reaproveita o conteúdo existente sem partes; senão, junta as
+    partes (lendo em blocos e calculando o hash) e deduplica o resultado.
+    Cada desafio vale uma única tentativa.
+    """
+    if upload.desafio_tamanho and prova and not upload.partes_recebidas:
+        if upload.conteudo_existente_id:
+            trecho = ler_trecho(upload.conteudo_existente.arquivo.name, upload.desafio_inicio, upload.desafio_tamanho)
+            if hmac.compare_digest(hashlib.sha256(trecho).hexdigest(), prova.lower()):
+                conteudo = upload.conteudo_existente
+                upload.delete()
+                return conteudo
+        # Conteúdo inexistente ou prova errada: a mesma resposta nos dois casos
+        upload.desafio_inicio = upload.desafio_tamanho = None
+        upload.save(update_fields=['desafio_inicio', 'desafio_tamanho'])
+        raise ValidationError('Prova de conteúdo incorreta. Envie o arquivo.')
+
+    faltando = set(range(upload.total_partes)) - set(upload.partes_recebidas)
+    if faltando:
+        raise ValidationError(f'Faltam {len(faltando)} parte(s) do arquivo.')
+
+    with tempfile.TemporaryFile() as montado:
+        sha256, tamanho = _copiar_com_hash(_partes(upload), montado)
+        if tamanho != upload.tamanho or (upload.sha256 and sha256 != upload.sha256):
+            descartar_upload(upload)
+            raise ValidationError('O arquivo montado difere do declarado. Envie-o novamente.')
+        conteudo = _guardar(montado, sha256, tamanho, upload.nome_arquivo)
+
+    descartar_upload(upload)
+    return conteudo
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+POSTOS = [
+    'coronel', 'tenente_coronel', 'major', 'capitao', 'tenente',
+    'aspirante', 'subtenente', 'sargento', 'cabo', 'soldado',
+]
+
+
+def preencher_posto_ordem(apps, schema_editor):
+    InformacoesFuncionais = apps.get_model('funcional', 'InformacoesFuncionais')
+    InformacoesFuncionais.objects.update(posto_ordem=Case(
+        *[When(posto_graduacao=posto, then=Value(ordem)) for ordem, posto in enumerate(POSTOS, start=1)],
+        default=Value(len(POSTOS) + 1),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcional', '0003_alter_informacoesfuncionais_posto_graduacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='informacoesfuncionais',
+            name='posto_ordem',
+            field=models.PositiveSmallIntegerField(default=11, editable=False, verbose_name='Ordem do Posto'),
+        ),
+        migrations.RunPython(preencher_posto_ordem, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='informacoesfuncionais',
+            index=models.Index(fields=['posto_ordem', 'matricula'], name='funcional_posto_matricula_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:17
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcional', '0004_informacoesfuncionais_posto_ordem_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoConteudo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('tamanho', models.PositiveBigIntegerField(verbose_name='Tamanho (bytes)')),
+                ('arquivo', models.FileField(max_length=255, upload_to='documentos/conteudo/', verbose_name='Arquivo')),
+                ('referencias', models.PositiveIntegerField(default=0, verbose_name='Referências')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='conteudo',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documentos', to='funcional.arquivoconteudo'),
+        ),
+        migrations.CreateModel(
+            name='UploadParcial',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('tamanho', models.PositiveBigIntegerField()),
+                ('tamanho_parte', models.PositiveIntegerField()),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('partes_recebidas', models.JSONField(default=list)),
+                ('desafio_inicio', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('desafio_tamanho', models.PositiveIntegerField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('conteudo_existente', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='funcional.arquivoconteudo')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_parciais', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core.estatisticas import recalcular_estatisticas
+
+
+def criar_secoes_funcionais(apps, schema_editor):
+    # O painel lista a partir de InformacoesFuncionais: todo servidor precisa da linha
+    User = apps.get_model('auth', 'User')
+    InformacoesFuncionais = apps.get_model('funcional', 'InformacoesFuncionais')
+    sem_secao = User.objects.filter(is_superuser=False, info_funcionais__isnull=True).values_list('pk', flat=True)
+    criadas = InformacoesFuncionais.objects.bulk_create(
+        [InformacoesFuncionais(usuario_id=pk) for pk in sem_secao.iterator()], batch_size=1000,
+    )
+    if criadas:
+        recalcular_estatisticas(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funcional', '0005_conteudo_deduplicado'),
+        ('core', '0004_estatistica'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='informacoesfuncionais',
+            name='funcional_posto_matricula_idx',
+        ),
+        migrations.AddIndex(
+            model_name='informacoesfuncionais',
+            index=models.Index(models.F('posto_ordem'), models.Func(models.F('matricula'), output_field=models.CharField(), template="COALESCE(%(expressions)s, '')"), models.F('usuario'), name='funcional_listagem_idx'),
+        ),
+        migrations.RunPython(criar_secoes_funcionais, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,54 @@
+import uuid
+from collections import Counter
+
 from django.db import models
+from django.db.models import Case, F, Func, Value, When
+from django.db.models.lookups import Exact
 from django.contrib.auth.models import User
 
+
+def matricula_ordem():
+    """
+    Matrícula como chave de ordenação não nula (sem matrícula = ''). O
+    literal fica no texto do SQL, não num parâmetro, para a consulta repetir
+    a expressão do índice da listagem.
+    """
+    return Func(F('matricula'), template="COALESCE(%(expressions)s, '')", output_field=models.CharField())
+
+
+class InformacoesFuncionaisQuerySet(models.QuerySet):
+    """
+    Mantém `posto_ordem` em sincronia também nas operações em lote,
+    que não passam pelo save() do modelo.
+    """
+
+    def update(self, **kwargs):
+        if 'posto_graduacao' in kwargs and 'posto_ordem' not in kwargs:
+            kwargs['posto_ordem'] = InformacoesFuncionais.ordem_do_posto(kwargs['posto_graduacao'])
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.posto_ordem = InformacoesFuncionais.ordem_do_posto(obj.posto_graduacao)
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'posto_graduacao' in update_fields and 'posto_ordem' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'posto_ordem']
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'posto_graduacao' in fields and 'posto_ordem' not in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.posto_ordem = InformacoesFuncionais.ordem_do_posto(obj.posto_graduacao)
+            fields = [*fields, 'posto_ordem']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def atualizar_posto_ordem(self):
+        """Recalcula `posto_ordem` de todas as linhas com um único UPDATE."""
+        return super().update(posto_ordem=InformacoesFuncionais.ordem_do_posto(F('posto_graduacao')))
+
+
 class InformacoesFuncionais(models.Model):
     POSTO_CHOICES = [
         ('coronel', 'Coronel'), 
@@ -14,6 +62,9 @@ class InformacoesFuncionais(models.Model):
         ('cabo', 'Cabo'), 
         ('soldado', 'Soldado')
     ]
+    # Posição hierárquica de cada posto (1 = mais alto); sem posto fica por último
+    ORDEM_POSTO = {valor: ordem for ordem, (valor, _) in enumerate(POSTO_CHOICES, start=1)}
+    ORDEM_SEM_POSTO = len(POSTO_CHOICES) + 1
 
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='info_funcionais')
     nome_guerra = models.CharField("Nome de Guerra", max_length=100, blank=True)
@@ -23,15 +74,117 @@ class InformacoesFuncionais(models.Model):
     banco = models.CharField("Banco", max_length=100, blank=True)
     agencia = models.CharField("Agência", max_length=20, blank=True)
     conta_corrente = models.CharField("Conta Corrente", max_length=30, blank=True)
+    # Cópia desnormalizada da hierarquia, para ordenar a listagem pelo índice
+    posto_ordem = models.PositiveSmallIntegerField("Ordem do Posto", default=ORDEM_SEM_POSTO, editable=False)
+
+    objects = InformacoesFuncionaisQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Exatamente as chaves da listagem do painel (core.consultas.CHAVES_LISTAGEM)
+            models.Index(F('posto_ordem'), matricula_ordem(), F('usuario'), name='funcional_listagem_idx'),
+        ]
+
+    @classmethod
+    def ordem_do_posto(cls, posto):
+        """
+        Devolve a ordem hierárquica de um posto. Aceita também uma expressão
+        (ex.: F('posto_graduacao')), caso em que devolve um CASE equivalente.
+        """
+        if isinstance(posto, str) or posto is None:
+            return cls.ORDEM_POSTO.get(posto, cls.ORDEM_SEM_POSTO)
+        return Case(
+            *[When(Exact(posto, valor), then=Value(ordem)) for valor, ordem in cls.ORDEM_POSTO.items()],
+            default=Value(cls.ORDEM_SEM_POSTO),
+            output_field=models.PositiveSmallIntegerField(),
+        )
+
+    def save(self, *args, **kwargs):
+        self.posto_ordem = self.ordem_do_posto(self.posto_graduacao)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'posto_graduacao' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'posto_ordem'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.get_posto_graduacao_display()} {self.nome_guerra}' if self.nome_guerra else self.usuario.username
 
 
+class ArquivoConteudo(models.Model):
+    """
+    Um arquivo guardado uma única vez por conteúdo (SHA-256), compartilhado
+    por todos os documentos com os mesmos bytes. `referencias` conta esses
+    documentos; ao chegar a zero, o arquivo é apagado (funcional/signals.py).
+    """
+    sha256 = models.CharField("SHA-256", max_length=64, unique=True)
+    tamanho = models.PositiveBigIntegerField("Tamanho (bytes)")
+    arquivo = models.FileField("Arquivo", upload_to='documentos/conteudo/', max_length=255)
+    referencias = models.PositiveIntegerField("Referências", default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+    @classmethod
+    def adicionar_referencias(cls, ids, delta=1):
+        """Soma `delta` às referências de cada id (repetidos contam várias vezes)."""
+        for pk, vezes in Counter(pk for pk in ids if pk is not None).items():
+            cls.objects.filter(pk=pk).update(referencias=F('referencias') + delta * vezes)
+
+
+class DocumentoQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create não chama save(): conta as novas referências aqui
+        objs = super().bulk_create(objs, *args, **kwargs)
+        ArquivoConteudo.adicionar_referencias(obj.conteudo_id for obj in objs)
+        return objs
+
+
 class Documento(models.Model):
     info_funcional = models.ForeignKey(InformacoesFuncionais, on_delete=models.CASCADE, related_name='documentos')
     nome_documento = models.CharField("Nome do Documento", max_length=255)
+    # `arquivo` aponta para o mesmo objeto de `conteudo.arquivo`; documentos
+    # anteriores à deduplicação não têm `conteudo`
     arquivo = models.FileField("Arquivo", upload_to='documentos/')
+    conteudo = models.ForeignKey(ArquivoConteudo, on_delete=models.PROTECT, null=True, blank=True,
+                                 related_name='documentos', editable=False)
+
+    objects = DocumentoQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        novo = self._state.adding
+        super().save(*args, **kwargs)
+        if novo:
+            ArquivoConteudo.adicionar_referencias([self.conteudo_id])
+
+    def __str__(self):
+        return self.nome_documento
+
+
+class UploadParcial(models.Model):
+    """
+    Upload de um documento em partes (ver funcional/conteudo.py). As partes
+    ficam no storage até a conclusão, quando são juntadas e deduplicadas.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads_parciais')
+    nome_arquivo = models.CharField(max_length=255)
+    tamanho = models.PositiveBigIntegerField()
+    tamanho_parte = models.PositiveIntegerField()
+    # Hash informado pelo navegador (opcional); confere o arquivo montado
+    sha256 = models.CharField(max_length=64, blank=True)
+    partes_recebidas = models.JSONField(default=list)
+    # Conteúdo já existente com o mesmo hash: o envio pode ser dispensado se
+    # o navegador provar que tem o arquivo (hash de um trecho sorteado). O
+    # desafio é dado mesmo sem conteúdo existente, que nunca é revelado
+    conteudo_existente = models.ForeignKey(ArquivoConteudo, on_delete=models.SET_NULL, null=True, blank=True)
+    desafio_inicio = models.PositiveBigIntegerField(null=True, blank=True)
+    desafio_tamanho = models.PositiveIntegerField(null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def total_partes(self):
+        return max(1, -(-self.tamanho // self.tamanho_parte))
 
     def __str__(self):
-        return self.nome_documento
\ No newline at end of file
+        return f'{self.nome_arquivo} ({len(self.partes_recebidas)}/{self.total_partes})'
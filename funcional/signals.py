@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete
+
+from .models import ArquivoConteudo, Documento
+
+
+def _apagar_se_sem_referencias(conteudo_id, nome):
+    # Só apaga se ninguém voltou a usar o conteúdo até o commit
+    if ArquivoConteudo.objects.filter(pk=conteudo_id, referencias=0).delete()[0]:
+        default_storage.delete(nome)
+
+
+def documento_apagado(sender, instance, **kwargs):
+    if instance.conteudo_id is None:
+        return
+    ArquivoConteudo.adicionar_referencias([instance.conteudo_id], delta=-1)
+    nome = ArquivoConteudo.objects.filter(pk=instance.conteudo_id, referencias=0).values_list(
+        'arquivo', flat=True
+    ).first()
+    if nome:
+        transaction.on_commit(lambda: _apagar_se_sem_referencias(instance.conteudo_id, nome))
+
+
+post_delete.connect(documento_apagado, sender=Documento)
@@ -1,3 +1,208 @@
+import hashlib
+import io
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.test import TestCase
+from django.urls import reverse
+
+from core.testes import armazenamento_de_testes
+from .conteudo import (
+    TAMANHO_DESAFIO, TAMANHO_PARTE, armazenar_arquivo, concluir_upload, iniciar_upload, receber_parte,
+)
+from .models import ArquivoConteudo, Documento, UploadParcial
+
+
+def _sha256(dados):
+    return hashlib.sha256(dados).hexdigest()
+
+
+@armazenamento_de_testes
+class DeduplicacaoTests(TestCase):
+    """
+    Documentos com os mesmos bytes compartilham um ArquivoConteudo, que conta
+    as referências e só é apagado (com o arquivo) quando a última some.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('servidor_testes')
+        cls.funcional = cls.usuario.info_funcionais
+
+    def _documento(self, conteudo, nome='RG'):
+        return Documento.objects.create(
+            info_funcional=self.funcional, nome_documento=nome, conteudo=conteudo, arquivo=conteudo.arquivo.name,
+        )
+
+    def test_mesmo_conteudo_guardado_uma_vez(self):
+        primeiro = armazenar_arquivo(ContentFile(b'%PDF-1.4 mesmo conteudo', name='a.pdf'))
+        segundo = armazenar_arquivo(ContentFile(b'%PDF-1.4 mesmo conteudo', name='b.pdf'))
+        outro = armazenar_arquivo(ContentFile(b'%PDF-1.4 outro conteudo', name='a.pdf'))
+        self.assertEqual(primeiro.pk, segundo.pk)
+        self.assertNotEqual(primeiro.pk, outro.pk)
+        self.assertEqual(primeiro.sha256, _sha256(b'%PDF-1.4 mesmo conteudo'))
+        self.assertTrue(default_storage.exists(primeiro.arquivo.name))
+
+    def test_referencias_ao_excluir(self):
+        conteudo = armazenar_arquivo(ContentFile(b'conteudo compartilhado', name='doc.pdf'))
+        primeiro = self._documento(conteudo)
+        self._documento(conteudo, 'CPF')
+        # bulk_create também conta as referências
+        Documento.objects.bulk_create([
+            Documento(info_funcional=self.funcional, nome_documento='CNH', conteudo=conteudo,
+                      arquivo=conteudo.arquivo.name),
+        ])
+        conteudo.refresh_from_db()
+        self.assertEqual(conteudo.referencias, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primeiro.delete()
+        conteudo.refresh_from_db()
+        self.assertEqual(conteudo.referencias, 2)
+        self.assertTrue(default_storage.exists(conteudo.arquivo.name))
+
+        # Os demais saem em cascata com o usuário: o conteúdo e o arquivo também
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.delete()
+        self.assertFalse(ArquivoConteudo.objects.filter(pk=conteudo.pk).exists())
+        self.assertFalse(default_storage.exists(conteudo.arquivo.name))
+
+    def test_conteudo_reaproveitado_antes_do_commit(self):
+        conteudo = armazenar_arquivo(ContentFile(b'reaproveitado', name='doc.pdf'))
+        documento = self._documento(conteudo)
+        with self.captureOnCommitCallbacks(execute=True):
+            documento.delete()
+            # Outro documento volta a usar o conteúdo na mesma transação
+            self._documento(conteudo, 'Novo')
+        conteudo.refresh_from_db()
+        self.assertEqual(conteudo.referencias, 1)
+        self.assertTrue(default_storage.exists(conteudo.arquivo.name))
+
+
+@armazenamento_de_testes
+class UploadEmPartesTests(TestCase):
+    """
+    O upload em partes monta o arquivo no servidor e o deduplica; com o
+    hash de um conteúdo existente, a prova de posse dispensa o envio.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('servidor_testes')
+        cls.outro = User.objects.create_user('outro_servidor')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _enviar(self, dados, nome='grande.pdf'):
+        resposta = self.client.post(
+            reverse('iniciar_upload_documento'), {'nome': nome, 'tamanho': len(dados), 'sha256': _sha256(dados)},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        estado = resposta.json()
+        for numero in range(estado['total_partes']):
+            parte = dados[numero * estado['tamanho_parte']:(numero + 1) * estado['tamanho_parte']]
+            resposta = self.client.put(
+                f'{estado["url"]}partes/{numero}/', parte, content_type='application/octet-stream',
+                headers={'X-Conteudo-Sha256': _sha256(parte)},
+            )
+            self.assertEqual(resposta.status_code, 200)
+        return self.client.post(f'{estado["url"]}concluir/'), estado
+
+    def test_envio_em_partes_e_perfil(self):
+        dados = b'%PDF-1.4\n' + bytes(range(256)) * (TAMANHO_PARTE // 256) + b'%%EOF'
+        resposta, estado = self._enviar(dados)
+        self.assertEqual(estado['total_partes'], 2)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(UploadParcial.objects.exists())
+        self.assertFalse(default_storage.exists(f'uploads_parciais/{estado["upload"]}/00000'))
+
+        conteudo = ArquivoConteudo.objects.get(sha256=_sha256(dados))
+        with default_storage.open(conteudo.arquivo.name) as arquivo:
+            self.assertEqual(arquivo.read(), dados)
+
+        # O token vai no formulário do perfil e vira um documento
+        resposta = self.client.post(reverse('perfil_usuario'), {
+            'nome_documento': ['Certidão'], 'conteudo_documento': [resposta.json()['token']],
+        })
+        self.assertRedirects(resposta, reverse('perfil_usuario'))
+        documento = Documento.objects.get(info_funcional__usuario=self.usuario)
+        self.assertEqual(documento.conteudo_id, conteudo.pk)
+        conteudo.refresh_from_db()
+        self.assertEqual(conteudo.referencias, 1)
+
+    def test_token_de_outro_usuario(self):
+        resposta, _ = self._enviar(b'%PDF-1.4 pequeno')
+        token = resposta.json()['token']
+        self.client.force_login(self.outro)
+        self.client.post(reverse('perfil_usuario'), {'nome_documento': ['Certidão'], 'conteudo_documento': [token]})
+        self.assertFalse(Documento.objects.exists())
+
+    def test_parte_corrompida_ou_incompleta(self):
+        upload = iniciar_upload(self.usuario, 'doc.pdf', 100)
+        with self.assertRaisesMessage(ValidationError, 'corrompida'):
+            receber_parte(upload, 0, io.BytesIO(b'x' * 100), sha256=_sha256(b'y' * 100))
+        with self.assertRaisesMessage(ValidationError, 'deveria ter 100 bytes'):
+            receber_parte(upload, 0, io.BytesIO(b'x' * 99))
+        with self.assertRaisesMessage(ValidationError, 'Faltam 1 parte'):
+            concluir_upload(upload)
+
+    def test_arquivo_montado_diferente_do_declarado(self):
+        upload = iniciar_upload(self.usuario, 'doc.pdf', 10, sha256=_sha256(b'0123456789'))
+        receber_parte(upload, 0, io.BytesIO(b'9876543210'))
+        upload.refresh_from_db()
+        with self.assertRaisesMessage(ValidationError, 'difere do declarado'):
+            concluir_upload(upload)
+        self.assertFalse(UploadParcial.objects.exists())
+
+
+@armazenamento_de_testes
+class DesafioConteudoTests(TestCase):
+    """
+    Só o hash não dá acesso a um conteúdo: a prova é o hash de um trecho
+    sorteado, e a resposta não revela se o conteúdo existe.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('servidor_testes')
+        cls.dados = bytes(range(256)) * (2 * TAMANHO_DESAFIO // 256)
+        cls.conteudo = armazenar_arquivo(ContentFile(cls.dados, name='existente.pdf'))
+
+    def _prova(self, upload, dados):
+        return _sha256(dados[upload.desafio_inicio:upload.desafio_inicio + upload.desafio_tamanho])
+
+    def test_prova_correta_reaproveita_o_conteudo(self):
+        upload = iniciar_upload(self.usuario, 'copia.pdf', len(self.dados), _sha256(self.dados))
+        self.assertEqual(upload.desafio_tamanho, TAMANHO_DESAFIO)
+        self.assertEqual(concluir_upload(upload, self._prova(upload, self.dados)), self.conteudo)
+        self.assertFalse(UploadParcial.objects.exists())
+
+    def test_prova_errada_vale_uma_tentativa(self):
+        upload = iniciar_upload(self.usuario, 'copia.pdf', len(self.dados), _sha256(self.dados))
+        prova = self._prova(upload, self.dados)
+        with self.assertRaisesMessage(ValidationError, 'Prova de conteúdo incorreta'):
+            concluir_upload(upload, '0' * 64)
+        upload.refresh_from_db()
+        self.assertIsNone(upload.desafio_tamanho)
+        # Sem desafio, a única saída é enviar as partes
+        with self.assertRaisesMessage(ValidationError, 'Faltam'):
+            concluir_upload(upload, prova)
+
+    def test_conteudo_inexistente_recebe_o_mesmo_desafio(self):
+        outros = bytes(reversed(self.dados))
+        upload = iniciar_upload(self.usuario, 'novo.pdf', len(outros), _sha256(outros))
+        self.assertEqual(upload.desafio_tamanho, TAMANHO_DESAFIO)
+        with self.assertRaisesMessage(ValidationError, 'Prova de conteúdo incorreta'):
+            concluir_upload(upload, self._prova(upload, outros))
 
-# Create your tests here.
+    def test_arquivo_pequeno_sem_desafio(self):
+        # No arquivo pequeno o trecho seria o arquivo todo, e a prova, o hash declarado
+        pequeno = self.dados[:TAMANHO_DESAFIO]
+        armazenar_arquivo(ContentFile(pequeno, name='pequeno.pdf'))
+        upload = iniciar_upload(self.usuario, 'pequeno.pdf', len(pequeno), _sha256(pequeno))
+        self.assertIsNone(upload.desafio_tamanho)
+        with self.assertRaisesMessage(ValidationError, 'Faltam'):
+            concluir_upload(upload, _sha256(pequeno))
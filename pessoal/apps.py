@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PessoalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pessoal'
+
+    def ready(self):
+        # Apaga as miniaturas de fotos trocadas ou removidas
+        from . import signals  # noqa: F401
@@ -0,0 +1,140 @@
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# Tamanhos gerados a partir da foto original: nome -> (lado em px, recorte quadrado?)
+TAMANHOS = {
+    'mini': (64, True),       # listas e sugestões da busca
+    'cartao': (300, True),    # ficha do servidor (exibida a 150px, 2x para telas densas)
+    'grande': (1200, False),  # teto para a visualização ampliada
+}
+
+# Formatos gerados: extensão -> (formato do Pillow, Content-Type, opções de gravação)
+FORMATOS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Opções extras quando a geração roda fora de uma requisição (comando
+# gerar_derivados_fotos): o WebP com method=6 sai menor, mas leva várias
+# vezes mais tempo para codificar
+OPCOES_OTIMIZADAS = {
+    'webp': {'method': 6},
+}
+
+# O nome de um derivado é determinado pelo nome da foto original, que nunca é
+# reaproveitado (o storage não sobrescreve): o conteúdo de uma URL de derivado
+# nunca muda e pode ficar em cache indefinidamente.
+CACHE_CONTROL_DERIVADOS = 'public, max-age=31536000, immutable'
+
+logger = logging.getLogger(__name__)
+
+
+def nome_derivado(nome_foto, tamanho, formato):
+    """
+    Nome no storage de um derivado, ao lado da original:
+    fotos_pessoais/eu.png -> fotos_pessoais/derivados/eu_cartao.webp
+    """
+    pasta, arquivo = posixpath.split(nome_foto)
+    base = posixpath.splitext(arquivo)[0]
+    return posixpath.join(pasta, 'derivados', f'{base}_{tamanho}.{formato}')
+
+
+def _storage_derivados():
+    # No S3, os derivados são gravados com um Cache-Control próprio, bem mais
+    # longo que o das fotos originais e documentos
+    parametros = getattr(default_storage, 'object_parameters', None)
+    if parametros is None:
+        return default_storage
+    return default_storage.__class__(
+        object_parameters={**parametros, 'CacheControl': CACHE_CONTROL_DERIVADOS},
+    )
+
+
+def _redimensionar(imagem, lado, quadrado):
+    from PIL import Image, ImageOps
+
+    if quadrado:
+        return ImageOps.fit(imagem, (lado, lado), Image.Resampling.LANCZOS)
+    copia = imagem.copy()
+    copia.thumbnail((lado, lado), Image.Resampling.LANCZOS)  # nunca amplia
+    return copia
+
+
+def gerar_derivados(nome_foto, otimizar=False):
+    """
+    Gera todos os tamanhos e formatos de uma foto já gravada no storage.
+    A original é lida uma única vez; cada derivado é regravado do zero.
+    Com `otimizar`, usa as opções mais lentas de OPCOES_OTIMIZADAS.
+    """
+    # O Pillow é importado no primeiro uso: as views importam este módulo
+    # pelas constantes, e a maioria das requisições não mexe em imagens
+    from PIL import Image, ImageOps
+
+    with default_storage.open(nome_foto, 'rb') as arquivo:
+        imagem = Image.open(arquivo)
+        imagem.load()
+    # Fotos de celular vêm deitadas com a rotação só no EXIF
+    imagem = ImageOps.exif_transpose(imagem).convert('RGB')
+
+    storage = _storage_derivados()
+    for tamanho, (lado, quadrado) in TAMANHOS.items():
+        redimensionada = _redimensionar(imagem, lado, quadrado)
+        for formato, (formato_pil, _, opcoes) in FORMATOS.items():
+            if otimizar:
+                opcoes = {**opcoes, **OPCOES_OTIMIZADAS.get(formato, {})}
+            buffer = BytesIO()
+            redimensionada.save(buffer, formato_pil, **opcoes)
+            nome = nome_derivado(nome_foto, tamanho, formato)
+            # Sem isso o storage geraria um nome alternativo em vez de regravar
+            storage.delete(nome)
+            storage.save(nome, ContentFile(buffer.getvalue()))
+
+
+def apagar_derivados(nome_foto):
+    """Apaga do storage os derivados de uma foto (os que existirem)."""
+    storage = _storage_derivados()
+    for tamanho in TAMANHOS:
+        for formato in FORMATOS:
+            storage.delete(nome_derivado(nome_foto, tamanho, formato))
+
+
+def garantir_derivados(info_pessoais, otimizar=False):
+    """
+    Gera os derivados da foto atual se ainda não existirem. `foto_derivados`
+    guarda o nome da foto para a qual eles foram gerados: trocar a foto
+    invalida os derivados sem precisar de nenhum gatilho.
+
+    Devolve True se os derivados foram gerados agora. Se o Pillow não
+    conseguir ler a foto (arquivo corrompido, formato desconhecido, imagem
+    grande demais), registra o erro e devolve False sem gerar nada: quem
+    chama continua usando a foto original.
+    """
+    from PIL import Image
+
+    foto = info_pessoais.foto.name
+    if not foto or info_pessoais.foto_derivados == foto:
+        return False
+    try:
+        gerar_derivados(foto, otimizar=otimizar)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        logger.warning('Não foi possível gerar as miniaturas de %s.', foto, exc_info=True)
+        return False
+    info_pessoais.foto_derivados = foto
+    # update() e não save(): não é uma alteração cadastral, e a condição
+    # evita sobrescrever uma foto trocada durante a geração
+    type(info_pessoais).objects.filter(pk=info_pessoais.pk, foto=foto).update(foto_derivados=foto)
+    return True
+
+
+def derivados_prontos(info_pessoais):
+    """Se os derivados da foto atual já foram gerados."""
+    return bool(info_pessoais.foto) and info_pessoais.foto_derivados == info_pessoais.foto.name
+
+
+def url_derivado(info_pessoais, tamanho, formato):
+    """URL pública de um derivado já gerado."""
+    return default_storage.url(nome_derivado(info_pessoais.foto.name, tamanho, formato))
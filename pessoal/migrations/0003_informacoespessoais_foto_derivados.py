@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pessoal', '0002_alter_informacoespessoais_cnh_categoria_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='informacoespessoais',
+            name='foto_derivados',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
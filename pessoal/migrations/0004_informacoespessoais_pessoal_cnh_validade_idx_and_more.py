@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:17
+
+import django.db.models.expressions
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pessoal', '0003_informacoespessoais_foto_derivados'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='informacoespessoais',
+            index=models.Index(fields=['cnh_validade'], name='pessoal_cnh_validade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='informacoespessoais',
+            index=models.Index(fields=['data_nascimento'], name='pessoal_nascimento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='informacoespessoais',
+            index=models.Index(models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.datetime.ExtractMonth('data_nascimento'), '*', models.Value(100)), '+', django.db.models.functions.datetime.ExtractDay('data_nascimento')), output_field=models.IntegerField()), name='pessoal_aniversario_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from datetime import date
+
+from core.idades import IdadeQuerySet, calcular_idade, mes_dia
 
 class InformacoesPessoais(models.Model):
     ESTADO_CIVIL_CHOICES = [('solteiro', 'Solteiro(a)'), ('casado', 'Casado(a)'), ('divorciado', 'Divorciado(a)'), ('viuvo', 'Viúvo(a)')]
@@ -9,6 +10,8 @@ class InformacoesPessoais(models.Model):
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='info_pessoais')
     nome_completo = models.CharField("Nome Completo", max_length=255, blank=True)
     foto = models.ImageField("Foto", upload_to='fotos_pessoais/', blank=True, null=True)
+    # Nome da foto para a qual as miniaturas (pessoal/imagens.py) já foram geradas
+    foto_derivados = models.CharField(max_length=255, blank=True, editable=False)
     cpf = models.CharField("CPF", max_length=14, unique=True, null=True, blank=True)
     rg = models.CharField("RG", max_length=20, blank=True)
     data_nascimento = models.DateField("Data de Nascimento", null=True, blank=True)
@@ -26,12 +29,21 @@ class InformacoesPessoais(models.Model):
     secao = models.CharField("Seção Eleitoral", max_length=10, blank=True)
     municipio_votacao = models.CharField("Município de Votação", max_length=100, blank=True)
 
+    # A idade também é calculada em bulk_create e pode ser recalculada
+    # em lote (manage.py recalcular_idades)
+    objects = IdadeQuerySet.as_manager()
+
+    class Meta:
+        # Relatórios por período (core/relatorios.py): CNHs vencendo,
+        # nascidos num intervalo e aniversariantes (pelo mês/dia)
+        indexes = [
+            models.Index(fields=['cnh_validade'], name='pessoal_cnh_validade_idx'),
+            models.Index(fields=['data_nascimento'], name='pessoal_nascimento_idx'),
+            models.Index(mes_dia('data_nascimento'), name='pessoal_aniversario_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        if self.data_nascimento:
-            today = date.today()
-            self.idade = today.year - self.data_nascimento.year - ((today.month, today.day) < (self.data_nascimento.month, self.data_nascimento.day))
-        else:
-            self.idade = None
+        self.idade = calcular_idade(self.data_nascimento)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .imagens import apagar_derivados
+from .models import InformacoesPessoais
+
+
+def foto_salva(sender, instance, **kwargs):
+    # Foto trocada ou removida: as miniaturas da anterior não servem mais
+    anterior = instance.foto_derivados
+    if not anterior or anterior == instance.foto.name:
+        return
+    instance.foto_derivados = ''
+    sender.objects.filter(pk=instance.pk, foto_derivados=anterior).update(foto_derivados='')
+    transaction.on_commit(lambda: apagar_derivados(anterior))
+
+
+def foto_apagada(sender, instance, **kwargs):
+    if instance.foto_derivados:
+        transaction.on_commit(lambda: apagar_derivados(instance.foto_derivados))
+
+
+post_save.connect(foto_salva, sender=InformacoesPessoais)
+post_delete.connect(foto_apagada, sender=InformacoesPessoais)
@@ -0,0 +1,36 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import format_html
+
+from pessoal.imagens import TAMANHOS, derivados_prontos, url_derivado
+
+register = template.Library()
+
+
+def _url(info_pessoais, tamanho, formato):
+    if derivados_prontos(info_pessoais):
+        return url_derivado(info_pessoais, tamanho, formato)
+    # Ainda não geradas: a view gera na primeira requisição e redireciona
+    return reverse('foto_derivada', args=[info_pessoais.usuario_id, tamanho, formato])
+
+
+@register.simple_tag
+def foto_servidor(info_pessoais, tamanho='cartao', classe='', estilo='', alt=''):
+    """
+    <picture> com a foto do servidor no tamanho pedido, em WebP e, para
+    navegadores antigos, JPEG. Uso: {% foto_servidor info_pessoais 'cartao' classe='...' %}
+    """
+    lado = TAMANHOS[tamanho][0]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" alt="{}" class="{}" style="{}" width="{}" height="{}" loading="lazy" decoding="async"></picture>',
+        _url(info_pessoais, tamanho, 'webp'),
+        _url(info_pessoais, tamanho, 'jpg'),
+        alt, classe, estilo, lado, lado,
+    )
+
+
+@register.simple_tag
+def foto_servidor_url(info_pessoais, tamanho='grande', formato='jpg'):
+    """URL de um derivado da foto, ex.: para o link da versão ampliada."""
+    return _url(info_pessoais, tamanho, formato)
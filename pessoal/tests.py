@@ -1,3 +1,77 @@
+from datetime import date
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from core.estatisticas import contar_estatisticas
+from core.idades import calcular_idade
+from core.models import Estatistica
+from core.testes import armazenamento_de_testes
+from .models import InformacoesPessoais
+
+
+@armazenamento_de_testes
+class IdadeTests(TestCase):
+    """
+    A idade gravada é calculada no save e no bulk_create, a expressão SQL
+    dá o mesmo resultado que o Python, e o recálculo diário só mexe nas
+    linhas que mudaram.
+    """
+
+    # Véspera, dia e dia seguinte do aniversário, e um 29 de fevereiro
+    NASCIMENTOS = [date(1990, 6, 14), date(1990, 6, 15), date(1990, 6, 16), date(2000, 2, 29), date(2000, 3, 1)]
+
+    @classmethod
+    def setUpTestData(cls):
+        for indice, nascimento in enumerate(cls.NASCIMENTOS):
+            InformacoesPessoais.objects.create(
+                usuario=User.objects.create_user(f'servidor_{indice}'), data_nascimento=nascimento,
+            )
+        InformacoesPessoais.objects.create(usuario=User.objects.create_user('sem_data'))
+
+    def test_calcular_idade(self):
+        hoje = date(2025, 6, 15)
+        self.assertEqual([calcular_idade(n, hoje) for n in self.NASCIMENTOS], [35, 35, 34, 25, 25])
+        self.assertEqual(calcular_idade(date(2000, 2, 29), date(2025, 2, 28)), 24)
+        self.assertIsNone(calcular_idade(None, hoje))
+
+    def test_expressao_igual_ao_python(self):
+        for hoje in (date(2025, 6, 15), date(2025, 2, 28), date(2025, 3, 1), date(2024, 2, 29)):
+            for pessoais in InformacoesPessoais.objects.com_idade_atual(hoje):
+                self.assertEqual(pessoais.idade_atual, calcular_idade(pessoais.data_nascimento, hoje), hoje)
+
+    def test_idade_gravada_no_save_e_no_bulk_create(self):
+        pessoais = InformacoesPessoais.objects.get(usuario__username='servidor_0')
+        self.assertEqual(pessoais.idade, calcular_idade(pessoais.data_nascimento))
+
+        novo, = InformacoesPessoais.objects.bulk_create([
+            InformacoesPessoais(usuario=User.objects.create_user('em_lote'), data_nascimento=date(1980, 1, 1)),
+        ])
+        self.assertEqual(novo.idade, calcular_idade(date(1980, 1, 1)))
+
+    def test_recalcular_so_as_desatualizadas(self):
+        self.assertFalse(InformacoesPessoais.objects.desatualizados().exists())
+        self.assertEqual(InformacoesPessoais.objects.recalcular_idades(), 0)
+        # Em outro ano, todos os que têm data mudam de idade
+        self.assertEqual(InformacoesPessoais.objects.desatualizados(date(2100, 1, 1)).count(), len(self.NASCIMENTOS))
+
+        InformacoesPessoais.objects.update(idade=1)
+        # Os sem data também, porque a idade deles deveria ser nula
+        self.assertEqual(InformacoesPessoais.objects.recalcular_idades(), len(self.NASCIMENTOS) + 1)
+        for pessoais in InformacoesPessoais.objects.all():
+            self.assertEqual(pessoais.idade, calcular_idade(pessoais.data_nascimento))
+
+    def test_comando(self):
+        InformacoesPessoais.objects.filter(usuario__username='servidor_0').update(idade=1)
+        saida = StringIO()
+        call_command('recalcular_idades', '--simular', stdout=saida)
+        self.assertIn('servidores: 1 idade(s)', saida.getvalue())
+        self.assertEqual(InformacoesPessoais.objects.get(usuario__username='servidor_0').idade, 1)
+
+        call_command('recalcular_idades', stdout=StringIO())
+        self.assertFalse(InformacoesPessoais.objects.desatualizados().exists())
+        # As faixas etárias da tabela de estatísticas acompanham
+        gravadas = {(e.dimensao, e.valor): e.quantidade for e in Estatistica.objects.all() if e.quantidade}
+        self.assertEqual(gravadas, {chave: total for chave, total in contar_estatisticas().items() if total})
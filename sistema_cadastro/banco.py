@@ -0,0 +1,62 @@
+"""
+Configuração da conexão com o banco por modo (DB_CONEXAO). Fica fora do
+settings.py porque o comando benchmark_conexoes monta os mesmos modos lado
+a lado para compará-los.
+"""
+import importlib.util
+
+import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
+
+# persistente:      uma conexão por processo, reaproveitada por até
+#                   conn_max_age segundos (o padrão antigo). Cada instância
+#                   da Vercel segura a sua enquanto estiver viva.
+# pool:             pool de conexões no processo (Django 5.1+, exige
+#                   psycopg 3 com psycopg-pool). As conexões voltam ao pool
+#                   no fim de cada requisição e o handshake TLS é pago só
+#                   quando o pool cresce.
+# pgbouncer:        PgBouncer externo em modo transação (no Supabase, o
+#                   pooler na porta 6543). A conexão do servidor muda a cada
+#                   transação, então nada de cursores no servidor nem de
+#                   prepared statements.
+# sem_persistencia: abre e fecha uma conexão por requisição.
+MODOS_CONEXAO = ('persistente', 'pool', 'pgbouncer', 'sem_persistencia')
+
+
+def configurar_banco(url, modo='persistente', conn_max_age=600, ssl=True, pool_min=1, pool_max=4):
+    """Dicionário de DATABASES['default'] para o `modo` escolhido."""
+    if modo not in MODOS_CONEXAO:
+        raise ImproperlyConfigured(
+            f'DB_CONEXAO inválido: {modo!r}. Use um destes: {", ".join(MODOS_CONEXAO)}.'
+        )
+    persistente = modo in ('persistente', 'pgbouncer')
+    # parse() e não config(): config() daria preferência à variável de
+    # ambiente DATABASE_URL sobre a `url` recebida (o benchmark_conexoes
+    # passa URLs diferentes para cada modo)
+    banco = dj_database_url.parse(
+        url,
+        conn_max_age=conn_max_age if persistente else 0,
+        # Conexão parada há muito tempo pode ter sido derrubada pelo servidor
+        # (ou pelo pooler): testa antes de reaproveitar
+        conn_health_checks=persistente,
+        ssl_require=ssl,
+    )
+    if banco.get('ENGINE') != 'django.db.backends.postgresql':
+        # Ex.: SQLite local; o resto só vale para o PostgreSQL
+        banco.get('OPTIONS', {}).pop('sslmode', None)
+        return banco
+
+    psycopg3 = importlib.util.find_spec('psycopg') is not None
+    opcoes = banco.setdefault('OPTIONS', {})
+    if modo == 'pool':
+        if not psycopg3 or importlib.util.find_spec('psycopg_pool') is None:
+            raise ImproperlyConfigured('DB_CONEXAO=pool exige os pacotes psycopg[binary] e psycopg-pool.')
+        # O pool substitui a conexão persistente e já faz o health check
+        opcoes['pool'] = {'min_size': pool_min, 'max_size': pool_max, 'timeout': 10}
+    elif modo == 'pgbouncer':
+        banco['DISABLE_SERVER_SIDE_CURSORS'] = True
+        if psycopg3:
+            # O psycopg 3 prepara consultas repetidas no servidor; com a
+            # conexão trocando a cada transação, o statement some
+            opcoes['prepare_threshold'] = None
+    return banco
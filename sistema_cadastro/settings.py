@@ -1,7 +1,8 @@
 import os
 from pathlib import Path
-import dj_database_url
+from .banco import configurar_banco
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 from urllib.parse import quote_plus
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'whitenoise.runserver_nostatic',
     # Minhas Apps
     'core',
@@ -59,6 +61,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,7 +74,8 @@ ROOT_URLCONF = 'sistema_cadastro.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que mede o tempo de renderização (core.metricas)
+        'BACKEND': 'core.metricas.TemplatesMedidos',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -97,18 +101,73 @@ DB_HOST = config('DB_HOST')
 DB_PORT = config('DB_PORT')
 
 DATABASE_URL = f"postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Uma DATABASE_URL completa no ambiente tem precedência sobre a montada acima
+DATABASE_URL = config('DATABASE_URL', default=DATABASE_URL)
 
 
-# --- INÍCIO DA CORREÇÃO 2: DATABASE SSL ---
-# (Esta parte já estava correta, é para conectar ao Supabase)
+# Modo de conexão (ver sistema_cadastro/banco.py): persistente, pool,
+# pgbouncer ou sem_persistencia. Na Vercel, o recomendado é `pgbouncer`
+# apontando DB_HOST/DB_PORT para o pooler do Supabase em modo transação
+# (porta 6543). Nesse modo o fuso do banco deve ser UTC: o Django só envia
+# SET TIME ZONE quando difere, e esse SET ficaria na conexão compartilhada.
+DB_CONEXAO = config('DB_CONEXAO', default='persistente')
 DATABASES = {
-    'default': dj_database_url.config(
-        default=DATABASE_URL, 
-        conn_max_age=600,
-        ssl_require=True  # <-- Correção para Supabase
+    'default': configurar_banco(
+        DATABASE_URL,
+        modo=DB_CONEXAO,
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
+        ssl=config('DB_SSL', default=True, cast=bool),  # o Supabase exige SSL
+        pool_min=config('DB_POOL_MIN', default=1, cast=int),
+        pool_max=config('DB_POOL_MAX', default=4, cast=int),
     )
 }
-# --- FIM DA CORREÇÃO 2 ---
+
+
+# Cache
+# Por padrão usa memória local; para compartilhar entre processos, defina
+# CACHE_BACKEND (ex.: django.core.cache.backends.redis.RedisCache) e CACHE_LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='sistema-cadastro'),
+    }
+}
+# Tempo (segundos) que resultados de consultas ficam no cache. Não afeta a
+# consistência: a chave muda assim que os dados mudam (ver core/cache.py).
+CACHE_DADOS_TIMEOUT = config('CACHE_DADOS_TIMEOUT', default=600, cast=int)
+
+
+# Sessões (SESSAO_MODO):
+# cache:  sessão no cache com cópia no banco; o banco só é lido quando a
+#         sessão falta no cache. Exige cache compartilhado entre processos
+#         (Redis, Memcached): com o LocMemCache, um logout numa instância não
+#         chegaria ao cache das outras.
+# banco:  uma consulta à tabela de sessões por requisição.
+# cookie: sessão assinada no próprio cookie, sem banco nem cache. Não há
+#         como encerrá-la pelo servidor antes de expirar, e o conteúdo
+#         (só os dados de login, neste sistema) fica legível no navegador.
+MODOS_SESSAO = {
+    'cache': 'django.contrib.sessions.backends.cached_db',
+    'banco': 'django.contrib.sessions.backends.db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}
+_CACHE_LOCAL = CACHES['default']['BACKEND'] in (
+    'django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache',
+)
+SESSAO_MODO = config('SESSAO_MODO', default='banco' if _CACHE_LOCAL else 'cache')
+if SESSAO_MODO not in MODOS_SESSAO:
+    raise ImproperlyConfigured(f'SESSAO_MODO inválido: {SESSAO_MODO!r}. Use um destes: {", ".join(MODOS_SESSAO)}.')
+SESSION_ENGINE = MODOS_SESSAO[SESSAO_MODO]
+
+# O usuário logado fica em cache por alguns segundos (core/autenticacao.py),
+# poupando a consulta ao auth_user em cada requisição; 0 desliga. O
+# ModelBackend continua na lista para as sessões abertas antes, que guardam
+# o backend usado no login.
+AUTHENTICATION_BACKENDS = [
+    'core.autenticacao.BackendComCache',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USUARIO_CACHE_TIMEOUT = config('AUTH_USUARIO_CACHE_TIMEOUT', default=60, cast=int)
 
 
 # Password validation
@@ -132,7 +191,27 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 STATIC_ROOT = BASE_DIR / 'staticfiles' # O WhiteNoise usará esta pasta
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Bootstrap e Bootstrap Icons ficam em static/vendor (sem CDN), junto dos
+# scripts das páginas em static/core/js
+STATICFILES_DIRS = [BASE_DIR / 'static']
+# Estáticos com hash no nome e versões .gz/.br geradas no collectstatic (o
+# .br exige o pacote Brotli); o WhiteNoise os serve com cache "immutable"
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+# O manifest só existe depois do collectstatic (na Vercel ele vai junto da
+# função Python, ver vercel.json). Onde não houver collectstatic (CI,
+# máquinas de desenvolvimento com DEBUG=False), ESTATICOS_MANIFEST=False
+# usa os nomes sem hash; os testes sobrescrevem STORAGES (core.testes).
+if not config('ESTATICOS_MANIFEST', default=True, cast=bool):
+    STORAGES["staticfiles"] = {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    }
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # A Vercel já tem as variáveis, não precisa do load_dotenv para isso em produção.
@@ -140,12 +219,22 @@ SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
 SUPABASE_BUCKET_NAME = os.environ.get('SUPABASE_BUCKET_NAME')
 
-if SUPABASE_URL and SUPABASE_SERVICE_KEY and SUPABASE_BUCKET_NAME:
+# Qualquer serviço compatível com S3 pode substituir o Supabase (ex.: um MinIO
+# local em desenvolvimento e testes) definindo as variáveis AWS_* equivalentes.
+S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=f"{SUPABASE_URL}/storage/v1/s3" if SUPABASE_URL else '')
+S3_SECRET_KEY = config('AWS_SECRET_ACCESS_KEY', default=SUPABASE_SERVICE_KEY or '')
+S3_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default=SUPABASE_BUCKET_NAME or '')
+
+if S3_ENDPOINT_URL and S3_SECRET_KEY and S3_BUCKET_NAME:
     # O django-storages usa padrão S3, então mapeamos o Supabase como endpoint S3
-    AWS_ACCESS_KEY_ID = "supabase"  # valor dummy, Supabase ignora
-    AWS_SECRET_ACCESS_KEY = SUPABASE_SERVICE_KEY
-    AWS_STORAGE_BUCKET_NAME = SUPABASE_BUCKET_NAME
-    AWS_S3_ENDPOINT_URL = f"{SUPABASE_URL}/storage/v1/s3"
+    AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default="supabase")  # valor dummy, Supabase ignora
+    AWS_SECRET_ACCESS_KEY = S3_SECRET_KEY
+    AWS_STORAGE_BUCKET_NAME = S3_BUCKET_NAME
+    AWS_S3_ENDPOINT_URL = S3_ENDPOINT_URL
+    # URLs pré-assinadas (upload direto) precisam da região do projeto e de SigV4
+    AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default=None)
+    AWS_S3_SIGNATURE_VERSION = 's3v4'
+    AWS_S3_ADDRESSING_STYLE = 'path'
 
     # Ajustes para não sobrescrever arquivos e cache
     AWS_S3_FILE_OVERWRITE = False
@@ -155,17 +244,62 @@ if SUPABASE_URL and SUPABASE_SERVICE_KEY and SUPABASE_BUCKET_NAME:
         "CacheControl": "max-age=86400",
     }
 
-    STORAGES = {
-        "default": {
-            "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
-        },
-        "staticfiles": {
-            "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
-        },
+    STORAGES["default"] = {
+        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
     }
 
 
 
+# Upload direto: o navegador envia documentos e fotos direto para o bucket S3
+# com URLs pré-assinadas, sem passar pela função da Vercel. Só vale quando o
+# armazenamento padrão é S3; sem ele, os arquivos seguem no POST do formulário.
+# O bucket precisa aceitar PUT (CORS) vindo do domínio do sistema.
+UPLOAD_DIRETO = config('UPLOAD_DIRETO', default=True, cast=bool)
+UPLOAD_DIRETO_VALIDADE = config('UPLOAD_DIRETO_VALIDADE', default=15 * 60, cast=int)  # segundos
+UPLOAD_DIRETO_TAMANHO_MAXIMO = config('UPLOAD_DIRETO_TAMANHO_MAXIMO', default=20 * 1024 * 1024, cast=int)  # bytes
+
+
+# Fila de tarefas (core/tarefas.py): exportações e importações rodam fora da
+# requisição. Com um worker (manage.py processar_tarefas) a fila anda sozinha;
+# na Vercel, que não tem processo contínuo, o cron do vercel.json chama
+# /tarefas/processar/ com o CRON_SECRET e processa o que couber em
+# TAREFAS_CRON_SEGUNDOS. Tarefas em execução há mais de TAREFAS_TEMPO_LIMITE
+# minutos voltam para a fila.
+TAREFAS_CRON_SEGREDO = config('CRON_SECRET', default='')
+TAREFAS_CRON_SEGUNDOS = config('TAREFAS_CRON_SEGUNDOS', default=45, cast=int)
+TAREFAS_TEMPO_LIMITE = config('TAREFAS_TEMPO_LIMITE', default=30, cast=int)
+
+
+# Versões assíncronas das telas de leitura (core/views_async.py). Ligue só
+# quando o sistema for servido por ASGI (sistema_cadastro.asgi); na Vercel,
+# que usa o wsgi.py, elas não trazem ganho.
+VIEWS_ASYNC = config('VIEWS_ASYNC', default=False, cast=bool)
+# Consultas das views assíncronas em threads próprias, várias ao mesmo tempo.
+# Desligado, vão todas para a thread da requisição, uma de cada vez: é o que
+# os testes precisam (ver core.testes.ExecutorTestes).
+VIEWS_ASYNC_PARALELO = config('VIEWS_ASYNC_PARALELO', default=True, cast=bool)
+TEST_RUNNER = 'core.testes.ExecutorTestes'
+
+
+# Métricas por requisição (core.metricas): consultas, tempo no banco, tempo de
+# renderização e tamanho da resposta por view, em /dashboard/metricas/.
+# Consultas repetidas METRICAS_LIMIAR_REPETICAO vezes numa requisição são
+# registradas como possível N+1. O cabeçalho Server-Timing mostra a medição
+# no painel de rede do navegador.
+METRICAS = config('METRICAS', default=True, cast=bool)
+METRICAS_LIMIAR_REPETICAO = config('METRICAS_LIMIAR_REPETICAO', default=5, cast=int)
+METRICAS_INTERVALO = config('METRICAS_INTERVALO', default=30, cast=int)  # segundos entre gravações no cache
+METRICAS_SERVER_TIMING = config('METRICAS_SERVER_TIMING', default=DEBUG, cast=bool)
+
+
+# Orçamento da partida a frio (comando perfil_partida): tempo para importar o
+# WSGI, as URLs e os templates num processo novo, memória residente, e
+# módulos pesados que só podem ser importados no primeiro uso.
+PARTIDA_ORCAMENTO_MS = config('PARTIDA_ORCAMENTO_MS', default=1500, cast=int)
+PARTIDA_ORCAMENTO_MB = config('PARTIDA_ORCAMENTO_MB', default=90, cast=int)
+PARTIDA_MODULOS_ADIADOS = ['openpyxl', 'PIL', 'boto3', 'botocore']
+
+
 # Crispy Forms settings
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -0,0 +1,36 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('form-importacao');
+    if (form.dataset.atualizar) {
+        // Atualiza a lista até as importações na fila terminarem
+        setTimeout(function() { window.location.reload(); }, 5000);
+    }
+
+    // Com o upload direto, a planilha vai para o armazenamento sem passar
+    // pelo servidor (e sem o limite de tamanho do corpo da requisição)
+    form.addEventListener('submit', async function(event) {
+        const input = document.getElementById('arquivo-importacao');
+        if (!form.dataset.uploadUrl || form.dataset.enviado || !input.files.length) return;
+        event.preventDefault();
+        try {
+            const arquivo = input.files[0];
+            const dados = new FormData();
+            dados.append('destino', 'importacao');
+            dados.append('nome', arquivo.name);
+            dados.append('tipo', arquivo.type);
+            dados.append('tamanho', arquivo.size);
+            dados.append('csrfmiddlewaretoken', form.querySelector('[name=csrfmiddlewaretoken]').value);
+            const resposta = await fetch(form.dataset.uploadUrl, {method: 'POST', body: dados});
+            if (resposta.ok) {
+                const upload = await resposta.json();
+                const envio = await fetch(upload.url, {method: upload.metodo, headers: upload.cabecalhos, body: arquivo});
+                if (envio.ok) {
+                    form.querySelector('[name=upload_importacao]').value = upload.token;
+                    input.disabled = true;
+                }
+            }
+        } finally {
+            form.dataset.enviado = '1';
+            form.requestSubmit();
+        }
+    });
+});
@@ -0,0 +1,60 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // --- EXPORTAÇÃO EM SEGUNDO PLANO ---
+    // Solicita a exportação ao servidor e acompanha o progresso até o arquivo ficar pronto.
+    const exportarBtn = document.getElementById('exportar-btn');
+    const statusExportacao = document.getElementById('status-exportacao');
+
+    function acompanhar(tarefa) {
+        if (tarefa.status === 'concluida') {
+            statusExportacao.textContent = '';
+            exportarBtn.disabled = false;
+            window.location.href = tarefa.url_download;
+        } else if (tarefa.status === 'erro') {
+            statusExportacao.textContent = 'Falha ao gerar a planilha.';
+            exportarBtn.disabled = false;
+        } else {
+            statusExportacao.textContent = 'Gerando planilha... ' + tarefa.progresso + '%';
+            setTimeout(function() {
+                fetch(tarefa.url_status).then(r => r.json()).then(acompanhar);
+            }, 2000);
+        }
+    }
+
+    // --- AUTOCOMPLETAR DA BUSCA ---
+    const buscaInput = document.getElementById('busca-servidor');
+    const sugestoes = document.getElementById('sugestoes-busca');
+    let buscaTimer = null;
+    if (buscaInput) {
+        buscaInput.addEventListener('input', function() {
+            clearTimeout(buscaTimer);
+            const termo = buscaInput.value.trim();
+            if (termo.length < 2) {
+                sugestoes.innerHTML = '';
+                return;
+            }
+            buscaTimer = setTimeout(function() {
+                fetch(buscaInput.dataset.url + '?q=' + encodeURIComponent(termo))
+                    .then(r => r.json())
+                    .then(function(dados) {
+                        sugestoes.innerHTML = '';
+                        dados.resultados.forEach(function(item) {
+                            const link = document.createElement('a');
+                            link.href = item.url;
+                            link.className = 'list-group-item list-group-item-action';
+                            link.textContent = item.nome + (item.matricula ? ' — ' + item.matricula : '');
+                            sugestoes.appendChild(link);
+                        });
+                    });
+            }, 200);
+        });
+    }
+
+    if (exportarBtn) {
+        exportarBtn.addEventListener('click', function() {
+            exportarBtn.disabled = true;
+            fetch(exportarBtn.dataset.url, {method: 'POST', headers: {'X-CSRFToken': exportarBtn.dataset.csrf}})
+                .then(r => r.json())
+                .then(acompanhar);
+        });
+    }
+});
@@ -0,0 +1,166 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // --- LÓGICA PARA IMPEDIR CLIQUE DUPLO AO SALVAR ---
+    const mainForm = document.querySelector('form');
+    if (mainForm) {
+        mainForm.addEventListener('submit', function(event) {
+            if ((mainForm.dataset.uploadUrl || mainForm.dataset.uploadPartesUrl) && !mainForm.dataset.uploadsEnviados) {
+                // Envia os arquivos direto para o armazenamento antes do formulário
+                event.preventDefault();
+                enviarArquivosDireto(mainForm).finally(function() {
+                    mainForm.dataset.uploadsEnviados = '1';
+                    mainForm.requestSubmit();
+                });
+                return;
+            }
+            const submitButton = mainForm.querySelector('button[type="submit"]');
+            if (submitButton) {
+                submitButton.disabled = true;
+                submitButton.innerHTML = `
+                    <span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span>
+                    Salvando...
+                `;
+            }
+        });
+    }
+
+    // --- UPLOAD DIRETO PARA O ARMAZENAMENTO ---
+    // Cada arquivo é enviado com um PUT para uma URL pré-assinada; o formulário
+    // leva só o token devolvido pelo servidor. Se algo falhar, o arquivo
+    // continua no formulário e é enviado do jeito tradicional.
+    function csrfToken(form) {
+        return form.querySelector('[name=csrfmiddlewaretoken]').value;
+    }
+
+    async function enviarArquivoDireto(form, input, destino, campoToken) {
+        const arquivo = input.files[0];
+        const dados = new FormData();
+        dados.append('destino', destino);
+        dados.append('nome', arquivo.name);
+        dados.append('tipo', arquivo.type);
+        dados.append('tamanho', arquivo.size);
+        dados.append('csrfmiddlewaretoken', csrfToken(form));
+        const resposta = await fetch(form.dataset.uploadUrl, {method: 'POST', body: dados});
+        if (!resposta.ok) return;
+        const upload = await resposta.json();
+        const envio = await fetch(upload.url, {method: upload.metodo, headers: upload.cabecalhos, body: arquivo});
+        if (!envio.ok) return;
+        campoToken.value = upload.token;
+        input.disabled = true;  // o arquivo não vai de novo no POST
+    }
+
+    // --- UPLOAD DE DOCUMENTOS EM PARTES (sem armazenamento S3) ---
+    // O arquivo vai em partes, cada uma em sua requisição; se a conexão cair,
+    // só as partes que faltam são reenviadas. Para arquivos grandes o servidor
+    // manda um desafio (o hash de um trecho): se ele já tiver um arquivo com o
+    // mesmo SHA-256, a resposta certa dispensa o envio; senão, as partes vão.
+    const TAMANHO_MAXIMO_HASH = 64 * 1024 * 1024;
+
+    async function sha256(dados) {
+        const hash = await crypto.subtle.digest('SHA-256', await dados.arrayBuffer());
+        return Array.from(new Uint8Array(hash), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function postar(url, campos, form) {
+        const dados = new FormData();
+        Object.entries(campos).forEach(([chave, valor]) => dados.append(chave, valor));
+        dados.append('csrfmiddlewaretoken', csrfToken(form));
+        return fetch(url, {method: 'POST', body: dados});
+    }
+
+    async function enviarDocumentoEmPartes(form, input, campoToken) {
+        const arquivo = input.files[0];
+        const podeCalcularHash = window.crypto && crypto.subtle && arquivo.size <= TAMANHO_MAXIMO_HASH;
+        const hash = podeCalcularHash ? await sha256(arquivo) : '';
+        let resposta = await postar(form.dataset.uploadPartesUrl, {nome: arquivo.name, tamanho: arquivo.size, sha256: hash}, form);
+        if (!resposta.ok) return;
+        const upload = await resposta.json();
+
+        if (upload.desafio) {
+            const trecho = arquivo.slice(upload.desafio.inicio, upload.desafio.inicio + upload.desafio.tamanho);
+            resposta = await postar(upload.url + 'concluir/', {prova: await sha256(trecho)}, form);
+            if (resposta.ok) {
+                campoToken.value = (await resposta.json()).token;
+                input.disabled = true;
+                return;
+            }
+        }
+
+        for (let numero = 0; numero < upload.total_partes; numero++) {
+            if (upload.partes_recebidas.includes(numero)) continue;
+            const parte = arquivo.slice(numero * upload.tamanho_parte, (numero + 1) * upload.tamanho_parte);
+            const cabecalhos = {'X-CSRFToken': csrfToken(form)};
+            if (window.crypto && crypto.subtle) cabecalhos['X-Conteudo-Sha256'] = await sha256(parte);
+            let tentativas = 3;
+            while (tentativas--) {
+                const envio = await fetch(`${upload.url}partes/${numero}/`, {method: 'PUT', headers: cabecalhos, body: parte}).catch(() => null);
+                if (envio && envio.ok) break;
+                if (!tentativas) return;
+            }
+        }
+        resposta = await postar(upload.url + 'concluir/', {}, form);
+        if (!resposta.ok) return;
+        campoToken.value = (await resposta.json()).token;
+        input.disabled = true;
+    }
+
+    function enviarArquivosDireto(form) {
+        const envios = [];
+        const foto = form.querySelector('input[type=file][name=foto]');
+        if (form.dataset.uploadUrl && foto && foto.files.length) {
+            envios.push(enviarArquivoDireto(form, foto, 'foto', form.querySelector('[name=upload_foto]')));
+        }
+        form.querySelectorAll('.documento-row-new').forEach(function(linha) {
+            const input = linha.querySelector('input[type=file][name=arquivo_documento]');
+            if (!input || !input.files.length) return;
+            if (form.dataset.uploadUrl) {
+                envios.push(enviarArquivoDireto(form, input, 'documento', linha.querySelector('[name=upload_documento]')));
+            } else {
+                envios.push(enviarDocumentoEmPartes(form, input, linha.querySelector('[name=conteudo_documento]')));
+            }
+        });
+        return Promise.allSettled(envios);
+    }
+
+    // --- LÓGICA PARA ADICIONAR NOVOS DOCUMENTOS ---
+    const docContainer = document.getElementById('new-documentos-container');
+    const addDocButton = document.getElementById('add-documento-btn');
+    if (addDocButton) {
+        addDocButton.addEventListener('click', function() {
+            const newDocRow = document.createElement('div');
+            newDocRow.classList.add('row', 'align-items-center', 'mb-3', 'documento-row-new');
+            newDocRow.innerHTML = `
+                <div class="col-md-5"><label class="form-label">Nome do Novo Documento</label><input type="text" name="nome_documento" class="form-control" required></div>
+                <div class="col-md-5"><label class="form-label">Novo Arquivo</label><input type="file" name="arquivo_documento" class="form-control" required><input type="hidden" name="upload_documento" value=""><input type="hidden" name="conteudo_documento" value=""></div>
+                <div class="col-md-2 d-flex align-items-end"><button type="button" class="btn btn-outline-danger btn-sm remove-new-row-btn">Remover</button></div>
+            `;
+            docContainer.appendChild(newDocRow);
+        });
+    }
+
+    // --- LÓGICA PARA ADICIONAR NOVOS FILHOS ---
+    const filhosContainer = document.getElementById('new-filhos-container');
+    const addFilhoButton = document.getElementById('add-filho-btn');
+    if (addFilhoButton) {
+        addFilhoButton.addEventListener('click', function() {
+            const newFilhoRow = document.createElement('div');
+            newFilhoRow.classList.add('row', 'align-items-center', 'mb-2', 'filho-row-new');
+            newFilhoRow.innerHTML = `
+                <div class="col-md-6"><label class="form-label">Nome do Novo Filho</label><input type="text" name="nome_filho_novo" class="form-control" placeholder="Nome completo do filho"></div>
+                <div class="col-md-4"><label class="form-label">Data de Nascimento</label><input type="date" name="nascimento_filho_novo" class="form-control"></div>
+                <div class="col-md-2 d-flex align-items-end"><button type="button" class="btn btn-outline-danger btn-sm remove-new-row-btn">Remover</button></div>
+            `;
+            filhosContainer.appendChild(newFilhoRow);
+        });
+    }
+
+    // --- LÓGICA GERAL PARA REMOVER LINHAS DINÂMICAS ADICIONADAS ---
+    const formBody = document.querySelector('.card-body');
+    if (formBody) {
+        formBody.addEventListener('click', function(event) {
+            if (event.target && event.target.classList.contains('remove-new-row-btn')) {
+                // Encontra a linha pai (seja de documento ou de filho) e a remove
+                event.target.closest('.documento-row-new, .filho-row-new').remove();
+            }
+        });
+    }
+});